@@ -0,0 +1,387 @@
+"""
+Resident in-memory event catalog
+Events are parsed once into a compact columnar store and kept in memory; the
+CSV file is watched for changes and the catalog is rebuilt off the request
+path and swapped in atomically. Upserts and deletes from the delta log are
+spliced into a copy of the current version without re-reading the CSV.
+"""
+
+import csv
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .columnar import ColumnsSplice, EventColumns, EventColumnsBuilder, load_event_columns
+from .deltas import DeltaLog, compact_csv, resolve_deltas
+from .models import Event
+from .reloader import file_signature, FileSignature
+from .repository import EventRepository, RepositoryError
+from .serialization import EncodedEvents
+from .shared import read_manifest, read_records
+from .snapshot import SnapshotError, SnapshotFile, open_fresh_snapshot, read_events_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogUnavailableError(Exception):
+    """Raised when the catalog has never been loaded successfully"""
+
+
+def parse_event_row(row: dict) -> Event:
+    """Build an Event from one events.csv row"""
+    # Parse tags (semicolon separated)
+    tags = row['tags'].split(';') if row['tags'] else []
+
+    return Event(
+        event_id=row['event_id'],
+        title=row['title'],
+        description=row['description'],
+        category=row['category'],
+        tags=tags,
+        location=row['location'],
+        date=datetime.fromisoformat(row['date']),
+        price=float(row['price']),
+        organizer=row['organizer'],
+        capacity=int(row['capacity']) if row['capacity'] else None,
+        rating=float(row['rating']) if row['rating'] else None
+    )
+
+
+def event_to_row(event: Event) -> dict:
+    """The events.csv row of an Event, the inverse of parse_event_row"""
+    return {
+        'event_id': event.event_id,
+        'title': event.title,
+        'description': event.description,
+        'category': event.category,
+        'tags': ';'.join(event.tags),
+        'location': event.location,
+        # Aware dates keep their UTC offset
+        'date': event.date.isoformat(),
+        'price': str(event.price),
+        'organizer': event.organizer,
+        'capacity': '' if event.capacity is None else str(event.capacity),
+        'rating': '' if event.rating is None else str(event.rating),
+    }
+
+
+def splice_event_deltas(events: EventColumns, records: List[dict]) -> ColumnsSplice:
+    """Where every row of a catalog version goes once delta records are applied to it"""
+    plan = resolve_deltas(events.event_ids.tolist(), records)
+    builder = EventColumnsBuilder()
+    # Positions into events followed by the upserted rows
+    order = []
+    added = 0
+    for entry in plan:
+        if isinstance(entry, int):
+            order.append(entry)
+        else:
+            builder.append_row(entry)
+            order.append(len(events) + added)
+            added += 1
+    return ColumnsSplice(events, builder.build(), np.asarray(order, dtype=np.int64))
+
+
+def apply_event_deltas(events: EventColumns, encoded: Optional[EncodedEvents],
+                       records: List[dict]
+                       ) -> Tuple[EventColumns, Optional[EncodedEvents], ColumnsSplice]:
+    """
+    Copy-on-write splice of delta records into a catalog version: only the
+    upserted rows are parsed and encoded, every other row is copied as bytes.
+    Returns the new columns, the new payload when encoded was given, and the
+    splice, which lets derived indexes be patched rather than rebuilt.
+    """
+    splice = splice_event_deltas(events, records)
+    columns = splice.columns()
+    if encoded is not None:
+        encoded = encoded.concat(EncodedEvents(splice.upserted)).take(splice.order)
+        # Hashed here, before the version is published, rather than on a request
+        encoded.digest
+    return columns, encoded, splice
+
+
+def iter_events_csv(csv_file: str) -> Iterator[Event]:
+    """Lazily parse events from a CSV file, one row at a time"""
+    with open(csv_file, 'r', encoding='utf-8', newline='') as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield parse_event_row(row)
+
+
+def load_events_csv(csv_file: str) -> List[Event]:
+    """Parse the whole events CSV file into a list of Event objects"""
+    return list(iter_events_csv(csv_file))
+
+
+class CsvEventRepository(EventRepository):
+    """events.csv as the event backend"""
+
+    name = "csv"
+
+    def __init__(self, csv_file: str):
+        self.csv_file = csv_file
+        self.location = csv_file
+
+    def signature(self) -> Optional[FileSignature]:
+        return file_signature(self.csv_file)
+
+    def load_columns(self) -> EventColumns:
+        return load_event_columns(self.csv_file)
+
+    def compact(self, records: List[dict]):
+        compact_csv(self.csv_file, 'event_id', records)
+
+    def events_in_categories(self, categories: Iterable[str],
+                             limit: Optional[int] = None) -> List[Event]:
+        # A full scan: the catalog's category index is the fast path for this backend
+        wanted = {category.lower() for category in categories}
+        events = []
+        with open(self.csv_file, 'r', encoding='utf-8', newline='') as file:
+            for row in csv.DictReader(file):
+                if limit is not None and len(events) >= limit:
+                    break
+                if row['category'].lower() in wanted:
+                    events.append(parse_event_row(row))
+        return events
+
+
+class CatalogSnapshot:
+    """
+    One immutable version of the catalog.
+    Readers grab a reference to a snapshot and keep using it for the whole
+    request, so a concurrent reload can never hand them a half-built list.
+    """
+
+    __slots__ = ("events", "version", "signature", "loaded_at", "load_seconds", "source", "extras",
+                 "derived_from")
+
+    def __init__(self, events: EventColumns, version: int,
+                 signature: Optional[FileSignature], load_seconds: float,
+                 source: str = "csv"):
+        self.events = events
+        self.version = version
+        self.signature = signature
+        self.loaded_at = time.time()
+        self.load_seconds = load_seconds
+        # Where the data came from: "csv", "snapshot" or "shared"
+        self.source = source
+        # Data derived from this version by listeners, e.g. encoded payloads
+        self.extras: dict = {}
+        # (previous snapshot, splice) while listeners run on a version spliced
+        # from the previous one by deltas, so they can patch its derived data
+        self.derived_from: Optional[Tuple["CatalogSnapshot", ColumnsSplice]] = None
+
+
+class EventCatalog:
+    """
+    Holds the parsed events in memory and reloads them when the source file changes.
+    Events come from csv_file unless another repository is given.
+    """
+
+    def __init__(self, csv_file: Optional[str] = None, snapshot_file: Optional[str] = None,
+                 shared_dir: Optional[str] = None, delta_log: Optional[DeltaLog] = None,
+                 repository: Optional[EventRepository] = None):
+        self.repository = repository or CsvEventRepository(csv_file)
+        self.csv_file = csv_file
+        # Optional binary snapshot, used instead of the CSV while it is fresh
+        self.snapshot_file = snapshot_file
+        # Directory published by a SharedDataPublisher; when set, the catalog
+        # only attaches to published snapshots and never parses the CSV
+        self.shared_dir = shared_dir
+        # Published events snapshot the current version is mapped from
+        self._shared_events_path: Optional[str] = None
+        # Upserts and deletes not yet folded into the CSV, replayed on every full load
+        self.delta_log = delta_log
+        # Records applied in memory since the last load or compaction, in order
+        self._applied_deltas: List[dict] = []
+        self._snapshot: Optional[CatalogSnapshot] = None
+        # Serializes reloads; readers never take this lock
+        self._reload_lock = threading.Lock()
+        self._listeners: List[Callable[[CatalogSnapshot], None]] = []
+        self.reload_count = 0
+        self.reload_errors = 0
+        self.delta_batches = 0
+
+    def add_listener(self, listener: Callable[[CatalogSnapshot], None]):
+        """Register a callback run with every new snapshot before it is published"""
+        self._listeners.append(listener)
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    def get_snapshot(self) -> CatalogSnapshot:
+        """Return the current snapshot, loading synchronously only on first use"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.refresh()
+            snapshot = self._snapshot
+            if snapshot is None:
+                if self.shared_dir:
+                    raise CatalogUnavailableError(f"No catalog published in {self.shared_dir}")
+                raise CatalogUnavailableError(
+                    f"Events data {self.repository.location} not found")
+        return snapshot
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Rebuild the catalog if the source file changed since the last load.
+        Returns True when a new snapshot was published.
+        """
+        with self._reload_lock:
+            return self._refresh(force)
+
+    def _refresh(self, force: bool) -> bool:
+        if self.shared_dir:
+            manifest = read_manifest(self.shared_dir)
+            signature = manifest.signature if manifest is not None else None
+        else:
+            manifest = None
+            signature = self.repository.signature()
+        if signature is None:
+            # Keep serving the last good snapshot if the file disappears
+            return False
+
+        current = self._snapshot
+        if not force and current is not None and current.signature == signature:
+            return False
+        if not force and current is not None and manifest is not None and \
+                manifest.events_path == self._shared_events_path:
+            # A version that only changed the users or folded published deltas
+            self._adopt(manifest.version, signature)
+            return True
+
+        started = time.perf_counter()
+        encoded = None
+        records: List[dict] = []
+        derived_from = None
+        try:
+            if manifest is not None:
+                if current is not None and manifest.events_delta and \
+                        manifest.events_delta_base == current.version:
+                    # Spliced by the loader from the current version: indexes are patched
+                    splice = splice_event_deltas(current.events,
+                                                 read_records(manifest.events_delta))
+                    derived_from = (current, splice)
+                binary = SnapshotFile(manifest.events_path)
+                source = "shared"
+            else:
+                binary = open_fresh_snapshot(self.snapshot_file, self.csv_file, "events")
+                source = self.repository.name if binary is None else "snapshot"
+            if binary is not None:
+                events, encoded = read_events_snapshot(binary)
+            else:
+                events = self.repository.load_columns()
+            # Published versions already include the deltas folded by the loader
+            if self.delta_log is not None and manifest is None:
+                records = self.delta_log.read()
+                if records:
+                    events, encoded, _ = apply_event_deltas(events, encoded, records)
+        except (OSError, ValueError, KeyError, SnapshotError, RepositoryError) as exc:
+            # A partially written or malformed file must not replace good data
+            self.reload_errors += 1
+            logger.warning("Failed to reload events from %s: %s", self.repository.location, exc)
+            return False
+
+        if manifest is not None:
+            # Every worker uses the published version, so versions agree across processes
+            version = manifest.version
+            self._shared_events_path = manifest.events_path
+        else:
+            version = current.version + 1 if current is not None else 1
+        if derived_from is not None and len(derived_from[1]) != len(events):
+            derived_from = None
+        self._publish(events, encoded, version, signature, started, source, derived_from)
+        self._applied_deltas = records
+        if current is not None:
+            self.reload_count += 1
+        logger.info("Loaded %d events (version %d) from %s in %.3fs",
+                    len(events), version, source, self._snapshot.load_seconds)
+        return True
+
+    def _publish(self, events: EventColumns, encoded: Optional[EncodedEvents], version: int,
+                 signature: Optional[FileSignature], started: float, source: str,
+                 derived_from: Optional[Tuple[CatalogSnapshot, ColumnsSplice]] = None):
+        snapshot = CatalogSnapshot(events, version, signature,
+                                   time.perf_counter() - started, source)
+        if encoded is not None:
+            snapshot.extras["encoded_events"] = encoded
+        snapshot.derived_from = derived_from
+        for listener in self._listeners:
+            listener(snapshot)
+        # Dropped so the new version does not keep the previous one alive
+        snapshot.derived_from = None
+
+        # Publishing is a single reference assignment, which is atomic
+        self._snapshot = snapshot
+
+    def apply_deltas(self, records: List[dict]):
+        """
+        Publish a new version with a batch of delta records applied to the
+        current one. Readers keep using the old version until the swap.
+        """
+        self.get_snapshot()
+        with self._reload_lock:
+            current = self._snapshot
+            started = time.perf_counter()
+            events, encoded, splice = apply_event_deltas(
+                current.events, current.extras.get("encoded_events"), records)
+            self._publish(events, encoded, current.version + 1, current.signature,
+                          started, current.source, (current, splice))
+            self._applied_deltas.extend(records)
+            self.delta_batches += 1
+            logger.info("Applied %d event deltas (version %d, %d events) in %.3fs",
+                        len(records), current.version + 1, len(events),
+                        self._snapshot.load_seconds)
+
+    def compact_deltas(self, log: DeltaLog) -> int:
+        """
+        Fold the logged deltas into the CSV (or the repository's store) and
+        truncate the log. When the log held exactly the records applied in
+        memory, the rewritten data is adopted as the current version's source
+        instead of being loaded again. A log shared with other processes may
+        also hold their records, and then the rewritten data is loaded.
+        """
+        with self._reload_lock:
+            folded_records: List[dict] = []
+
+            def fold(records: List[dict]):
+                self.repository.compact(records)
+                folded_records.extend(records)
+
+            folded = log.compact(fold)
+            current = self._snapshot
+            if folded and current is not None:
+                if folded_records == self._applied_deltas:
+                    self._adopt(current.version, self.repository.signature())
+                    self._applied_deltas = []
+                else:
+                    self._refresh(force=True)
+            if folded:
+                logger.info("Compacted %d event deltas into %s", folded, self.repository.location)
+            return folded
+
+    def _adopt(self, version: int, signature: Optional[FileSignature]):
+        """Publish the current events and their derived data under a new version or signature"""
+        current = self._snapshot
+        adopted = CatalogSnapshot(current.events, version, signature,
+                                  current.load_seconds, current.source)
+        adopted.extras = current.extras
+        self._snapshot = adopted
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "loaded": snapshot is not None,
+            "version": snapshot.version if snapshot else 0,
+            "events": len(snapshot.events) if snapshot else 0,
+            "load_seconds": snapshot.load_seconds if snapshot else None,
+            "source": snapshot.source if snapshot else None,
+            "reload_count": self.reload_count,
+            "reload_errors": self.reload_errors,
+            "delta_batches": self.delta_batches,
+        }
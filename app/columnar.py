@@ -0,0 +1,484 @@
+"""
+Columnar event store
+The catalog is held as typed arrays instead of one pydantic Event per row:
+  - categories, locations, organizers and tags as interned integer codes
+  - dates as int64 UTC microseconds since the Unix epoch, plus the UTC offset
+    each date was given with, so aware dates come back as they were written
+  - price/capacity/rating as float64/int64 arrays with sentinels for missing values
+  - free text (event_id, title, description) as one UTF-8 blob plus offsets
+Event objects are only materialized for the rows that end up in a response.
+"""
+
+import csv
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .models import Event
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+# Sentinel for a missing capacity; missing ratings are stored as NaN
+NO_CAPACITY = -1
+# Offset of a naive date
+NO_OFFSET = np.iinfo(np.int32).min
+
+
+def datetime_to_micros(value: datetime) -> int:
+    """Microseconds since the epoch; aware datetimes are normalized to naive UTC"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // MICROSECOND
+
+
+def datetime_offset(value: datetime) -> int:
+    """UTC offset of value in seconds, NO_OFFSET for a naive datetime"""
+    offset = value.utcoffset()
+    if offset is None:
+        return NO_OFFSET
+    if offset.microseconds:
+        raise ValueError(f"UTC offset {offset} of {value.isoformat()} is not whole seconds")
+    return offset.days * 86400 + offset.seconds
+
+
+def micros_to_datetime(value: int, offset: int = NO_OFFSET) -> datetime:
+    """Inverse of datetime_to_micros, restoring the UTC offset given by datetime_offset"""
+    naive = EPOCH + timedelta(microseconds=int(value))
+    if offset == NO_OFFSET:
+        return naive
+    delta = timedelta(seconds=int(offset))
+    return (naive + delta).replace(tzinfo=timezone(delta))
+
+
+def contiguous_runs(positions: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Split positions into half-open [start, end) ranges of consecutive values,
+    e.g. [0, 1, 2, 7, 8, 4] -> [(0, 3), (7, 9), (4, 5)]. Lets a take() copy
+    whole slices instead of one row at a time.
+    """
+    if not len(positions):
+        return []
+    breaks = np.flatnonzero(np.diff(positions) != 1) + 1
+    firsts = np.concatenate(([0], breaks))
+    lasts = np.concatenate((breaks, [len(positions)])) - 1
+    return [(int(positions[first]), int(positions[last]) + 1)
+            for first, last in zip(firsts, lasts)]
+
+
+def insert_stable(order: np.ndarray, sorted_values: np.ndarray, positions: np.ndarray,
+                  values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Insert rows into a stable sort by bisection: order holds positions sorted
+    by (value, position) and sorted_values their values. Returns the same pair
+    with positions added, as np.argsort would order them with kind="stable".
+    """
+    # Rows sorted by (value, position), then placed after every kept row with
+    # a smaller value, or an equal value and a smaller position
+    ranked = np.lexsort((positions, values))
+    positions, values = positions[ranked], values[ranked]
+    low = np.searchsorted(sorted_values, values, side="left")
+    high = np.searchsorted(sorted_values, values, side="right")
+    slots = [start + int(np.searchsorted(order[start:end], position))
+             for start, end, position in zip(low.tolist(), high.tolist(), positions.tolist())]
+    return (np.insert(order, slots, positions).astype(np.int64),
+            np.insert(sorted_values, slots, values))
+
+
+def _take_ragged(values: np.ndarray, offsets: np.ndarray,
+                 positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows at positions of a ragged array stored as values plus n + 1 offsets"""
+    pieces = []
+    new_offsets = [np.zeros(1, dtype=np.int64)]
+    cursor = 0
+    for start, end in contiguous_runs(positions):
+        first, last = int(offsets[start]), int(offsets[end])
+        pieces.append(values[first:last])
+        new_offsets.append(offsets[start + 1:end + 1] - first + cursor)
+        cursor += last - first
+    return (np.concatenate(pieces) if pieces else values[:0],
+            np.concatenate(new_offsets).astype(np.int64))
+
+
+class StringColumn:
+    """
+    Variable-length strings stored as one UTF-8 blob plus n + 1 offsets.
+    The blob may be a larger buffer such as a memory-mapped file, in which
+    case base is where the strings start inside it.
+    """
+
+    __slots__ = ("blob", "offsets", "base")
+
+    def __init__(self, blob: bytes, offsets: np.ndarray, base: int = 0):
+        self.blob = blob
+        self.offsets = offsets
+        self.base = base
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position: int) -> str:
+        start = self.base + int(self.offsets[position])
+        end = self.base + int(self.offsets[position + 1])
+        return self.blob[start:end].decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for position in range(len(self)):
+            yield self[position]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.offsets[-1]) + self.offsets.nbytes
+
+    def tolist(self) -> List[str]:
+        """All strings, decoded in bulk"""
+        data = self.data()
+        bounds = self.offsets.tolist()
+        if data.isascii():
+            # Byte offsets are character offsets, so slice one decoded string
+            text = data.decode("ascii")
+            return [text[start:end] for start, end in zip(bounds, bounds[1:])]
+        return [data[start:end].decode("utf-8") for start, end in zip(bounds, bounds[1:])]
+
+    def data(self) -> bytes:
+        """The strings' bytes, without the surrounding buffer"""
+        return bytes(self.blob[self.base:self.base + int(self.offsets[-1])])
+
+    def take(self, positions: np.ndarray) -> "StringColumn":
+        """New column holding the strings at positions, in that order"""
+        pieces = []
+        offsets = [np.zeros(1, dtype=np.int64)]
+        cursor = 0
+        for start, end in contiguous_runs(positions):
+            first, last = int(self.offsets[start]), int(self.offsets[end])
+            pieces.append(self.blob[self.base + first:self.base + last])
+            offsets.append(self.offsets[start + 1:end + 1] - first + cursor)
+            cursor += last - first
+        return StringColumn(b"".join(pieces), np.concatenate(offsets).astype(np.int64))
+
+    def concat(self, other: "StringColumn") -> "StringColumn":
+        """New column holding these strings followed by other's"""
+        size = int(self.offsets[-1])
+        return StringColumn(self.data() + other.data(),
+                            np.concatenate((self.offsets, other.offsets[1:] + size)))
+
+
+class _StringColumnBuilder:
+    def __init__(self):
+        self.blob = bytearray()
+        self.offsets = [0]
+
+    def append(self, value: str):
+        self.blob += value.encode("utf-8")
+        self.offsets.append(len(self.blob))
+
+    def build(self) -> StringColumn:
+        return StringColumn(bytes(self.blob), np.asarray(self.offsets, dtype=np.int64))
+
+
+class _Interner:
+    """Assigns consecutive integer codes to distinct strings"""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class EventColumns:
+    """
+    Immutable columnar catalog.
+    Behaves like a read-only sequence of Event: len(), iteration and indexing
+    work, with indexing materializing a single Event on demand.
+    """
+
+    def __init__(self, event_ids: StringColumn, titles: StringColumn,
+                 descriptions: StringColumn,
+                 category_codes: np.ndarray, categories: List[str],
+                 location_codes: np.ndarray, locations: List[str],
+                 organizer_codes: np.ndarray, organizers: List[str],
+                 tag_codes: np.ndarray, tag_offsets: np.ndarray, tags: List[str],
+                 dates: np.ndarray, date_offsets: np.ndarray, prices: np.ndarray,
+                 capacities: np.ndarray, ratings: np.ndarray):
+        self.event_ids = event_ids
+        self.titles = titles
+        self.descriptions = descriptions
+        self.category_codes = category_codes
+        self.categories = categories
+        self.location_codes = location_codes
+        self.locations = locations
+        self.organizer_codes = organizer_codes
+        self.organizers = organizers
+        self.tag_codes = tag_codes
+        self.tag_offsets = tag_offsets
+        self.tags = tags
+        self.dates = dates
+        # UTC offset in seconds of every date, NO_OFFSET for naive dates
+        self.date_offsets = date_offsets
+        self.prices = prices
+        self.capacities = capacities
+        self.ratings = ratings
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __getitem__(self, position: int) -> Event:
+        return self.event_at(position)
+
+    def __iter__(self) -> Iterator[Event]:
+        for position in range(len(self)):
+            yield self.event_at(position)
+
+    def event_at(self, position: int) -> Event:
+        """Materialize the Event stored at position"""
+        position = int(position)
+        tag_start, tag_end = self.tag_offsets[position], self.tag_offsets[position + 1]
+        capacity = int(self.capacities[position])
+        rating = float(self.ratings[position])
+        # Values were validated when the columns were built
+        return Event.model_construct(
+            event_id=self.event_ids[position],
+            title=self.titles[position],
+            description=self.descriptions[position],
+            category=self.categories[self.category_codes[position]],
+            tags=[self.tags[code] for code in self.tag_codes[tag_start:tag_end]],
+            location=self.locations[self.location_codes[position]],
+            date=micros_to_datetime(self.dates[position], self.date_offsets[position]),
+            price=float(self.prices[position]),
+            organizer=self.organizers[self.organizer_codes[position]],
+            capacity=None if capacity == NO_CAPACITY else capacity,
+            rating=None if rating != rating else rating
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the column buffers (vocabularies excluded)"""
+        arrays = (self.category_codes, self.location_codes, self.organizer_codes,
+                  self.tag_codes, self.tag_offsets, self.dates, self.date_offsets, self.prices,
+                  self.capacities, self.ratings)
+        return (sum(array.nbytes for array in arrays) + self.event_ids.nbytes
+                + self.titles.nbytes + self.descriptions.nbytes)
+
+    def take(self, positions: Sequence[int]) -> "EventColumns":
+        """
+        New catalog holding the rows at positions, in that order.
+        Vocabularies are shared; runs of consecutive rows are copied as slices.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        tag_codes, tag_offsets = _take_ragged(self.tag_codes, self.tag_offsets, positions)
+        return EventColumns(
+            event_ids=self.event_ids.take(positions),
+            titles=self.titles.take(positions),
+            descriptions=self.descriptions.take(positions),
+            category_codes=self.category_codes[positions], categories=self.categories,
+            location_codes=self.location_codes[positions], locations=self.locations,
+            organizer_codes=self.organizer_codes[positions], organizers=self.organizers,
+            tag_codes=tag_codes, tag_offsets=tag_offsets, tags=self.tags,
+            dates=self.dates[positions], date_offsets=self.date_offsets[positions],
+            prices=self.prices[positions],
+            capacities=self.capacities[positions], ratings=self.ratings[positions],
+        )
+
+    def concat(self, other: "EventColumns") -> "EventColumns":
+        """New catalog holding these rows followed by other's, with merged vocabularies"""
+        categories, category_codes = _merge_vocabulary(
+            self.categories, self.category_codes, other.categories, other.category_codes)
+        locations, location_codes = _merge_vocabulary(
+            self.locations, self.location_codes, other.locations, other.location_codes)
+        organizers, organizer_codes = _merge_vocabulary(
+            self.organizers, self.organizer_codes, other.organizers, other.organizer_codes)
+        tags, tag_codes = _merge_vocabulary(self.tags, self.tag_codes, other.tags, other.tag_codes)
+        return EventColumns(
+            event_ids=self.event_ids.concat(other.event_ids),
+            titles=self.titles.concat(other.titles),
+            descriptions=self.descriptions.concat(other.descriptions),
+            category_codes=category_codes, categories=categories,
+            location_codes=location_codes, locations=locations,
+            organizer_codes=organizer_codes, organizers=organizers,
+            tag_codes=tag_codes,
+            tag_offsets=np.concatenate((self.tag_offsets,
+                                        other.tag_offsets[1:] + len(self.tag_codes))),
+            tags=tags,
+            dates=np.concatenate((self.dates, other.dates)),
+            date_offsets=np.concatenate((self.date_offsets, other.date_offsets)),
+            prices=np.concatenate((self.prices, other.prices)),
+            capacities=np.concatenate((self.capacities, other.capacities)),
+            ratings=np.concatenate((self.ratings, other.ratings)),
+        )
+
+    @classmethod
+    def from_events(cls, events: Iterable[Event]) -> "EventColumns":
+        builder = EventColumnsBuilder()
+        for event in events:
+            builder.append_event(event)
+        return builder.build()
+
+
+def _merge_vocabulary(values: List[str], codes: np.ndarray, other_values: List[str],
+                      other_codes: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    """Append other's codes re-interned into values; returns (vocabulary, codes)"""
+    interner = _Interner()
+    for value in values:
+        interner.code(value)
+    remap = np.asarray([interner.code(value) for value in other_values], dtype=codes.dtype)
+    merged = np.concatenate((codes, remap[other_codes] if len(other_codes) else other_codes))
+    return interner.values, merged.astype(codes.dtype)
+
+
+class ColumnsSplice:
+    """
+    How a catalog version was spliced from the previous one by delta records:
+    the new rows are base.concat(upserted).take(order). Indexes derived from
+    base are patched with it instead of being rebuilt over every row.
+    """
+
+    def __init__(self, base: EventColumns, upserted: EventColumns, order: np.ndarray):
+        self.base = base
+        self.upserted = upserted
+        self.order = np.asarray(order, dtype=np.int64)
+        # New position of every row of base.concat(upserted), -1 for dropped rows
+        self.new_positions = np.full(len(base) + len(upserted), -1, dtype=np.int64)
+        self.new_positions[self.order] = np.arange(len(self.order), dtype=np.int64)
+        # Ascending new positions of the upserted rows. Kept base rows stay in
+        # their relative order, so mapping an ascending list keeps it ascending.
+        self.added = np.flatnonzero(self.order >= len(base))
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def columns(self) -> EventColumns:
+        """The spliced catalog"""
+        return self.base.concat(self.upserted).take(self.order)
+
+    def patch_groups(self, groups: Dict[str, np.ndarray],
+                     added_keys: Sequence[Iterable[str]]) -> Dict[str, np.ndarray]:
+        """
+        Ascending positions by key, e.g. events by category, for the new rows
+        given those of base. added_keys[i] holds the keys of the i-th row of
+        self.added.
+        """
+        additions: Dict[str, List[int]] = {}
+        for position, keys in zip(self.added.tolist(), added_keys):
+            for key in keys:
+                additions.setdefault(key, []).append(position)
+        patched = {}
+        for key, positions in groups.items():
+            moved = self.new_positions[positions]
+            patched[key] = moved[moved >= 0]
+        for key, positions in additions.items():
+            kept = patched.get(key, np.zeros(0, dtype=np.int64))
+            positions = np.asarray(positions, dtype=np.int64)
+            patched[key] = np.insert(kept, np.searchsorted(kept, positions), positions)
+        return {key: positions for key, positions in patched.items() if len(positions)}
+
+    def patch_order(self, order: np.ndarray, sorted_values: np.ndarray,
+                    values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (stable argsort of values, values in that order) for the new rows,
+        given the same pair for base: identical to np.argsort(values,
+        kind="stable"), but only the upserted rows are placed by bisection.
+        """
+        moved = self.new_positions[order]
+        kept = moved >= 0
+        return insert_stable(moved[kept], sorted_values[kept], self.added, values[self.added])
+
+
+class EventColumnsBuilder:
+    """Accumulates rows and produces an EventColumns"""
+
+    def __init__(self):
+        self._event_ids = _StringColumnBuilder()
+        self._titles = _StringColumnBuilder()
+        self._descriptions = _StringColumnBuilder()
+        self._categories = _Interner()
+        self._locations = _Interner()
+        self._organizers = _Interner()
+        self._tags = _Interner()
+        self._category_codes: List[int] = []
+        self._location_codes: List[int] = []
+        self._organizer_codes: List[int] = []
+        self._tag_codes: List[int] = []
+        self._tag_offsets: List[int] = [0]
+        self._dates: List[int] = []
+        self._date_offsets: List[int] = []
+        self._prices: List[float] = []
+        self._capacities: List[int] = []
+        self._ratings: List[float] = []
+
+    def append(self, event_id: str, title: str, description: str, category: str,
+               tags: List[str], location: str, date: datetime, price: float,
+               organizer: str, capacity: Optional[int], rating: Optional[float]):
+        if rating is not None and not 0 <= rating <= 5:
+            raise ValueError(f"Event {event_id} rating {rating} is outside 0-5")
+
+        self._event_ids.append(event_id)
+        self._titles.append(title)
+        self._descriptions.append(description)
+        self._category_codes.append(self._categories.code(category))
+        self._location_codes.append(self._locations.code(location))
+        self._organizer_codes.append(self._organizers.code(organizer))
+        self._tag_codes.extend(self._tags.code(tag) for tag in tags)
+        self._tag_offsets.append(len(self._tag_codes))
+        self._dates.append(datetime_to_micros(date))
+        self._date_offsets.append(datetime_offset(date))
+        self._prices.append(price)
+        self._capacities.append(NO_CAPACITY if capacity is None else capacity)
+        self._ratings.append(float("nan") if rating is None else rating)
+
+    def append_event(self, event: Event):
+        self.append(event.event_id, event.title, event.description, event.category,
+                    event.tags, event.location, event.date, event.price,
+                    event.organizer, event.capacity, event.rating)
+
+    def append_row(self, row: dict):
+        """Append one events.csv row, with the same conversions as parse_event_row"""
+        self.append(
+            event_id=row['event_id'],
+            title=row['title'],
+            description=row['description'],
+            category=row['category'],
+            tags=row['tags'].split(';') if row['tags'] else [],
+            location=row['location'],
+            date=datetime.fromisoformat(row['date']),
+            price=float(row['price']),
+            organizer=row['organizer'],
+            capacity=int(row['capacity']) if row['capacity'] else None,
+            rating=float(row['rating']) if row['rating'] else None
+        )
+
+    def build(self) -> EventColumns:
+        return EventColumns(
+            event_ids=self._event_ids.build(),
+            titles=self._titles.build(),
+            descriptions=self._descriptions.build(),
+            category_codes=np.asarray(self._category_codes, dtype=np.int32),
+            categories=self._categories.values,
+            location_codes=np.asarray(self._location_codes, dtype=np.int32),
+            locations=self._locations.values,
+            organizer_codes=np.asarray(self._organizer_codes, dtype=np.int32),
+            organizers=self._organizers.values,
+            tag_codes=np.asarray(self._tag_codes, dtype=np.int32),
+            tag_offsets=np.asarray(self._tag_offsets, dtype=np.int64),
+            tags=self._tags.values,
+            dates=np.asarray(self._dates, dtype=np.int64),
+            date_offsets=np.asarray(self._date_offsets, dtype=np.int32),
+            prices=np.asarray(self._prices, dtype=np.float64),
+            capacities=np.asarray(self._capacities, dtype=np.int64),
+            ratings=np.asarray(self._ratings, dtype=np.float64),
+        )
+
+
+def load_event_columns(csv_file: str) -> EventColumns:
+    """Parse events.csv straight into columns, without building Event objects"""
+    builder = EventColumnsBuilder()
+    with open(csv_file, 'r', encoding='utf-8', newline='') as file:
+        for row in csv.DictReader(file):
+            builder.append_row(row)
+    return builder.build()
@@ -0,0 +1,55 @@
+"""
+Concurrency helpers
+Blocking or CPU-heavy work is run on a bounded thread pool so it never stalls
+the asyncio event loop, and identical concurrent computations are coalesced.
+"""
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import Executor
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+async def run_blocking(executor: Executor, func: Callable[..., T], *args, **kwargs) -> T:
+    """Run func(*args, **kwargs) on executor and await its result"""
+    loop = asyncio.get_running_loop()
+    # Like asyncio.to_thread, carry context variables (e.g. request timings) into the worker
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        executor, functools.partial(context.run, func, *args, **kwargs)
+    )
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one computation.
+    The first caller starts the work; callers arriving while it is running
+    await the same result instead of starting their own.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.started = 0
+        self.shared = 0
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            self.started += 1
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.shared += 1
+        # Shielded so one cancelled caller does not cancel the others' result
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "started": self.started,
+            "shared": self.shared,
+        }
@@ -5,16 +5,54 @@ Supports environment variables for containerized deployments
 
 import os
 
+# Data backend: "csv" (the CSV files below) or "sqlite" (the database at SQLITE_PATH)
+DATA_BACKEND = os.getenv("DATA_BACKEND", "csv")
+# SQLite database filled by import_sqlite.py, and the connections pooled for the worker threads
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/recsys.db")
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+
 # Data file paths - can be overridden with environment variables
 EVENTS_CSV_PATH = os.getenv("EVENTS_CSV_PATH", "data/events.csv")
 USERS_CSV_PATH = os.getenv("USERS_CSV_PATH", "data/users.csv")
 
+# Binary snapshots compiled by build_snapshot.py; used instead of the CSVs while fresh
+EVENTS_SNAPSHOT_PATH = os.getenv("EVENTS_SNAPSHOT_PATH", "data/events.snapshot")
+USERS_SNAPSHOT_PATH = os.getenv("USERS_SNAPSHOT_PATH", "data/users.snapshot")
+
+# Directory where a single loader process publishes snapshots for multi-worker serving.
+# When set, the server only attaches to published data and never parses the CSVs.
+SHARED_CATALOG_DIR = os.getenv("SHARED_CATALOG_DIR") or None
+
+# How often (seconds) data files are checked for changes; 0 disables hot reload
+DATA_RELOAD_INTERVAL = float(os.getenv("DATA_RELOAD_INTERVAL", "2.0"))
+
+# Append-only logs of the upserts and deletes received by the /admin endpoints
+EVENTS_DELTA_PATH = os.getenv("EVENTS_DELTA_PATH", "data/events.delta.jsonl")
+USERS_DELTA_PATH = os.getenv("USERS_DELTA_PATH", "data/users.delta.jsonl")
+# How often (seconds) accepted deltas are applied in one batch; 0 applies them on arrival
+DELTA_APPLY_INTERVAL = float(os.getenv("DELTA_APPLY_INTERVAL", "1.0"))
+# How often (seconds) the delta logs are folded back into the CSVs; 0 disables compaction
+DELTA_COMPACT_INTERVAL = float(os.getenv("DELTA_COMPACT_INTERVAL", "300"))
+# Append-only log of the ratings received by POST /ratings
+RATINGS_LOG_PATH = os.getenv("RATINGS_LOG_PATH", "data/ratings.jsonl")
+# Ratings held in memory before a flush; requests beyond it are rejected with 503
+RATINGS_QUEUE_SIZE = int(os.getenv("RATINGS_QUEUE_SIZE", "100000"))
+# How often (seconds) queued ratings are written to the log and aggregated
+RATINGS_FLUSH_INTERVAL = float(os.getenv("RATINGS_FLUSH_INTERVAL", "0.5"))
+# Token required in the X-Admin-Token header of /admin endpoints; unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
+# User store mode: "memory" keeps parsed users, "offset" keeps only byte offsets into the CSV
+USER_STORE_MODE = os.getenv("USER_STORE_MODE", "memory")
+
 # API Configuration - Docker-friendly defaults
 API_TITLE = os.getenv("API_TITLE", "Events Recommendation System")
 API_DESCRIPTION = os.getenv("API_DESCRIPTION", "A content-based recommendation system for user-event matching")
 API_VERSION = os.getenv("API_VERSION", "1.0.0")
 API_HOST = os.getenv("API_HOST", "0.0.0.0")  # 0.0.0.0 for Docker
 API_PORT = int(os.getenv("API_PORT", "8000"))
+# Worker processes for the production entry point (python run.py --production)
+API_WORKERS = int(os.getenv("API_WORKERS", str(os.cpu_count() or 1)))
 
 # CORS Configuration - can be restricted in production
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",") if os.getenv("CORS_ORIGINS") != "*" else ["*"]
@@ -24,6 +62,32 @@ CORS_ALLOW_HEADERS = ["*"]
 
 # Recommendation settings
 DEFAULT_RECOMMENDATION_LIMIT = int(os.getenv("DEFAULT_RECOMMENDATION_LIMIT", "10"))
+MAX_BATCH_USERS = int(os.getenv("MAX_BATCH_USERS", "50000"))
+# Whether event listings and recommendations skip events that already took place,
+# unless a request sets upcoming_only explicitly
+EXCLUDE_PAST_EVENTS = os.getenv("EXCLUDE_PAST_EVENTS", "false").lower() == "true"
+# Scoring mode: "category" (exact category match) or "tfidf" (tag/description similarity)
+SCORING_MODE = os.getenv("SCORING_MODE", "category")
+
+# Store of precomputed recommendations written by materialize.py; empty disables it
+MATERIALIZED_PATH = os.getenv("MATERIALIZED_PATH", "data/recommendations.snapshot") or None
+# Recommendations stored per user; requests with a larger limit are scored live
+MATERIALIZE_LIMIT = int(os.getenv("MATERIALIZE_LIMIT", "20"))
+# How often (seconds) the store is rebuilt when its inputs changed; 0 leaves it to the CLI
+MATERIALIZE_INTERVAL = float(os.getenv("MATERIALIZE_INTERVAL", "0"))
+# Worker processes of the materialization job and users scored per task
+MATERIALIZE_WORKERS = int(os.getenv("MATERIALIZE_WORKERS", str(os.cpu_count() or 1)))
+MATERIALIZE_CHUNK_SIZE = int(os.getenv("MATERIALIZE_CHUNK_SIZE", "2000"))
+
+# Size of the thread pool that runs scoring and data loading off the event loop
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "8"))
+
+# Recommendation result cache; a max size of 0 disables it
+RECOMMENDATION_CACHE_MAX_SIZE = int(os.getenv("RECOMMENDATION_CACHE_MAX_SIZE", "10000"))
+RECOMMENDATION_CACHE_TTL = float(os.getenv("RECOMMENDATION_CACHE_TTL", "300"))
+
+# Per-stage latency histograms and Server-Timing headers; /metrics is always served
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
 
 # Environment info
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
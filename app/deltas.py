@@ -0,0 +1,260 @@
+"""
+Incremental delta ingestion
+Upstream changes arrive as upsert/delete records instead of a new CSV. Every
+record is first appended to a JSONL delta log next to the CSV, so it survives
+restarts, and then applied to the in-memory data in batches. A periodic
+compaction folds the log back into the CSV and truncates it.
+
+A record looks like
+    {"op": "upsert", "id": "event_9", "row": {...one CSV row...}}
+    {"op": "delete", "id": "event_9"}
+
+Ordering rules, shared by the in-memory catalog and by compaction so both
+always agree: an upsert of an existing row replaces it in place, an upsert of
+a new id is appended at the end, a delete removes the row.
+"""
+
+import csv
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# A compaction planned row: a base row position or the row of an upsert
+PlannedRow = Union[int, dict]
+
+
+def upsert_record(record_id: str, row: dict) -> dict:
+    return {"op": "upsert", "id": record_id, "row": row}
+
+
+def delete_record(record_id: str) -> dict:
+    return {"op": "delete", "id": record_id}
+
+
+def resolve_deltas(base_ids: Sequence[str], records: List[dict]) -> List[PlannedRow]:
+    """
+    Apply records in order to rows identified by base_ids. Returns the final
+    rows: the position of every kept base row or the row of an upsert.
+    Only the first occurrence of a duplicated base id is affected.
+    """
+    touched = {record["id"] for record in records}
+    live: Dict[str, Tuple[str, int]] = {}
+    for position, row_id in enumerate(base_ids):
+        if row_id in touched and row_id not in live:
+            live[row_id] = ("base", position)
+
+    # Base positions replaced by a row (or removed, None), and rows appended at the end
+    replaced: Dict[int, Optional[dict]] = {}
+    appended: List[Optional[dict]] = []
+    for record in records:
+        slot = live.get(record["id"])
+        if record["op"] == "upsert":
+            if slot is None:
+                live[record["id"]] = ("new", len(appended))
+                appended.append(record["row"])
+            elif slot[0] == "base":
+                replaced[slot[1]] = record["row"]
+            else:
+                appended[slot[1]] = record["row"]
+        elif slot is not None:
+            if slot[0] == "base":
+                replaced[slot[1]] = None
+            else:
+                appended[slot[1]] = None
+            del live[record["id"]]
+
+    plan: List[PlannedRow] = []
+    kept_from = 0
+    for position in sorted(replaced):
+        plan.extend(range(kept_from, position))
+        if replaced[position] is not None:
+            plan.append(replaced[position])
+        kept_from = position + 1
+    plan.extend(range(kept_from, len(base_ids)))
+    plan.extend(row for row in appended if row is not None)
+    return plan
+
+
+def compact_csv(csv_file: str, id_field: str, records: List[dict]):
+    """Rewrite csv_file with records applied, replacing it atomically"""
+    with open(csv_file, "r", encoding="utf-8", newline="") as file:
+        reader = csv.DictReader(file)
+        fieldnames = reader.fieldnames or []
+        rows = list(reader)
+
+    plan = resolve_deltas([row[id_field] for row in rows], records)
+    directory = os.path.dirname(os.path.abspath(csv_file))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".compact-", suffix=".csv")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction="ignore",
+                                    lineterminator="\n")
+            writer.writeheader()
+            for entry in plan:
+                writer.writerow(rows[entry] if isinstance(entry, int) else entry)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, csv_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class DeltaLog:
+    """
+    Append-only JSONL file of delta records. Appends and compactions hold an
+    exclusive flock, so several processes may write to the same log.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @contextmanager
+    def _locked(self, mode: str, lock: int) -> Iterator:
+        with open(self.path, mode, encoding="utf-8") as file:
+            fcntl.flock(file.fileno(), lock)
+            try:
+                yield file
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+    def append(self, records: List[dict]):
+        if not records:
+            return
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._locked("a", fcntl.LOCK_EX) as file:
+            file.write(data)
+            file.flush()
+
+    def read(self) -> List[dict]:
+        """All records in the log, oldest first"""
+        try:
+            with self._locked("r", fcntl.LOCK_SH) as file:
+                return self._parse(file)
+        except FileNotFoundError:
+            return []
+
+    def _parse(self, file) -> List[dict]:
+        records = []
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # Only a torn last line can be malformed; it was never acknowledged
+                logger.warning("Skipping malformed line %d of %s", number, self.path)
+        return records
+
+    def compact(self, fold: Callable[[List[dict]], None]) -> int:
+        """
+        Pass every logged record to fold, e.g. to rewrite the base CSV, then
+        truncate the log. Appends wait meanwhile, so none can be lost.
+        Returns the number of records folded.
+        """
+        if not os.path.exists(self.path):
+            return 0
+        with self._locked("r+", fcntl.LOCK_EX) as file:
+            records = self._parse(file)
+            if records:
+                fold(records)
+            file.seek(0)
+            file.truncate()
+        return len(records)
+
+
+class DeltaBatcher:
+    """
+    Accepted delta records, logged and then applied in batches, so a burst of
+    writes costs one copy-on-write rebuild instead of one per record. Has the
+    same refresh() contract as the data sources and is driven by a
+    BackgroundReloader, which also runs the periodic compaction.
+    """
+
+    def __init__(self, log: DeltaLog, apply: Callable[[List[dict]], None],
+                 compact: Optional[Callable[[DeltaLog], int]] = None,
+                 compact_interval: float = 0.0):
+        self.log = log
+        self._apply = apply
+        self._compact = compact
+        self.compact_interval = compact_interval
+        self._pending: List[dict] = []
+        # Held while logging a submission; compaction holds it too, so every
+        # record it folds into the base data has already been applied in memory
+        self._lock = threading.Lock()
+        # Serializes batches with each other
+        self._apply_lock = threading.Lock()
+        self._last_compaction = time.monotonic()
+        self.applied_records = 0
+        self.applied_batches = 0
+        self.compactions = 0
+
+    def submit(self, records: List[dict]):
+        """Durably log records and queue them for the next batch"""
+        with self._lock:
+            self.log.append(records)
+            self._pending.extend(records)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Apply every pending record; returns True when a batch was applied"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        applied = self._apply_batch(batch)
+
+        if self._compact is not None and self.compact_interval > 0 and \
+                time.monotonic() - self._last_compaction >= self.compact_interval:
+            self.compact()
+        return applied
+
+    def _apply_batch(self, batch: List[dict]) -> bool:
+        if not batch:
+            return False
+        with self._apply_lock:
+            try:
+                self._apply(batch)
+            except Exception:
+                # The records stay logged and are replayed by the next full reload
+                logger.exception("Failed to apply %d delta records", len(batch))
+                raise
+            self.applied_records += len(batch)
+            self.applied_batches += 1
+        return True
+
+    def compact(self) -> int:
+        """Apply pending records and fold the log into the base data now"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._apply_batch(batch)
+            self._last_compaction = time.monotonic()
+            if self._compact is None:
+                return 0
+            with self._apply_lock:
+                folded = self._compact(self.log)
+            if folded:
+                self.compactions += 1
+            return folded
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "applied_records": self.applied_records,
+            "applied_batches": self.applied_batches,
+            "compactions": self.compactions,
+        }
@@ -0,0 +1,187 @@
+"""
+Server-side event filters
+Filters that clients used to apply on their side. A FilterIndex built once per
+catalog version answers them from precomputed indexes, so the cost of a
+filtered request scales with the number of matching events.
+"""
+
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .columnar import ColumnsSplice, EventColumns, datetime_to_micros
+
+EMPTY_POSITIONS = np.zeros(0, dtype=np.int64)
+
+
+def location_keys(location: str) -> Set[str]:
+    """
+    Normalized keys a location can be matched by: the full location and
+    its city, e.g. "San Francisco, CA" -> {"san francisco, ca", "san francisco"}
+    """
+    full = location.strip().lower()
+    return {full, full.split(",", 1)[0].strip()}
+
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Aware datetimes are compared as naive UTC, like the catalog's dates"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class EventFilters:
+    """A conjunction of optional filters on events"""
+
+    def __init__(self, category: Optional[str] = None, location: Optional[str] = None,
+                 date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                 max_price: Optional[float] = None, free_only: bool = False,
+                 min_rating: Optional[float] = None):
+        self.category = category.lower() if category else None
+        self.location = location.strip().lower() if location else None
+        self.date_from = naive_utc(date_from)
+        self.date_to = naive_utc(date_to)
+        # Free events are those with a price of 0
+        if free_only:
+            max_price = 0.0 if max_price is None else min(max_price, 0.0)
+        self.max_price = max_price
+        self.min_rating = min_rating
+
+    @property
+    def active(self) -> bool:
+        return any(value is not None for value in self.key())
+
+    def key(self) -> Tuple:
+        """Hashable normalized form, used in cache keys and ETags"""
+        return (self.category, self.location, self.date_from, self.date_to,
+                self.max_price, self.min_rating)
+
+
+def _group_positions(codes: np.ndarray, size: int) -> List[np.ndarray]:
+    """Ascending positions of every code in 0..size-1"""
+    order = np.argsort(codes, kind="stable")
+    counts = np.bincount(codes, minlength=size)
+    ends = np.cumsum(counts)
+    return [order[end - count:end] for count, end in zip(counts, ends)]
+
+
+class FilterIndex:
+    """
+    Per-catalog-version indexes for EventFilters:
+      - category and location hash indexes to ascending positions
+      - positions sorted by date, price and rating, searched with bisection
+    A query starts from the most selective filter and checks the others on
+    that candidate set only.
+    Given the index of the catalog columns were spliced from, only the
+    upserted events are placed in each index.
+    """
+
+    def __init__(self, columns: EventColumns, base: Optional["FilterIndex"] = None,
+                 splice: Optional[ColumnsSplice] = None):
+        self.columns = columns
+
+        self.category_codes: Dict[str, List[int]] = {}
+        for code, category in enumerate(columns.categories):
+            self.category_codes.setdefault(category.lower(), []).append(code)
+        self.location_codes: Dict[str, List[int]] = {}
+        for code, location in enumerate(columns.locations):
+            for key in location_keys(location):
+                self.location_codes.setdefault(key, []).append(code)
+
+        if base is not None:
+            added = splice.added.tolist()
+            self.category_positions = splice.patch_groups(
+                base.category_positions,
+                [[columns.categories[code].lower()]
+                 for code in columns.category_codes[added].tolist()])
+            self.location_positions = splice.patch_groups(
+                base.location_positions,
+                [location_keys(columns.locations[code])
+                 for code in columns.location_codes[added].tolist()])
+            self.date_order, self.sorted_dates = splice.patch_order(
+                base.date_order, base.sorted_dates, columns.dates)
+            self.price_order, self.sorted_prices = splice.patch_order(
+                base.price_order, base.sorted_prices, columns.prices)
+            self.rating_order, self.sorted_ratings = splice.patch_order(
+                base.rating_order, base.sorted_ratings, columns.ratings)
+        else:
+            by_category = _group_positions(columns.category_codes, len(columns.categories))
+            self.category_positions = {
+                key: self._merge([by_category[code] for code in codes])
+                for key, codes in self.category_codes.items()
+            }
+            by_location = _group_positions(columns.location_codes, len(columns.locations))
+            self.location_positions = {
+                key: self._merge([by_location[code] for code in codes])
+                for key, codes in self.location_codes.items()
+            }
+
+            self.date_order = np.argsort(columns.dates, kind="stable")
+            self.sorted_dates = columns.dates[self.date_order]
+            self.price_order = np.argsort(columns.prices, kind="stable")
+            self.sorted_prices = columns.prices[self.price_order]
+            # NaN ratings sort last and are excluded from every rating range
+            self.rating_order = np.argsort(columns.ratings, kind="stable")
+            self.sorted_ratings = columns.ratings[self.rating_order]
+        self.rated = int(np.count_nonzero(~np.isnan(columns.ratings)))
+
+    @staticmethod
+    def _merge(groups: List[np.ndarray]) -> np.ndarray:
+        if len(groups) == 1:
+            return groups[0]
+        return np.sort(np.concatenate(groups))
+
+    def select(self, filters: EventFilters) -> np.ndarray:
+        """Ascending positions of the events matching filters"""
+        columns = self.columns
+        # (candidate count, materialize candidates, check a candidate subset);
+        # values are bound as defaults so each plan keeps its own
+        plans: List[Tuple[int, Callable[[], np.ndarray],
+                          Callable[[np.ndarray], np.ndarray]]] = []
+
+        if filters.category is not None:
+            positions = self.category_positions.get(filters.category, EMPTY_POSITIONS)
+            codes = self.category_codes.get(filters.category, [])
+            plans.append((len(positions), lambda positions=positions: positions,
+                          lambda subset, codes=codes: np.isin(columns.category_codes[subset],
+                                                              codes)))
+        if filters.location is not None:
+            positions = self.location_positions.get(filters.location, EMPTY_POSITIONS)
+            codes = self.location_codes.get(filters.location, [])
+            plans.append((len(positions), lambda positions=positions: positions,
+                          lambda subset, codes=codes: np.isin(columns.location_codes[subset],
+                                                              codes)))
+        if filters.date_from is not None or filters.date_to is not None:
+            low = -np.inf if filters.date_from is None else datetime_to_micros(filters.date_from)
+            high = np.inf if filters.date_to is None else datetime_to_micros(filters.date_to)
+            start = int(np.searchsorted(self.sorted_dates, low, side="left"))
+            end = int(np.searchsorted(self.sorted_dates, high, side="right"))
+            plans.append((max(0, end - start), lambda: np.sort(self.date_order[start:end]),
+                          lambda subset: (columns.dates[subset] >= low)
+                          & (columns.dates[subset] <= high)))
+        if filters.max_price is not None:
+            max_price = filters.max_price
+            price_end = int(np.searchsorted(self.sorted_prices, max_price, side="right"))
+            plans.append((price_end, lambda: np.sort(self.price_order[:price_end]),
+                          lambda subset: columns.prices[subset] <= max_price))
+        if filters.min_rating is not None:
+            min_rating = filters.min_rating
+            rating_start = int(np.searchsorted(self.sorted_ratings[:self.rated], min_rating,
+                                               side="left"))
+            plans.append((self.rated - rating_start,
+                          lambda: np.sort(self.rating_order[rating_start:self.rated]),
+                          lambda subset: columns.ratings[subset] >= min_rating))
+
+        if not plans:
+            return np.arange(len(columns), dtype=np.int64)
+
+        plans.sort(key=lambda plan: plan[0])
+        if plans[0][0] == 0:
+            return EMPTY_POSITIONS
+        candidates = np.asarray(plans[0][1](), dtype=np.int64)
+        for _, _, check in plans[1:]:
+            candidates = candidates[check(candidates)]
+            if not len(candidates):
+                break
+        return candidates
@@ -1,24 +1,191 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Header, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import List, Optional
+from pydantic import ValidationError
+import hashlib
+import hmac
 import uvicorn
-import csv
-import os
-from datetime import datetime
 
-from .models import User, Event, UserPreferences, RecommendationResponse
+from .models import (
+    Event, RecommendationResponse, User, UserPreferences,
+    BatchRecommendationRequest, BatchRecommendationResponse,
+    EventDeltaRequest, UserPatch, DeltaAccepted,
+    EventRating, RatingsAccepted, EventRatingSummary
+)
 from .recommendation_engine import ContentBasedRecommendationEngine
+from .catalog import (
+    EventCatalog, CatalogSnapshot, CatalogUnavailableError, CsvEventRepository, event_to_row
+)
+from .user_store import UserStore, UserStoreUnavailableError, user_to_row
+from .repository import DATA_BACKENDS, RepositoryError
+from .sqlite_store import SqliteEventRepository, SqlitePool, SqliteUserStore
+from .deltas import DeltaBatcher, DeltaLog, delete_record, upsert_record
+from .ratings import RatingAggregates, RatingIngestor, RatingLog
+from .materialized import MaterializeJob, MaterializeSources, MaterializedRecommendations
+from .cache import RecommendationCache, preferences_fingerprint
+from .serialization import (
+    EncodedEvents, encode_batch_recommendations, encode_recommendations, etag_matches, iter_ndjson
+)
+from .filters import EventFilters, FilterIndex, naive_utc
+from .reloader import BackgroundReloader
+from .concurrency import SingleFlight, run_blocking
+from .metrics import MetricsMiddleware, StageMetrics, render_histograms, render_metric
 from .config import (
     API_TITLE, API_DESCRIPTION, API_VERSION,
-    EVENTS_CSV_PATH, USERS_CSV_PATH,
+    DATA_BACKEND, SQLITE_PATH, SQLITE_POOL_SIZE,
+    EVENTS_CSV_PATH, USERS_CSV_PATH, EVENTS_SNAPSHOT_PATH, USERS_SNAPSHOT_PATH,
+    DATA_RELOAD_INTERVAL, USER_STORE_MODE, SHARED_CATALOG_DIR,
+    EVENTS_DELTA_PATH, USERS_DELTA_PATH, DELTA_APPLY_INTERVAL, DELTA_COMPACT_INTERVAL, ADMIN_TOKEN,
+    RATINGS_LOG_PATH, RATINGS_QUEUE_SIZE, RATINGS_FLUSH_INTERVAL,
+    MATERIALIZED_PATH, MATERIALIZE_LIMIT, MATERIALIZE_INTERVAL, MATERIALIZE_WORKERS,
+    MATERIALIZE_CHUNK_SIZE,
     CORS_ORIGINS, CORS_ALLOW_CREDENTIALS, CORS_ALLOW_METHODS, CORS_ALLOW_HEADERS,
-    DEFAULT_RECOMMENDATION_LIMIT
+    DEFAULT_RECOMMENDATION_LIMIT, MAX_BATCH_USERS, EXCLUDE_PAST_EVENTS,
+    RECOMMENDATION_CACHE_MAX_SIZE, RECOMMENDATION_CACHE_TTL, WORKER_THREADS,
+    METRICS_ENABLED, SCORING_MODE
 )
 
+# Per-stage latency histograms, also reported in each response's Server-Timing header
+stage_metrics = StageMetrics(enabled=METRICS_ENABLED)
+
+# Per-event rating counts and means, used to break ties between equal scores
+rating_aggregates = RatingAggregates()
+
+# Initialize recommendation engine
+recommendation_engine = ContentBasedRecommendationEngine(scoring=SCORING_MODE,
+                                                         ratings=rating_aggregates)
+
+# Upserts and deletes received by the /admin endpoints, until compaction folds them into the CSVs
+event_delta_log = DeltaLog(EVENTS_DELTA_PATH)
+user_delta_log = DeltaLog(USERS_DELTA_PATH)
+
+if DATA_BACKEND not in DATA_BACKENDS:
+    raise ValueError(f"Unknown data backend {DATA_BACKEND!r}, expected one of {DATA_BACKENDS}")
+# Connections shared by the worker threads when the data lives in SQLite
+sqlite_pool = SqlitePool(SQLITE_PATH, SQLITE_POOL_SIZE) if DATA_BACKEND == "sqlite" else None
+
+# Resident event catalog, loaded once and hot-reloaded when the backend's data changes
+if sqlite_pool is not None:
+    event_catalog = EventCatalog(repository=SqliteEventRepository(sqlite_pool),
+                                 delta_log=event_delta_log)
+else:
+    event_catalog = EventCatalog(EVENTS_CSV_PATH, snapshot_file=EVENTS_SNAPSHOT_PATH,
+                                 shared_dir=SHARED_CATALOG_DIR, delta_log=event_delta_log,
+                                 repository=CsvEventRepository(EVENTS_CSV_PATH))
+def build_category_index(snapshot: CatalogSnapshot) -> None:
+    """Index a catalog version, patching the previous version's index after deltas"""
+    if snapshot.derived_from is not None:
+        previous, splice = snapshot.derived_from
+        recommendation_engine.patch_index(snapshot.events, previous.events, splice)
+    else:
+        recommendation_engine.build_index(snapshot.events)
+
+# Category index is built before a new catalog version is published
+event_catalog.add_listener(build_category_index)
+# So is the rating tie-break rank; the rating flusher keeps it up to date afterwards
+event_catalog.add_listener(lambda snapshot: rating_aggregates.refresh_rank(snapshot.events))
+rating_aggregates.add_listener(recommendation_engine.prepare_ties)
+
+def get_encoded_events(snapshot: CatalogSnapshot) -> EncodedEvents:
+    """Return the pre-encoded JSON payload of a catalog version"""
+    encoded = snapshot.extras.get("encoded_events")
+    if encoded is None:
+        encoded = snapshot.extras.setdefault("encoded_events", EncodedEvents(snapshot.events))
+    return encoded
+
+# Events are encoded to JSON once per version, before it is published
+event_catalog.add_listener(get_encoded_events)
+
+def get_filter_index(snapshot: CatalogSnapshot) -> FilterIndex:
+    """Return the filter indexes (location, date, price, rating) of a catalog version"""
+    index = snapshot.extras.get("filter_index")
+    if index is None:
+        base = splice = None
+        if snapshot.derived_from is not None:
+            previous, splice = snapshot.derived_from
+            base = previous.extras.get("filter_index")
+        index = snapshot.extras.setdefault(
+            "filter_index", FilterIndex(snapshot.events, base, splice))
+    return index
+
+event_catalog.add_listener(get_filter_index)
+
+# Finished recommendation lists, keyed by user, preferences, limit and data versions.
+# Keys include both data versions; entries for an old catalog are also dropped
+# eagerly so they do not hold on to the previous events list.
+recommendation_cache = RecommendationCache(RECOMMENDATION_CACHE_MAX_SIZE, RECOMMENDATION_CACHE_TTL)
+event_catalog.add_listener(lambda snapshot: recommendation_cache.clear())
+
+# Scoring and data loading run here, never on the event loop
+worker_pool = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="recommendations")
+# Identical concurrent recommendation requests share one computation
+recommendation_flights = SingleFlight()
+
+# Users indexed by user_id, refreshed incrementally when the CSV grows, or
+# looked up in the users table
+if sqlite_pool is not None:
+    user_store = SqliteUserStore(sqlite_pool, delta_log=user_delta_log)
+else:
+    user_store = UserStore(USERS_CSV_PATH, mode=USER_STORE_MODE,
+                           snapshot_file=USERS_SNAPSHOT_PATH, shared_dir=SHARED_CATALOG_DIR,
+                           delta_log=user_delta_log)
+# Recommendations precomputed by materialize.py, served while they match the live data
+materialized_recommendations = MaterializedRecommendations(MATERIALIZED_PATH, RATINGS_LOG_PATH,
+                                                           rating_aggregates)
+data_reloader = BackgroundReloader([event_catalog, user_store, materialized_recommendations],
+                                   DATA_RELOAD_INTERVAL)
+
+# Accepted deltas are applied in batches and periodically compacted. Workers
+# sharing a published catalog only log them: the loader folds and publishes them.
+event_deltas = DeltaBatcher(event_delta_log, event_catalog.apply_deltas,
+                            event_catalog.compact_deltas, DELTA_COMPACT_INTERVAL)
+user_deltas = DeltaBatcher(user_delta_log, user_store.apply_deltas,
+                           user_store.compact_deltas, DELTA_COMPACT_INTERVAL)
+delta_applier = BackgroundReloader([event_deltas, user_deltas], DELTA_APPLY_INTERVAL)
+
+# Ratings are queued by the request, written to the log and aggregated in the background
+rating_ingestor = RatingIngestor(RatingLog(RATINGS_LOG_PATH), rating_aggregates, RATINGS_QUEUE_SIZE)
+rating_flusher = BackgroundReloader([rating_ingestor], RATINGS_FLUSH_INTERVAL)
+
+# Optional in-process schedule of the materialization job; the loader runs it in shared mode
+materialize_scheduler = BackgroundReloader([MaterializeJob(
+    MaterializeSources(EVENTS_CSV_PATH, USERS_CSV_PATH, EVENTS_SNAPSHOT_PATH, USERS_SNAPSHOT_PATH,
+                       EVENTS_DELTA_PATH, USERS_DELTA_PATH, RATINGS_LOG_PATH,
+                       SQLITE_PATH if sqlite_pool is not None else None),
+    MATERIALIZED_PATH, MATERIALIZE_LIMIT, SCORING_MODE, MATERIALIZE_WORKERS,
+    MATERIALIZE_CHUNK_SIZE
+)] if MATERIALIZED_PATH else [], MATERIALIZE_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load data before serving so requests never wait on a parse
+    await run_blocking(worker_pool, event_catalog.refresh)
+    await run_blocking(worker_pool, user_store.refresh)
+    # Aggregates are rebuilt from the ratings logged before the restart
+    await run_blocking(worker_pool, rating_ingestor.refresh)
+    await run_blocking(worker_pool, materialized_recommendations.refresh)
+    data_reloader.start()
+    if not SHARED_CATALOG_DIR:
+        delta_applier.start()
+        materialize_scheduler.start()
+    rating_flusher.start()
+    yield
+    materialize_scheduler.stop()
+    rating_flusher.stop()
+    # Accepted ratings still in the queue are written before exiting
+    await run_blocking(worker_pool, rating_ingestor.refresh)
+    delta_applier.stop()
+    data_reloader.stop()
+
 app = FastAPI(
     title=API_TITLE,
     description=API_DESCRIPTION,
-    version=API_VERSION
+    version=API_VERSION,
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -29,88 +196,168 @@ app.add_middleware(
     allow_methods=CORS_ALLOW_METHODS,
     allow_headers=CORS_ALLOW_HEADERS,
 )
+app.add_middleware(MetricsMiddleware, metrics=stage_metrics)
 
-# Initialize recommendation engine
-recommendation_engine = ContentBasedRecommendationEngine()
+
+def get_catalog_snapshot() -> CatalogSnapshot:
+    """Return the current catalog snapshot"""
+    try:
+        with stage_metrics.time("read_events"):
+            return event_catalog.get_snapshot()
+    except CatalogUnavailableError as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
 
 def read_events_from_csv():
-    """Read events from CSV file on-demand"""
-    csv_file = EVENTS_CSV_PATH
-    if not os.path.exists(csv_file):
-        raise HTTPException(status_code=500, detail=f"Events data file {csv_file} not found")
-    
-    events = []
-    with open(csv_file, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            # Parse tags (semicolon separated)
-            tags = row['tags'].split(';') if row['tags'] else []
-            
-            # Create Event object
-            event = Event(
-                event_id=row['event_id'],
-                title=row['title'],
-                description=row['description'],
-                category=row['category'],
-                tags=tags,
-                location=row['location'],
-                date=datetime.fromisoformat(row['date']),
-                price=float(row['price']),
-                organizer=row['organizer'],
-                capacity=int(row['capacity']) if row['capacity'] else None,
-                rating=float(row['rating']) if row['rating'] else None
+    """Return events from the resident in-memory catalog"""
+    return get_catalog_snapshot().events
+
+def select_events(snapshot: CatalogSnapshot, filters: EventFilters):
+    """Ascending positions of the events passing filters, or None when nothing is filtered"""
+    if not filters.active:
+        return None
+    with stage_metrics.time("filter"):
+        return get_filter_index(snapshot).select(filters)
+
+def read_materialized(user_id, user_preferences, snapshot, limit):
+    """Recommendations from the materialized store, or None when it is stale for this user"""
+    with stage_metrics.time("materialized"):
+        ranking = materialized_recommendations.lookup(
+            user_id, user_preferences, limit, get_encoded_events(snapshot).digest,
+            recommendation_engine.scoring
+        )
+        if ranking is None:
+            return None
+        return recommendation_engine.explain_ranking(user_preferences, snapshot.events, *ranking)
+
+def compute_recommendations(cache_key, user_id, user_preferences, snapshot, limit, filters):
+    """
+    Filter, score and cache recommendations for one user (runs on the worker
+    pool). The cache holds rankings; responses are encoded from the catalog's
+    pre-encoded events.
+    """
+    # The store holds unfiltered rankings only
+    recommendations = None
+    if not filters.active:
+        recommendations = read_materialized(user_id, user_preferences, snapshot, limit)
+    if recommendations is None:
+        # Filters run first, so scoring only sees the matching events
+        candidates = select_events(snapshot, filters)
+        with stage_metrics.time("score"):
+            recommendations = recommendation_engine.rank(
+                user_preferences, snapshot.events, limit, candidates
             )
-            events.append(event)
-    
-    return events
+    recommendation_cache.put(cache_key, recommendations)
+    return recommendations
+
+def recommendation_cache_key(user_id, user_preferences, limit, snapshot, filters=None):
+    """Cache key covering everything a recommendation list depends on"""
+    # New ratings only change the tie-breaks between equal scores, so they are
+    # not part of the key: a cached list keeps its order until it expires
+    return (user_id, preferences_fingerprint(user_preferences), limit,
+            filters.key() if filters is not None and filters.active else None,
+            snapshot.version, user_store.version)
 
 def read_user_from_csv(user_id: str):
-    """Read a specific user and their preferences from CSV file on-demand"""
-    csv_file = USERS_CSV_PATH
-    if not os.path.exists(csv_file):
-        raise HTTPException(status_code=500, detail=f"Users data file {csv_file} not found")
-    
-    with open(csv_file, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            if row['user_id'] == user_id:
-                # Create User object
-                user = User(
-                    user_id=row['user_id'],
-                    name=row['name'],
-                    email=row['email'],
-                    age=int(row['age']) if row['age'] else None,
-                    location=row['location'],
-                    created_at=datetime.fromisoformat(row['created_at'])
-                )
-                
-                # Create UserPreferences object
-                categories = row['categories'].split(';') if row['categories'] else []
-                preferences = UserPreferences(
-                    user_id=user.user_id,
-                    categories=categories
-                )
-                
-                return user, preferences
-    
-    # User not found
-    return None, None
+    """Look up a user and their preferences in the indexed user store"""
+    try:
+        with stage_metrics.time("read_user"):
+            return user_store.get(user_id)
+    except (UserStoreUnavailableError, RepositoryError) as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+async def read_user(user_id: str):
+    """read_user_from_csv for request handlers, off the event loop when the lookup does I/O"""
+    if user_store.lookups_block:
+        return await run_blocking(worker_pool, read_user_from_csv, user_id)
+    return read_user_from_csv(user_id)
 
 @app.get("/")
 async def root():
     return {"message": "Events Recommendation System"}
 
+def upcoming_date_from(date_from: Optional[datetime] = None) -> datetime:
+    """date_from of a view that excludes past events"""
+    # In naive UTC like the catalog's dates, truncated to the minute so cache
+    # keys and ETags stay stable between requests
+    now = naive_utc(datetime.now(timezone.utc)).replace(second=0, microsecond=0)
+    return now if date_from is None else max(naive_utc(date_from), now)
+
+def event_filters(
+    category: Optional[str] = Query(None, description="Only events in this category"),
+    location: Optional[str] = Query(None, description="Only events in this location or city"),
+    date_from: Optional[datetime] = Query(None, description="Only events on or after this date"),
+    date_to: Optional[datetime] = Query(None, description="Only events on or before this date"),
+    max_price: Optional[float] = Query(None, ge=0, description="Only events up to this price"),
+    free_only: bool = Query(False, description="Only free events"),
+    min_rating: Optional[float] = Query(None, ge=0, le=5, description="Only events rated at least this"),
+    upcoming_only: Optional[bool] = Query(
+        None, description="Exclude past events (defaults to the EXCLUDE_PAST_EVENTS setting)")
+) -> EventFilters:
+    """Query parameters shared by the endpoints that filter events"""
+    if upcoming_only is None:
+        upcoming_only = EXCLUDE_PAST_EVENTS
+    if upcoming_only:
+        date_from = upcoming_date_from(date_from)
+    return EventFilters(category=category, location=location, date_from=date_from,
+                        date_to=date_to, max_price=max_price, free_only=free_only,
+                        min_rating=min_rating)
+
+def filtered_page(encoded: EncodedEvents, positions, offset: int, limit: Optional[int]) -> bytes:
+    """JSON array of one page of the filtered events"""
+    end = None if limit is None else offset + limit
+    with stage_metrics.time("serialize"):
+        return encoded.select(positions[offset:end].tolist())
+
 @app.get("/events/", response_model=List[Event])
-async def get_events():
-    """Get all events by reading from CSV file"""
-    events = read_events_from_csv()
-    return events
+async def get_events(
+    offset: int = Query(0, ge=0, description="Index of the first event to return"),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of events to return"),
+    filters: EventFilters = Depends(event_filters),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Get events from the in-memory catalog, served from pre-encoded JSON"""
+    snapshot = get_catalog_snapshot()
+    encoded = get_encoded_events(snapshot)
+    if filters.active:
+        positions = await run_blocking(worker_pool, select_events, snapshot, filters)
+        total = len(positions)
+        # The filters are part of the validator, so each filtered view has its own ETag
+        view = hashlib.blake2b(repr((filters.key(), offset, limit)).encode(),
+                               digest_size=8).hexdigest()
+        etag = f'"{encoded.digest}-{view}"'
+        body = None if etag_matches(if_none_match, etag) else \
+            await run_blocking(worker_pool, filtered_page, encoded, positions, offset, limit)
+    else:
+        total = encoded.count
+        with stage_metrics.time("serialize"):
+            body, etag = encoded.page(offset, limit)
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "X-Total-Count": str(total),
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/events/stream")
+async def stream_events(filters: EventFilters = Depends(event_filters)):
+    """Stream events as newline-delimited JSON, applying filters from the indexes"""
+    snapshot = get_catalog_snapshot()
+    positions = await run_blocking(worker_pool, select_events, snapshot, filters)
+    return StreamingResponse(
+        iter_ndjson(get_encoded_events(snapshot), positions),
+        media_type="application/x-ndjson",
+        headers={"X-Catalog-Version": str(snapshot.version)}
+    )
 
 @app.get("/users/{user_id}/recommendations/", response_model=List[RecommendationResponse])
-async def get_recommendations(user_id: str, limit: int = DEFAULT_RECOMMENDATION_LIMIT):
-    """Get personalized event recommendations for a user by reading from CSV files"""
-    # Read user and preferences from CSV
-    user, user_preferences = read_user_from_csv(user_id)
+async def get_recommendations(user_id: str, limit: int = DEFAULT_RECOMMENDATION_LIMIT,
+                              filters: EventFilters = Depends(event_filters)):
+    """Get personalized event recommendations for a user"""
+    # Look up user and preferences in the user store
+    user, user_preferences = await read_user(user_id)
     
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
@@ -118,14 +365,276 @@ async def get_recommendations(user_id: str, limit: int = DEFAULT_RECOMMENDATION_
     if user_preferences is None:
         raise HTTPException(status_code=400, detail="User preferences not found")
     
-    # Read events from CSV
-    events = read_events_from_csv()
+    # Read events from the catalog
+    snapshot = get_catalog_snapshot()
+    events = snapshot.events
     
     if not events:
         return []
     
-    recommendations = recommendation_engine.get_recommendations(
-        user_preferences, events, limit
-    )
+    cache_key = recommendation_cache_key(user_id, user_preferences, limit, snapshot, filters)
+    with stage_metrics.time("cache"):
+        recommendations = recommendation_cache.get(cache_key)
+    if recommendations is None:
+        # Scoring runs on the worker pool; concurrent misses for the same key share it
+        recommendations = await recommendation_flights.run(
+            cache_key,
+            lambda: run_blocking(worker_pool, compute_recommendations,
+                                 cache_key, user_id, user_preferences, snapshot, limit, filters)
+        )
     
-    return recommendations 
\ No newline at end of file
+    with stage_metrics.time("serialize"):
+        body = encode_recommendations(get_encoded_events(snapshot), recommendations)
+    return Response(content=body, media_type="application/json")
+
+def compute_recommendations_batch(user_ids: List[str], limit: int) -> bytes:
+    """
+    Build the JSON of a batch response, scoring every cache miss together
+    (runs on the worker pool)
+    """
+    snapshot = get_catalog_snapshot()
+    # Same default as the single-user endpoint without query parameters
+    filters = EventFilters(date_from=upcoming_date_from()) if EXCLUDE_PAST_EVENTS \
+        else EventFilters()
+    results = []
+    missing_user_ids = []
+    # Users not served from the cache, scored together in one batch
+    pending = []
+    for user_id in user_ids:
+        user, user_preferences = read_user_from_csv(user_id)
+        if user is None:
+            missing_user_ids.append(user_id)
+            continue
+        cache_key = recommendation_cache_key(user_id, user_preferences, limit, snapshot, filters)
+        recommendations = recommendation_cache.get(cache_key)
+        # The store holds unfiltered rankings only
+        if recommendations is None and not filters.active:
+            recommendations = read_materialized(user_id, user_preferences, snapshot, limit)
+            if recommendations is not None:
+                recommendation_cache.put(cache_key, recommendations)
+        if recommendations is None:
+            pending.append((len(results), user_preferences, cache_key))
+        results.append((user_id, recommendations))
+
+    if pending:
+        candidates = select_events(snapshot, filters)
+        with stage_metrics.time("score_batch"):
+            batch = recommendation_engine.rank_explained_batch(
+                [user_preferences for _, user_preferences, _ in pending], snapshot.events, limit,
+                candidates
+            )
+        for (slot, _, cache_key), recommendations in zip(pending, batch):
+            results[slot] = (results[slot][0], recommendations)
+            recommendation_cache.put(cache_key, recommendations)
+
+    with stage_metrics.time("serialize"):
+        return encode_batch_recommendations(get_encoded_events(snapshot), results,
+                                            missing_user_ids)
+
+@app.post("/recommendations/batch", response_model=BatchRecommendationResponse)
+async def get_recommendations_batch(request: BatchRecommendationRequest):
+    """Get recommendations for many users in one round trip"""
+    if len(request.user_ids) > MAX_BATCH_USERS:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {MAX_BATCH_USERS} users per batch")
+    limit = request.limit or DEFAULT_RECOMMENDATION_LIMIT
+    body = await run_blocking(worker_pool, compute_recommendations_batch,
+                              request.user_ids, limit)
+    return Response(content=body, media_type="application/json")
+
+def accept_ratings(ratings: List[EventRating]) -> RatingsAccepted:
+    """Queue ratings without waiting for them to be written"""
+    if not rating_ingestor.offer(ratings):
+        raise HTTPException(status_code=503, detail="Rating queue is full",
+                            headers={"Retry-After": "1"})
+    return RatingsAccepted(accepted=len(ratings), queued=rating_ingestor.queued)
+
+@app.post("/ratings", response_model=RatingsAccepted, status_code=202)
+async def submit_rating(rating: EventRating):
+    """Record a user's rating of an event"""
+    return accept_ratings([rating])
+
+@app.post("/ratings/bulk", response_model=RatingsAccepted, status_code=202)
+async def submit_ratings(ratings: List[EventRating]):
+    """Record many ratings at once; either all of them are accepted or none"""
+    return accept_ratings(ratings)
+
+@app.get("/events/{event_id}/ratings", response_model=EventRatingSummary)
+async def get_event_ratings(event_id: str):
+    """Count and mean of the ratings received for an event"""
+    count, mean = rating_aggregates.get(event_id)
+    return EventRatingSummary(event_id=event_id, count=count, mean=mean)
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Check the X-Admin-Token header; the admin endpoints are closed without ADMIN_TOKEN"""
+    if ADMIN_TOKEN is None:
+        raise HTTPException(status_code=403,
+                            detail="Admin endpoints are disabled: ADMIN_TOKEN is not set")
+    if not hmac.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def submit_deltas(batcher: DeltaBatcher, records: List[dict]) -> DeltaAccepted:
+    """Log delta records and queue them for the next batch (runs on the worker pool)"""
+    if SHARED_CATALOG_DIR:
+        # Visible once the loader has folded the log and published a new version
+        batcher.log.append(records)
+        return DeltaAccepted(accepted=len(records), pending=len(records))
+    batcher.submit(records)
+    if DELTA_APPLY_INTERVAL <= 0:
+        batcher.refresh()
+    return DeltaAccepted(accepted=len(records), pending=batcher.pending)
+
+@app.post("/admin/events", response_model=DeltaAccepted, status_code=202,
+          dependencies=[Depends(require_admin)])
+async def ingest_events(request: EventDeltaRequest):
+    """Add, replace (by event_id) or remove events; upserts are applied before deletes"""
+    records = [upsert_record(event.event_id, event_to_row(event)) for event in request.upserts]
+    records.extend(delete_record(event_id) for event_id in request.deletes)
+    return await run_blocking(worker_pool, submit_deltas, event_deltas, records)
+
+@app.patch("/admin/users/{user_id}", response_model=DeltaAccepted, status_code=202,
+           dependencies=[Depends(require_admin)])
+async def patch_user(user_id: str, patch: UserPatch):
+    """Update the given fields of a user, or create the user if it does not exist"""
+    user, user_preferences = await read_user(user_id)
+    changes = patch.model_dump(exclude_unset=True)
+    categories = changes.pop("categories", None)
+    if user is None:
+        data = {"user_id": user_id, **changes}
+        categories = categories or []
+    else:
+        data = {**user.model_dump(), **changes}
+        if categories is None:
+            categories = user_preferences.categories
+    try:
+        user = User(**data)
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+    record = upsert_record(user_id, user_to_row(
+        user, UserPreferences(user_id=user_id, categories=categories)))
+    return await run_blocking(worker_pool, submit_deltas, user_deltas, [record])
+
+@app.delete("/admin/users/{user_id}", response_model=DeltaAccepted, status_code=202,
+            dependencies=[Depends(require_admin)])
+async def delete_user(user_id: str):
+    """Remove a user"""
+    user, _ = await read_user(user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return await run_blocking(worker_pool, submit_deltas, user_deltas, [delete_record(user_id)])
+
+@app.post("/admin/compact", dependencies=[Depends(require_admin)])
+async def compact_deltas():
+    """Apply pending deltas and fold the delta logs into the CSVs now"""
+    if SHARED_CATALOG_DIR:
+        raise HTTPException(status_code=409,
+                            detail="Delta logs are compacted by the loader process")
+    return {
+        "events": await run_blocking(worker_pool, event_deltas.compact),
+        "users": await run_blocking(worker_pool, user_deltas.compact),
+    }
+
+def materialized_stats() -> dict:
+    """Materialized store statistics, checked against the current catalog when one is loaded"""
+    digest = None
+    if event_catalog.loaded:
+        digest = get_encoded_events(event_catalog.get_snapshot()).digest
+    return materialized_recommendations.stats(digest)
+
+@app.get("/stats/")
+async def get_stats():
+    """Data loading and lookup statistics"""
+    return {
+        "catalog": event_catalog.stats(),
+        # Counting the users may query the backend
+        "users": await run_blocking(worker_pool, user_store.stats),
+        "deltas": {"events": event_deltas.stats(), "users": user_deltas.stats()},
+        "ratings": rating_ingestor.stats(),
+        "materialized": materialized_stats(),
+        "recommendation_cache": recommendation_cache.stats(),
+        "single_flight": recommendation_flights.stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition of stage latencies, data sizes, reloads and cache stats"""
+    catalog = event_catalog.stats()
+    users = await run_blocking(worker_pool, user_store.stats)
+    cache = recommendation_cache.stats()
+    flights = recommendation_flights.stats()
+    deltas = {"events": event_deltas.stats(), "users": user_deltas.stats()}
+    ratings = rating_ingestor.stats()
+    materialized = materialized_stats()
+    lines = render_histograms("recsys_stage_duration_seconds",
+                              "Time spent in each request handling stage",
+                              "stage", stage_metrics.histograms())
+    for name, metric_type, help_text, value in [
+        ("recsys_catalog_events", "gauge", "Events in the current catalog", catalog["events"]),
+        ("recsys_catalog_version", "gauge", "Current catalog version", catalog["version"]),
+        ("recsys_catalog_load_seconds", "gauge", "Time taken to load the current catalog",
+         catalog["load_seconds"] or 0.0),
+        ("recsys_catalog_reloads_total", "counter", "Catalog reloads after startup",
+         catalog["reload_count"]),
+        ("recsys_catalog_reload_errors_total", "counter", "Failed catalog reloads",
+         catalog["reload_errors"]),
+        ("recsys_users", "gauge", "Users in the user store", users["users"]),
+        ("recsys_user_store_full_reloads_total", "counter", "Full user store rebuilds",
+         users["full_reloads"]),
+        ("recsys_user_store_incremental_reloads_total", "counter",
+         "Incremental user store refreshes", users["incremental_reloads"]),
+        ("recsys_user_store_reload_errors_total", "counter", "Failed user store reloads",
+         users["reload_errors"]),
+        ("recsys_user_lookups_hits_total", "counter", "User lookups that found the user",
+         users["hits"]),
+        ("recsys_user_lookups_misses_total", "counter", "User lookups for unknown users",
+         users["misses"]),
+        ("recsys_recommendation_cache_size", "gauge", "Entries in the recommendation cache",
+         cache["size"]),
+        ("recsys_recommendation_cache_hits_total", "counter", "Recommendation cache hits",
+         cache["hits"]),
+        ("recsys_recommendation_cache_misses_total", "counter", "Recommendation cache misses",
+         cache["misses"]),
+        ("recsys_recommendation_cache_evictions_total", "counter",
+         "Recommendation cache LRU evictions", cache["evictions"]),
+        ("recsys_recommendation_cache_expirations_total", "counter",
+         "Recommendation cache TTL expirations", cache["expirations"]),
+        ("recsys_recommendation_cache_invalidations_total", "counter",
+         "Recommendation cache clears on catalog reload", cache["invalidations"]),
+        ("recsys_single_flight_shared_total", "counter",
+         "Recommendation requests that joined an in-flight computation", flights["shared"]),
+        ("recsys_ratings_queued", "gauge", "Accepted ratings waiting to be flushed",
+         ratings["queued"]),
+        ("recsys_ratings_accepted_total", "counter", "Ratings accepted", ratings["accepted"]),
+        ("recsys_ratings_rejected_total", "counter", "Ratings rejected because the queue was full",
+         ratings["rejected"]),
+        ("recsys_ratings_flushed_total", "counter", "Ratings written to the log",
+         ratings["flushed"]),
+        ("recsys_rated_events", "gauge", "Events with at least one received rating",
+         ratings["rated_events"]),
+        ("recsys_materialized_users", "gauge", "Users in the materialized recommendations store",
+         materialized["users"]),
+        ("recsys_materialized_staleness_seconds", "gauge",
+         "Age of the materialized recommendations store", materialized["staleness_seconds"] or 0.0),
+        ("recsys_materialized_matches_catalog", "gauge",
+         "Whether the materialized store was built from the current catalog",
+         int(bool(materialized["matches_catalog"]))),
+        ("recsys_materialized_hits_total", "counter",
+         "Recommendation requests served from the materialized store", materialized["hits"]),
+        ("recsys_materialized_misses_total", "counter",
+         "Recommendation requests the materialized store could not serve",
+         sum(materialized["misses"].values())),
+    ]:
+        lines.extend(render_metric(name, metric_type, help_text, value))
+    for kind, stats in deltas.items():
+        for name, metric_type, help_text, value in [
+            (f"recsys_{kind}_deltas_pending", "gauge",
+             f"Accepted {kind} deltas not yet applied", stats["pending"]),
+            (f"recsys_{kind}_deltas_applied_total", "counter",
+             f"{kind.capitalize()} delta records applied", stats["applied_records"]),
+            (f"recsys_{kind}_delta_compactions_total", "counter",
+             f"Compactions of the {kind} delta log", stats["compactions"]),
+        ]:
+            lines.extend(render_metric(name, metric_type, help_text, value))
+    return PlainTextResponse("\n".join(lines) + "\n",
+                             media_type="text/plain; version=0.0.4")
@@ -0,0 +1,401 @@
+"""
+Materialized recommendations
+Recommendations only change when the catalog or a user's categories change,
+so an offline job can rank every user ahead of time. Users with the same
+categories share one ranking, so the job ranks every distinct set of
+categories once, in chunks on a process pool. It writes the top-N event
+positions and scores of every ranking, and the ranking of every user, to a
+binary snapshot (see snapshot.py) with an open-addressing user_id table, so
+serving a user is one memory-mapped lookup.
+
+An entry is only served when it still describes the live data: the store
+records the digest of the catalog's encoded JSON, which identifies the exact
+events and their order in any process, the scoring mode, and a hash of each
+user's categories. Anything else falls back to live scoring.
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .cache import preferences_fingerprint
+from .catalog import EventCatalog
+from .columnar import EventColumns, StringColumn
+from .deltas import DeltaLog
+from .models import UserPreferences
+from .ratings import RatingAggregates, RatingIngestor, RatingLog
+from .recommendation_engine import ContentBasedRecommendationEngine
+from .reloader import file_signature
+from .serialization import EncodedEvents
+from .sqlite_store import SqliteEventRepository, SqlitePool, SqliteUserStore, table_versions
+from .snapshot import (
+    SnapshotError, SnapshotFile, SnapshotWriter, build_hash_table, probe_hash_table,
+    strings_column
+)
+from .repository import UserRepository
+from .user_store import UserStore
+
+logger = logging.getLogger(__name__)
+
+KIND = "recommendations"
+
+
+def preferences_hash(preferences: UserPreferences) -> int:
+    """Stable 63-bit hash of the preferences fingerprint, identical in every process"""
+    key = "\x1f".join(preferences_fingerprint(preferences)).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") >> 1
+
+
+class MaterializeSources(NamedTuple):
+    """Input files of a materialization, as the server would load them"""
+    events_csv: str
+    users_csv: str
+    events_snapshot: Optional[str] = None
+    users_snapshot: Optional[str] = None
+    events_delta: Optional[str] = None
+    users_delta: Optional[str] = None
+    ratings_log: Optional[str] = None
+    # Read events and users from this SQLite database instead of the CSVs
+    sqlite_path: Optional[str] = None
+
+    def signatures(self) -> Dict[str, Optional[List[int]]]:
+        """Signature of every input that changes the rankings"""
+        signatures = {}
+        # Ratings break ties, so the log is an input too; readers compare it before serving
+        for path in (self.events_csv, self.users_csv, self.events_delta, self.users_delta,
+                     self.ratings_log):
+            if path:
+                signature = file_signature(path)
+                signatures[path] = list(signature) if signature is not None else None
+        if self.sqlite_path:
+            pool = SqlitePool(self.sqlite_path, 1)
+            try:
+                signatures[self.sqlite_path] = list(table_versions(pool))
+            finally:
+                pool.close()
+        return signatures
+
+    def event_catalog(self) -> EventCatalog:
+        delta_log = DeltaLog(self.events_delta) if self.events_delta else None
+        if self.sqlite_path:
+            return EventCatalog(repository=SqliteEventRepository(SqlitePool(self.sqlite_path, 1)),
+                                delta_log=delta_log)
+        return EventCatalog(self.events_csv, snapshot_file=self.events_snapshot,
+                            delta_log=delta_log)
+
+    def user_store(self) -> UserRepository:
+        if self.sqlite_path:
+            # The server writes user deltas to the table as they are applied
+            return SqliteUserStore(SqlitePool(self.sqlite_path, 1))
+        return UserStore(self.users_csv, snapshot_file=self.users_snapshot,
+                         delta_log=DeltaLog(self.users_delta) if self.users_delta else None)
+
+
+# Catalog and engine of a pool worker, loaded once per process
+_scorer: Optional[Tuple[ContentBasedRecommendationEngine, EventColumns, EncodedEvents]] = None
+
+
+def _load_scorer(sources: MaterializeSources, scoring: str
+                 ) -> Tuple[ContentBasedRecommendationEngine, EventColumns, EncodedEvents]:
+    """Load the catalog and rating aggregates the same way the server does"""
+    snapshot = sources.event_catalog().get_snapshot()
+    encoded = snapshot.extras.get("encoded_events") or EncodedEvents(snapshot.events)
+
+    aggregates = None
+    if sources.ratings_log:
+        aggregates = RatingAggregates()
+        RatingIngestor(RatingLog(sources.ratings_log), aggregates, 0).refresh()
+    engine = ContentBasedRecommendationEngine(scoring=scoring, ratings=aggregates)
+    engine.build_index(snapshot.events)
+    return engine, snapshot.events, encoded
+
+
+def _init_worker(sources: MaterializeSources, scoring: str):
+    global _scorer
+    # Forked workers inherit the parent's scorer; spawned ones load their own
+    if _scorer is None:
+        _scorer = _load_scorer(sources, scoring)
+
+
+def _rank_chunk(categories: List[List[str]], limit: int
+                ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Rank a chunk of category sets: (counts, flat positions, flat scores)"""
+    engine, events, _ = _scorer
+    # Categories were validated when the users were loaded
+    rankings = engine.rank_batch([UserPreferences.model_construct(categories=user_categories)
+                                  for user_categories in categories], events, limit)
+    counts = np.fromiter((len(positions) for positions, _ in rankings), dtype=np.int64,
+                         count=len(rankings))
+    total = int(counts.sum())
+    positions = np.fromiter(chain.from_iterable(ranked for ranked, _ in rankings),
+                            dtype=np.int32, count=total)
+    scores = np.fromiter(chain.from_iterable(ranked for _, ranked in rankings),
+                         dtype=np.float64, count=total)
+    return counts, positions, scores
+
+
+def _pool_context():
+    """
+    fork shares the already loaded catalog with the workers, but forking a
+    process that runs other threads can deadlock the children, so a
+    scheduler inside a server spawns them instead.
+    """
+    if "fork" in multiprocessing.get_all_start_methods() and threading.active_count() == 1:
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("spawn")
+
+
+def materialize_recommendations(sources: MaterializeSources, path: str, limit: int,
+                                scoring: str = "category", workers: int = 1,
+                                chunk_size: int = 2000) -> int:
+    """
+    Rank every user of sources and write the top `limit` events of
+    each to the store at path. Returns the number of users written.
+    """
+    global _scorer
+    started = time.time()
+    inputs = sources.signatures()
+    users = sources.user_store()
+    user_ids = users.user_ids()
+    # Ranking of every user, and the categories of every distinct ranking
+    rankings: Dict[Tuple[str, ...], int] = {}
+    categories: List[List[str]] = []
+    user_rankings = np.empty(len(user_ids), dtype=np.int32)
+    for row, user_id in enumerate(user_ids):
+        preferences = users.get(user_id)[1]
+        ranking = rankings.setdefault(preferences_fingerprint(preferences), len(rankings))
+        if ranking == len(categories):
+            categories.append(preferences.categories)
+        user_rankings[row] = ranking
+    chunks = [categories[start:start + chunk_size]
+              for start in range(0, len(categories), chunk_size)]
+
+    _scorer = _load_scorer(sources, scoring)
+    try:
+        digest = _scorer[2].digest
+        if workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context(),
+                                     initializer=_init_worker,
+                                     initargs=(sources, scoring)) as pool:
+                results = list(pool.map(_rank_chunk, chunks, [limit] * len(chunks)))
+        else:
+            results = [_rank_chunk(chunk, limit) for chunk in chunks]
+    finally:
+        _scorer = None
+
+    counts = [result[0] for result in results]
+    offsets = np.zeros(len(categories) + 1, dtype=np.int64)
+    if counts:
+        np.cumsum(np.concatenate(counts), out=offsets[1:])
+    empty_positions, empty_scores = np.zeros(0, np.int32), np.zeros(0, np.float64)
+
+    writer = SnapshotWriter(KIND, sources.users_csv, file_signature(sources.users_csv) or (0, 0))
+    writer.meta.update({
+        "catalog_digest": digest,
+        "scoring": scoring,
+        "limit": limit,
+        "generated_at": started,
+        "build_seconds": time.time() - started,
+        "inputs": inputs,
+    })
+    writer.add_strings("user_ids", strings_column(user_ids))
+    writer.add_array("user_table", build_hash_table(user_ids))
+    writer.add_array("user_rankings", user_rankings)
+    writer.add_array("preferences", np.fromiter(
+        (preferences_hash(UserPreferences.model_construct(categories=ranking_categories))
+         for ranking_categories in categories), dtype=np.int64, count=len(categories)))
+    writer.add_array("offsets", offsets)
+    writer.add_array("positions", np.concatenate([result[1] for result in results]
+                                                 or [empty_positions]))
+    writer.add_array("scores", np.concatenate([result[2] for result in results]
+                                              or [empty_scores]))
+    writer.write(path)
+    logger.info("Materialized recommendations of %d users (%d distinct rankings) to %s in %.2fs",
+                len(user_ids), len(categories), path, time.time() - started)
+    return len(user_ids)
+
+
+class _Store(NamedTuple):
+    snapshot: SnapshotFile
+    user_ids: StringColumn
+    table: np.ndarray
+    user_rankings: np.ndarray
+    preferences: np.ndarray
+    offsets: np.ndarray
+    positions: np.ndarray
+    scores: np.ndarray
+
+
+class MaterializedRecommendations:
+    """
+    Reader of the store written by materialize_recommendations. refresh()
+    has the data sources' contract: it maps the file again when it changed.
+    Stored rankings break ties with the ratings logged when the store was
+    built, so with ratings_log and the live aggregates given, lookups are
+    refused once the log has changed since.
+    """
+
+    def __init__(self, path: Optional[str], ratings_log: Optional[str] = None,
+                 ratings: Optional[RatingAggregates] = None):
+        self.path = path
+        self.ratings_log = ratings_log
+        self.ratings = ratings
+        self._store: Optional[_Store] = None
+        self._signature = None
+        # (store, aggregates version, whether the log still matches the store's)
+        self._ratings_check: Optional[Tuple[_Store, int, bool]] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        # Lookups that fell back to live scoring, by reason
+        self.misses = {"no_store": 0, "unknown_user": 0, "stale_catalog": 0,
+                       "stale_ratings": 0, "stale_preferences": 0, "limit": 0}
+        self.reload_errors = 0
+
+    def refresh(self, force: bool = False) -> bool:
+        if not self.path:
+            return False
+        with self._lock:
+            signature = file_signature(self.path)
+            if signature is None:
+                self._store, self._signature = None, None
+                return False
+            if not force and signature == self._signature:
+                return False
+            try:
+                snapshot = SnapshotFile(self.path)
+                if snapshot.meta.get("kind") != KIND:
+                    raise SnapshotError(f"{self.path} holds {snapshot.meta.get('kind')}, not {KIND}")
+                store = _Store(snapshot, snapshot.strings("user_ids"), snapshot.array("user_table"),
+                               snapshot.array("user_rankings"), snapshot.array("preferences"),
+                               snapshot.array("offsets"), snapshot.array("positions"),
+                               snapshot.array("scores"))
+            except (SnapshotError, KeyError) as exc:
+                self.reload_errors += 1
+                logger.warning("Ignoring materialized recommendations: %s", exc)
+                return False
+            self._store, self._signature = store, signature
+            logger.info("Loaded materialized recommendations of %d users from %s",
+                        len(store.user_ids), self.path)
+            return True
+
+    @property
+    def meta(self) -> Optional[dict]:
+        store = self._store
+        return store.snapshot.meta if store is not None else None
+
+    def _ratings_match(self, store: _Store) -> bool:
+        """
+        Whether the rating log is the one the store was ranked with. The log
+        is only checked again after the aggregates changed.
+        """
+        if self.ratings is None or not self.ratings_log:
+            return True
+        version = self.ratings.version
+        check = self._ratings_check
+        if check is not None and check[0] is store and check[1] == version:
+            return check[2]
+        signature = file_signature(self.ratings_log)
+        built_with = store.snapshot.meta["inputs"].get(self.ratings_log)
+        matches = built_with == (list(signature) if signature is not None else None)
+        self._ratings_check = (store, version, matches)
+        return matches
+
+    def lookup(self, user_id: str, preferences: UserPreferences, limit: int,
+               catalog_digest: str, scoring: str) -> Optional[Tuple[List[int], List[float]]]:
+        """
+        Stored (positions, scores) of the top `limit` events of a user, or None
+        when the store does not describe the current catalog and preferences.
+        """
+        store = self._store
+        if store is None:
+            self.misses["no_store"] += 1
+            return None
+        meta = store.snapshot.meta
+        if meta["catalog_digest"] != catalog_digest or meta["scoring"] != scoring:
+            self.misses["stale_catalog"] += 1
+            return None
+        if not self._ratings_match(store):
+            self.misses["stale_ratings"] += 1
+            return None
+        if limit > meta["limit"]:
+            self.misses["limit"] += 1
+            return None
+        position = probe_hash_table(store.table, store.user_ids, user_id)
+        if position is None:
+            self.misses["unknown_user"] += 1
+            return None
+        ranking = int(store.user_rankings[position])
+        if int(store.preferences[ranking]) != preferences_hash(preferences):
+            self.misses["stale_preferences"] += 1
+            return None
+
+        start = int(store.offsets[ranking])
+        end = min(int(store.offsets[ranking + 1]), start + limit)
+        self.hits += 1
+        return store.positions[start:end].tolist(), store.scores[start:end].tolist()
+
+    def staleness_seconds(self) -> Optional[float]:
+        """Age of the loaded store, None when there is none"""
+        meta = self.meta
+        return time.time() - meta["generated_at"] if meta is not None else None
+
+    def stats(self, catalog_digest: Optional[str] = None) -> dict:
+        meta = self.meta
+        misses = sum(self.misses.values())
+        lookups = self.hits + misses
+        return {
+            "path": self.path,
+            "loaded": meta is not None,
+            "users": len(self._store.user_ids) if meta is not None else 0,
+            "rankings": len(self._store.preferences) if meta is not None else 0,
+            "limit": meta["limit"] if meta is not None else None,
+            "scoring": meta["scoring"] if meta is not None else None,
+            "matches_catalog": (meta["catalog_digest"] == catalog_digest
+                                if meta is not None and catalog_digest is not None else None),
+            "staleness_seconds": self.staleness_seconds(),
+            "hits": self.hits,
+            "misses": dict(self.misses),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "reload_errors": self.reload_errors,
+        }
+
+
+class MaterializeJob:
+    """
+    Scheduled materialization with the data sources' refresh() contract,
+    driven by a BackgroundReloader. A run is skipped while the store was
+    built from the current input files, ratings log included.
+    """
+
+    def __init__(self, sources: MaterializeSources, path: str, limit: int,
+                 scoring: str = "category", workers: int = 1, chunk_size: int = 2000):
+        self.sources = sources
+        self.path = path
+        self.limit = limit
+        self.scoring = scoring
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.runs = 0
+
+    def is_current(self) -> bool:
+        try:
+            meta = SnapshotFile(self.path).meta
+        except SnapshotError:
+            return False
+        return meta.get("kind") == KIND and meta.get("inputs") == self.sources.signatures() \
+            and meta.get("limit") == self.limit and meta.get("scoring") == self.scoring
+
+    def refresh(self, force: bool = False) -> bool:
+        if not force and self.is_current():
+            return False
+        materialize_recommendations(self.sources, self.path, self.limit, self.scoring,
+                                    self.workers, self.chunk_size)
+        self.runs += 1
+        return True
@@ -0,0 +1,182 @@
+"""
+Latency instrumentation
+Per-stage timings are recorded into fixed-bucket histograms, exposed in the
+Prometheus text format, and reported per request in a Server-Timing header.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds; wide enough to cover a cached lookup and a full reload
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Seconds per stage recorded while handling the current request; a stage hit
+# several times (e.g. user lookups in a batch) is summed into one entry
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+class Histogram:
+    """Thread-safe cumulative histogram with fixed bucket bounds"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One extra slot for observations above the last bound (+Inf)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        """Return (cumulative bucket counts, sum, count)"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = []
+        running = 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total, running
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "stage", "started")
+
+    def __init__(self, metrics: "StageMetrics", stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class StageMetrics:
+    """
+    One latency histogram per named stage.
+    When disabled, time() returns a shared no-op context manager.
+    """
+
+    def __init__(self, enabled: bool = True, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def time(self, stage: str):
+        """Context manager recording the duration of a stage"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, stage)
+
+    def observe(self, stage: str, seconds: float):
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, Histogram(self.buckets))
+        histogram.observe(seconds)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def histograms(self) -> Dict[str, Histogram]:
+        return dict(self._histograms)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metric(name: str, metric_type: str, help_text: str, value) -> List[str]:
+    """Prometheus text lines for an unlabelled gauge or counter"""
+    return [
+        f"# HELP {name} {help_text}",
+        f"# TYPE {name} {metric_type}",
+        f"{name} {_format_value(value)}",
+    ]
+
+
+def render_histograms(name: str, help_text: str, label: str,
+                      histograms: Dict[str, Histogram]) -> List[str]:
+    """Prometheus text lines for a family of histograms keyed by one label"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for key in sorted(histograms):
+        histogram = histograms[key]
+        cumulative, total, count = histogram.snapshot()
+        bounds = histogram.buckets + (float("inf"),)
+        for bound, bucket_count in zip(bounds, cumulative):
+            lines.append(f'{name}_bucket{{{label}="{key}",le="{_format_value(bound)}"}} '
+                         f'{bucket_count}')
+        lines.append(f'{name}_sum{{{label}="{key}"}} {_format_value(total)}')
+        lines.append(f'{name}_count{{{label}="{key}"}} {count}')
+    return lines
+
+
+def server_timing_header(timings: Iterable[Tuple[str, float]]) -> str:
+    """Server-Timing value with durations in milliseconds"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in timings)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that times each HTTP request and adds a Server-Timing
+    header listing the stages recorded while handling it.
+    """
+
+    def __init__(self, app, metrics: StageMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - started
+                header = server_timing_header([*timings.items(), ("total", total)])
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", header.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            self.metrics.observe("request", time.perf_counter() - started)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional, Dict
 from datetime import datetime
 
@@ -32,9 +32,56 @@ class RecommendationResponse(BaseModel):
     score: float = Field(..., description="Recommendation score (0-1)")
     reason: str = Field(..., description="Explanation for why this event was recommended")
 
+class BatchRecommendationRequest(BaseModel):
+    user_ids: List[str] = Field(..., description="Users to generate recommendations for")
+    limit: Optional[int] = Field(None, description="Maximum recommendations per user", ge=1)
+
+class UserRecommendations(BaseModel):
+    user_id: str = Field(..., description="User the recommendations are for")
+    recommendations: List[RecommendationResponse] = Field(..., description="Recommended events, best first")
+
+class BatchRecommendationResponse(BaseModel):
+    results: List[UserRecommendations] = Field(..., description="Recommendations for every known user")
+    missing_user_ids: List[str] = Field(default_factory=list, description="Requested users that were not found")
+
+class EventDeltaRequest(BaseModel):
+    upserts: List[Event] = Field(default_factory=list, description="Events to add or replace by event_id")
+    deletes: List[str] = Field(default_factory=list, description="IDs of events to remove")
+
+    @field_validator("upserts")
+    @classmethod
+    def tags_fit_the_csv(cls, upserts: List[Event]) -> List[Event]:
+        # Tags are stored semicolon separated, so these would not survive a reload
+        for event in upserts:
+            for tag in event.tags:
+                if not tag or ";" in tag:
+                    raise ValueError(f"{event.event_id}: tags must be non-empty and must not contain ';'")
+        return upserts
+
+class UserPatch(BaseModel):
+    name: Optional[str] = Field(None, description="User's name (required for a new user)")
+    email: Optional[str] = Field(None, description="User's email address (required for a new user)")
+    age: Optional[int] = Field(None, description="User's age")
+    location: Optional[str] = Field(None, description="User's location")
+    created_at: Optional[datetime] = Field(None, description="When the user was created")
+    categories: Optional[List[str]] = Field(None, description="Categories the user is interested in")
+
+class DeltaAccepted(BaseModel):
+    accepted: int = Field(..., description="Delta records accepted in this request")
+    pending: int = Field(..., description="Accepted records not yet applied")
+
 class EventRating(BaseModel):
     user_id: str = Field(..., description="User who rated the event")
     event_id: str = Field(..., description="Event that was rated")
     rating: float = Field(..., description="Rating value", ge=1, le=5)
     review: Optional[str] = Field(None, description="Optional review text")
-    created_at: datetime = Field(default_factory=datetime.now) 
\ No newline at end of file
+    created_at: datetime = Field(default_factory=datetime.now)
+
+class RatingsAccepted(BaseModel):
+    accepted: int = Field(..., description="Ratings accepted in this request")
+    queued: int = Field(..., description="Ratings waiting to be flushed")
+
+class EventRatingSummary(BaseModel):
+    event_id: str = Field(..., description="Event the ratings are for")
+    count: int = Field(..., description="Number of ratings received")
+    mean: Optional[float] = Field(None, description="Mean of the ratings received")
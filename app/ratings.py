@@ -0,0 +1,332 @@
+"""
+Rating ingestion
+POST /ratings only puts EventRating records on a bounded in-memory queue, so
+bursts never wait on disk. A background flusher appends the queue in batches
+to an append-only JSONL log, and per-event aggregates (count, sum) are
+updated in O(1) per rating by tailing that log. Tailing rather than counting
+what this process flushed keeps the aggregates of every worker process that
+shares the log in agreement.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .columnar import EventColumns, insert_stable
+from .models import EventRating
+
+logger = logging.getLogger(__name__)
+
+
+class TieRank(NamedTuple):
+    """The tie-break order of one catalog version at one aggregate version"""
+    columns: EventColumns
+    version: int
+    # Sort key of every position: minus its mean rating, 0 when unrated
+    keys: np.ndarray
+    # Positions by (key, position), and their keys in that order
+    order: np.ndarray
+    sorted_keys: np.ndarray
+    # Rank of every position in order, None while no event is rated
+    rank: Optional[np.ndarray]
+
+
+class RatingAggregates:
+    """
+    Running count and sum of the ratings of every event, plus the tie-break
+    rank the recommendation engine derives from them. The rank is kept for
+    the latest catalog version and updated by the flusher after every batch,
+    moving only the events rated since.
+    """
+
+    def __init__(self):
+        # event_id -> [count, sum of ratings]
+        self._stats: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        # Bumped by every batch of updates, so derived ranks know when to refresh
+        self.version = 0
+        # Events rated since the rank was last updated; None after a reset
+        self._changed: Optional[Set[str]] = set()
+        self._positions: Optional[Tuple[EventColumns, Dict[str, int]]] = None
+        self._ties: Optional[TieRank] = None
+        # Serializes rank updates; readers never take this lock
+        self._rank_lock = threading.Lock()
+        self._listeners: List[Callable[[EventColumns, np.ndarray], None]] = []
+
+    def add_listener(self, listener: Callable[[EventColumns, np.ndarray], None]):
+        """Register a callback run with every new tie rank, e.g. to derive data from it"""
+        self._listeners.append(listener)
+
+    def add_many(self, ratings: Sequence[Tuple[str, float]]):
+        """Fold (event_id, rating) pairs into the aggregates"""
+        if not ratings:
+            return
+        with self._lock:
+            for event_id, rating in ratings:
+                entry = self._stats.get(event_id)
+                if entry is None:
+                    self._stats[event_id] = [1, rating]
+                else:
+                    entry[0] += 1
+                    entry[1] += rating
+                if self._changed is not None:
+                    self._changed.add(event_id)
+            self.version += 1
+
+    def add(self, event_id: str, rating: float):
+        self.add_many([(event_id, rating)])
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._changed = None
+            self.version += 1
+
+    def get(self, event_id: str) -> Tuple[int, Optional[float]]:
+        """(count, mean) of the ratings received for an event"""
+        entry = self._stats.get(event_id)
+        if entry is None:
+            return 0, None
+        count, total = entry
+        return int(count), total / count
+
+    def __len__(self) -> int:
+        return len(self._stats)
+
+    def tie_rank(self, columns: EventColumns) -> Optional[np.ndarray]:
+        """
+        Rank of every event position by (highest mean rating, position), used
+        to order events with equal scores. Events without received ratings keep
+        catalog order after the rated ones. None when no event of this catalog
+        has been rated, so rankings stay positional.
+        """
+        ties = self._ties
+        if ties is None or ties.columns is not columns or ties.version != self.version:
+            # Normally done already by the flusher or when the catalog version
+            # was published, so requests only read the result
+            ties = self.refresh_rank(columns)
+        return ties.rank
+
+    def refresh_rank(self, columns: Optional[EventColumns] = None) -> Optional[TieRank]:
+        """
+        Bring the tie-break rank of columns, by default the catalog version
+        ranked last, up to date. The rank of the same catalog version is
+        updated in place of a full sort: only the events rated since are
+        moved. Returns None when nothing was ranked yet.
+        """
+        with self._rank_lock:
+            ties = self._ties
+            if columns is None:
+                if ties is None:
+                    return None
+                columns = ties.columns
+            with self._lock:
+                version = self.version
+                if ties is not None and ties.columns is columns and ties.version == version:
+                    return ties
+                changed, self._changed = self._changed, set()
+                incremental = ties is not None and ties.columns is columns and \
+                    changed is not None
+                stats = {event_id: tuple(self._stats[event_id]) for event_id in changed} \
+                    if incremental else {event_id: tuple(entry)
+                                         for event_id, entry in self._stats.items()}
+
+            # Positions are only looked up once some event was rated
+            positions = self._event_positions(columns) if stats else {}
+            rated_positions, rated_means = [], []
+            for event_id, (count, total) in stats.items():
+                position = positions.get(event_id)
+                if position is not None:
+                    rated_positions.append(position)
+                    rated_means.append(total / count)
+            moved = np.array(rated_positions, dtype=np.int64)
+            means = np.array(rated_means, dtype=np.float64)
+            if incremental:
+                ties = self._moved(ties, version, moved, means)
+            else:
+                keys = np.zeros(len(columns), dtype=np.float64)
+                keys[moved] = -means
+                order = np.argsort(keys, kind="stable")
+                ties = self._ranked(columns, version, keys, order, keys[order], len(moved) > 0)
+            self._ties = ties
+            if ties.rank is not None:
+                for listener in self._listeners:
+                    listener(columns, ties.rank)
+            return ties
+
+    def _moved(self, ties: TieRank, version: int, moved: np.ndarray,
+               means: np.ndarray) -> TieRank:
+        """ties with the events at positions moved to their new means"""
+        if not len(moved):
+            return ties._replace(version=version)
+        keys = ties.keys.copy()
+        keys[moved] = -means
+        stays = np.ones(len(keys), dtype=bool)
+        stays[moved] = False
+        kept = stays[ties.order]
+        order, sorted_keys = insert_stable(ties.order[kept], ties.sorted_keys[kept],
+                                           moved, keys[moved])
+        return self._ranked(ties.columns, version, keys, order, sorted_keys, True)
+
+    @staticmethod
+    def _ranked(columns: EventColumns, version: int, keys: np.ndarray, order: np.ndarray,
+                sorted_keys: np.ndarray, rated: bool) -> TieRank:
+        rank = None
+        if rated:
+            rank = np.empty(len(columns), dtype=np.int64)
+            rank[order] = np.arange(len(columns), dtype=np.int64)
+        return TieRank(columns, version, keys, order, sorted_keys, rank)
+
+    def _event_positions(self, columns: EventColumns) -> Dict[str, int]:
+        """event_id -> position for a catalog version, built once per version"""
+        cached = self._positions
+        if cached is not None and cached[0] is columns:
+            return cached[1]
+        positions: Dict[str, int] = {}
+        for position, event_id in enumerate(columns.event_ids.tolist()):
+            positions.setdefault(event_id, position)
+        self._positions = (columns, positions)
+        return positions
+
+    def stats(self) -> dict:
+        return {"rated_events": len(self._stats), "version": self.version}
+
+
+class RatingLog:
+    """Append-only JSONL file of ratings, one EventRating per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        # Bytes of the log already folded into the aggregates
+        self.offset = 0
+
+    def append(self, ratings: Sequence[EventRating]):
+        if not ratings:
+            return
+        data = "".join(rating.model_dump_json() + "\n" for rating in ratings)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            # Several worker processes may append to the same log
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                file.write(data)
+                file.flush()
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+    def read_new(self) -> Optional[List[Tuple[str, float]]]:
+        """
+        (event_id, rating) of the complete lines appended since the last call.
+        Returns None when the log was truncated and must be read from the start.
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return []
+        if size < self.offset:
+            self.offset = 0
+            return None
+        if size == self.offset:
+            return []
+
+        with open(self.path, "rb") as file:
+            file.seek(self.offset)
+            data = file.read(size - self.offset)
+        # A line being written by another process is picked up next time
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+
+        ratings = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                ratings.append((record["event_id"], float(record["rating"])))
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Skipping malformed rating in %s: %r", self.path, line[:200])
+        return ratings
+
+
+class RatingIngestor:
+    """
+    Bounded queue of accepted ratings and its flusher. offer() never blocks;
+    refresh() has the data sources' contract and is driven by a BackgroundReloader.
+    """
+
+    def __init__(self, log: RatingLog, aggregates: RatingAggregates, capacity: int):
+        self.log = log
+        self.aggregates = aggregates
+        self.capacity = capacity
+        self._queue: Deque[EventRating] = deque()
+        self._lock = threading.Lock()
+        # Serializes flushes, including the final one at shutdown
+        self._flush_lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.flush_batches = 0
+        self.flush_errors = 0
+
+    def offer(self, ratings: Sequence[EventRating]) -> bool:
+        """Queue all of ratings, or none of them if the queue lacks room"""
+        with self._lock:
+            if len(self._queue) + len(ratings) > self.capacity:
+                self.rejected += len(ratings)
+                return False
+            self._queue.extend(ratings)
+            self.accepted += len(ratings)
+            return True
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Flush the queue to the log, then fold new log lines into the aggregates"""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._queue)
+                self._queue.clear()
+            if batch:
+                try:
+                    self.log.append(batch)
+                except OSError:
+                    # Put the batch back in front, in order, and retry on the next flush
+                    self.flush_errors += 1
+                    with self._lock:
+                        self._queue.extendleft(reversed(batch))
+                    logger.exception("Failed to write %d ratings to %s", len(batch), self.log.path)
+                    return False
+                self.flushed += len(batch)
+                self.flush_batches += 1
+
+            ratings = self.log.read_new()
+            if ratings is None:
+                # The log was truncated: rebuild the aggregates from what is left
+                self.aggregates.reset()
+                ratings = self.log.read_new() or []
+            self.aggregates.add_many(ratings)
+            # Moves the newly rated events in the tie-break rank here, off the request path
+            self.aggregates.refresh_rank()
+            return bool(batch)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queued,
+            "capacity": self.capacity,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "flush_batches": self.flush_batches,
+            "flush_errors": self.flush_errors,
+            **self.aggregates.stats(),
+        }
@@ -1,53 +1,514 @@
-from typing import List
+import heapq
+import threading
+from itertools import islice
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .columnar import ColumnsSplice, EventColumns
 from .models import Event, UserPreferences, RecommendationResponse
+from .ratings import RatingAggregates
+from .similarity import TfidfIndex, top_k_positions
+
+SCORING_MODES = ("category", "tfidf")
+
+
+class RankedRecommendations(NamedTuple):
+    """
+    A recommendation list as catalog positions, scores and reasons, without
+    Event objects. Responses are encoded from the catalog's pre-encoded
+    events, and to_responses builds the pydantic models when needed.
+    """
+    positions: List[int]
+    scores: List[float]
+    reasons: List[str]
+
+
+class CategoryIndex:
+    """
+    Inverted index from normalized (lowercased) category to event positions.
+    Built once per catalog version so a request only touches the events in
+    the user's categories.
+    """
+
+    def __init__(self, source: Sequence[Event], base: Optional["CategoryIndex"] = None,
+                 splice: Optional[ColumnsSplice] = None):
+        # The object the index was requested for, used as the cache identity
+        self.source = source
+        self.columns = source if isinstance(source, EventColumns) else EventColumns.from_events(source)
+
+        # Interned categories that only differ in case share one normalized code
+        self.vocabulary: Dict[str, int] = {}
+        remap = np.array([self.vocabulary.setdefault(category.lower(), len(self.vocabulary))
+                          for category in self.columns.categories], dtype=np.int32)
+        # Normalized category code of every event, by position; also the
+        # one-hot column used for batch scoring
+        self.category_codes: np.ndarray = (remap[self.columns.category_codes]
+                                           if len(remap) else np.zeros(0, dtype=np.int32))
+
+        # Ascending event positions for every normalized category
+        if base is not None:
+            # Spliced from base's catalog: only the upserted events are placed
+            self.positions: Dict[str, np.ndarray] = splice.patch_groups(
+                base.positions, [[self.category_of(position).lower()]
+                                 for position in splice.added.tolist()])
+        else:
+            order = np.argsort(self.category_codes, kind="stable")
+            counts = np.bincount(self.category_codes, minlength=len(self.vocabulary))
+            ends = np.cumsum(counts)
+            self.positions = {
+                category: order[ends[code] - counts[code]:ends[code]]
+                for category, code in self.vocabulary.items()
+                if counts[code]
+            }
+        # TF-IDF vectors, only built when the engine scores by similarity
+        self.tfidf: Optional[TfidfIndex] = None
+        # (tie rank, positions in rank order, positions of every category in
+        # rank order), derived once per tie rank
+        self.tie_groups: Optional[Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]] = None
+
+    def category_of(self, position: int) -> str:
+        """Category of the event at position, as stored"""
+        return self.columns.categories[self.columns.category_codes[position]]
+
+    def codes_for(self, categories: Set[str]) -> np.ndarray:
+        """Normalized codes of the given categories that exist in the catalog"""
+        return np.array([self.vocabulary[category] for category in categories
+                         if category in self.vocabulary], dtype=np.int32)
+
 
 class ContentBasedRecommendationEngine:
     """
-    Simple content-based recommendation engine that matches users with events
-    based on category matching only.
+    Content-based recommendation engine.
+    "category" scoring (the default) matches users with events on category only;
+    "tfidf" scoring ranks events by the cosine similarity of their category,
+    tags and description with the user's interests.
+    Events with equal scores are ordered by their mean received rating when
+    rating aggregates are given, then by catalog position.
     """
-    
+
+    # Indexes kept per events list: the live catalog plus the one being replaced
+    MAX_CACHED_INDEXES = 2
+
+    # Upper bound on users x events score cells materialized at once in batch mode
+    BATCH_CHUNK_CELLS = 4_000_000
+
+    # Events scanned per step when filling results with non-matching events
+    FILL_CHUNK_SIZE = 4096
+
+    def __init__(self, scoring: str = "category", ratings: Optional[RatingAggregates] = None):
+        if scoring not in SCORING_MODES:
+            raise ValueError(f"Unknown scoring mode {scoring!r}, expected one of {SCORING_MODES}")
+        self.scoring = scoring
+        self.ratings = ratings
+        self._indexes: Dict[int, CategoryIndex] = {}
+        self._index_lock = threading.Lock()
+
+    def build_index(self, events: Sequence[Event]) -> CategoryIndex:
+        """Build and cache the category index for an events list or EventColumns"""
+        index = CategoryIndex(events)
+        if self.scoring == "tfidf":
+            index.tfidf = TfidfIndex(index.columns)
+        return self._cache_index(events, index)
+
+    def patch_index(self, events: EventColumns, base_events: Sequence[Event],
+                    splice: ColumnsSplice) -> CategoryIndex:
+        """
+        build_index for a catalog spliced from base_events by deltas, patching
+        the index of base_events when it is cached
+        """
+        base = self._indexes.get(id(base_events))
+        if base is None or base.source is not base_events:
+            return self.build_index(events)
+        index = CategoryIndex(events, base, splice)
+        if self.scoring == "tfidf":
+            index.tfidf = (TfidfIndex.patched(base.tfidf, splice) if base.tfidf is not None
+                           else TfidfIndex(index.columns))
+        return self._cache_index(events, index)
+
+    def _cache_index(self, events: Sequence[Event], index: CategoryIndex) -> CategoryIndex:
+        with self._index_lock:
+            self._indexes[id(events)] = index
+            while len(self._indexes) > self.MAX_CACHED_INDEXES:
+                # Dicts keep insertion order, so the first key is the oldest
+                del self._indexes[next(iter(self._indexes))]
+        return index
+
+    def get_index(self, events: Sequence[Event]) -> CategoryIndex:
+        """Return the cached category index for events, building it if needed"""
+        index = self._indexes.get(id(events))
+        # The identity check guards against a recycled id() of a dropped list
+        if index is None or index.source is not events:
+            index = self.build_index(events)
+        return index
+
+    def tie_rank(self, index: CategoryIndex) -> Optional[np.ndarray]:
+        """Tie-break rank of every event from the rating aggregates, None for catalog order"""
+        if self.ratings is None:
+            return None
+        return self.ratings.tie_rank(index.columns)
+
+    @staticmethod
+    def normalize_categories(preferences: UserPreferences) -> Set[str]:
+        """Lowercased set of the user's preferred categories"""
+        return {category.lower() for category in preferences.categories}
+
     def calculate_category_score(self, event: Event, preferences: UserPreferences) -> float:
         """Calculate score based on category matching"""
         # Check if event category matches any of user's preferred categories
-        event_category_lower = event.category.lower()
-        user_categories_lower = [cat.lower() for cat in preferences.categories]
-        
-        if event_category_lower in user_categories_lower:
+        if event.category.lower() in self.normalize_categories(preferences):
             return 1.0
         return 0.0
-    
+
     def generate_explanation(self, event: Event, preferences: UserPreferences, score: float) -> str:
         """Generate human-readable explanation for the recommendation"""
+        return self.explain_category(event.category, score)
+
+    @staticmethod
+    def explain_category(category: str, score: float) -> str:
+        """Explanation for category scoring, from the event's category alone"""
         if score > 0:
-            return f"This event matches your interest in {event.category}."
+            return f"This event matches your interest in {category}."
         else:
             return "This event is in a different category from your preferences."
-    
-    def get_recommendations(self, preferences: UserPreferences, events: List[Event], 
-                          limit: int = 10) -> List[RecommendationResponse]:
+
+    @staticmethod
+    def explain_similarity(category: str, shared_terms: List[str]) -> str:
+        """Explanation for similarity scoring, naming the strongest shared terms"""
+        if shared_terms:
+            return f"This event's {category} topics match your interests: {', '.join(shared_terms[:3])}."
+        return "This event is not related to your interests."
+
+    def _explain(self, index: CategoryIndex, profile, positions: List[int],
+                 scores: List[float]) -> RankedRecommendations:
+        """
+        Reasons for ranked (position, score) pairs, read from the category
+        column so no Event is built. profile is the user's TF-IDF profile in
+        similarity mode, used to explain the scores.
+        """
+        if self.scoring == "tfidf":
+            reasons = [self.explain_similarity(
+                index.category_of(position),
+                index.tfidf.shared_terms(position, profile) if score > 0 else [])
+                for position, score in zip(positions, scores)]
+        else:
+            reasons = [self.explain_category(index.category_of(position), score)
+                       for position, score in zip(positions, scores)]
+        return RankedRecommendations(positions, scores, reasons)
+
+    @staticmethod
+    def to_responses(events: Sequence[Event], ranked: RankedRecommendations,
+                     materialized: Optional[Dict[int, Event]] = None
+                     ) -> List[RecommendationResponse]:
+        """
+        Response objects of a ranking over events. Events shared between
+        rankings are built once when the same materialized dict is passed.
+        """
+        if materialized is None:
+            materialized = {}
+        recommendations = []
+        for position, score, reason in zip(*ranked):
+            event = materialized.get(position)
+            if event is None:
+                event = materialized[position] = events[position]
+            recommendations.append(RecommendationResponse(event=event, score=score, reason=reason))
+        return recommendations
+
+    @staticmethod
+    def _top_similar(scores: np.ndarray, limit: int,
+                     candidates: Optional[np.ndarray] = None,
+                     tie_rank: Optional[np.ndarray] = None) -> Tuple[List[int], List[float]]:
+        """
+        Positions and rounded scores of the top `limit` events by similarity
+        score, ties broken by tie_rank or catalog position.
+        When candidates is given, scores[i] belongs to the event at candidates[i].
+        """
+        ties = tie_rank if tie_rank is None or candidates is None else tie_rank[candidates]
+        top = top_k_positions(scores, limit, ties)
+        top_scores = [round(float(score), 4) for score in scores[top].tolist()]
+        if candidates is not None:
+            top = candidates[top]
+        return top.tolist(), top_scores
+
+    def _ranked_candidates(self, index: CategoryIndex, user_categories: Set[str],
+                           candidates: Optional[np.ndarray] = None,
+                           tie_rank: Optional[np.ndarray] = None
+                           ) -> Iterator[Tuple[int, float]]:
         """
-        Generate personalized event recommendations for a user based on category matching
+        Yield (position, score) in ranking order: events in the user's categories
+        first, then the remaining events, each group in catalog order, or in
+        tie_rank order when given.
+        candidates, ascending positions that passed the request's filters,
+        restricts the ranking to those events.
         """
-        if not events:
+        if tie_rank is not None:
+            yield from self._ranked_by_tie_rank(index, user_categories, candidates, tie_rank)
+            return
+
+        if candidates is not None:
+            # Cost is proportional to the filtered set, not the catalog
+            matches = np.isin(index.category_codes[candidates],
+                              index.codes_for(user_categories))
+            for position in candidates[matches].tolist():
+                yield position, 1.0
+            for position in candidates[~matches].tolist():
+                yield position, 0.0
+            return
+
+        # Every matching event scores 1.0, so ranking among them is by position.
+        # Merging the per-category position arrays with a heap yields them in
+        # that order, and the consumer stops after `limit` items.
+        matched = [index.positions[category] for category in user_categories
+                   if category in index.positions]
+        for position in heapq.merge(*matched):
+            yield int(position), 1.0
+
+        # Non-matching events are only scanned, chunk by chunk, when the
+        # matches did not fill `limit`
+        user_codes = index.codes_for(user_categories)
+        codes = index.category_codes
+        for start in range(0, len(codes), self.FILL_CHUNK_SIZE):
+            chunk = codes[start:start + self.FILL_CHUNK_SIZE]
+            for offset in np.flatnonzero(~np.isin(chunk, user_codes)).tolist():
+                yield start + offset, 0.0
+
+    def _ranked_by_tie_rank(self, index: CategoryIndex, user_categories: Set[str],
+                            candidates: Optional[np.ndarray],
+                            tie_rank: np.ndarray) -> Iterator[Tuple[int, float]]:
+        """_ranked_candidates when ties are broken by rating: each group in rank order"""
+        user_codes = index.codes_for(user_categories)
+        if candidates is not None:
+            # Cost is proportional to the filtered set, not the catalog
+            matches = np.isin(index.category_codes[candidates], user_codes)
+            matched = candidates[matches]
+            for position in matched[np.argsort(tie_rank[matched])].tolist():
+                yield position, 1.0
+            rest = candidates[~matches]
+            for position in rest[np.argsort(tie_rank[rest])].tolist():
+                yield position, 0.0
+            return
+
+        # Each category's positions are kept in rank order, so merging them by
+        # rank yields the matches lazily, as in catalog order
+        order, groups = self.tie_groups(index, tie_rank)
+        matched = [groups[category] for category in user_categories if category in groups]
+        merged = matched[0] if len(matched) == 1 else heapq.merge(*matched,
+                                                                   key=tie_rank.__getitem__)
+        for position in merged:
+            yield int(position), 1.0
+
+        # Non-matching events are only scanned, in rank order, when the matches
+        # did not fill `limit`
+        codes = index.category_codes
+        for start in range(0, len(order), self.FILL_CHUNK_SIZE):
+            chunk = order[start:start + self.FILL_CHUNK_SIZE]
+            for position in chunk[~np.isin(codes[chunk], user_codes)].tolist():
+                yield position, 0.0
+
+    def prepare_ties(self, events: Sequence[Event], tie_rank: np.ndarray):
+        """Derive the tie-rank order of the cached index of events ahead of requests"""
+        index = self._indexes.get(id(events))
+        if self.scoring == "category" and index is not None and index.source is events:
+            self.tie_groups(index, tie_rank)
+
+    @staticmethod
+    def tie_groups(index: CategoryIndex,
+                   tie_rank: np.ndarray) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        (positions in tie_rank order, positions of every category in that
+        order) for an index, computed once per tie rank
+        """
+        cached = index.tie_groups
+        if cached is not None and cached[0] is tie_rank:
+            return cached[1], cached[2]
+        order = np.empty_like(tie_rank)
+        order[tie_rank] = np.arange(len(tie_rank), dtype=tie_rank.dtype)
+        codes = index.category_codes[order]
+        if len(index.vocabulary) <= np.iinfo(np.int16).max:
+            # Small integer keys sort in linear time
+            codes = codes.astype(np.int16)
+        by_category = order[np.argsort(codes, kind="stable")]
+        counts = np.bincount(codes, minlength=len(index.vocabulary))
+        ends = np.cumsum(counts)
+        groups = {
+            category: by_category[ends[code] - counts[code]:ends[code]]
+            for category, code in index.vocabulary.items()
+            if counts[code]
+        }
+        index.tie_groups = (tie_rank, order, groups)
+        return order, groups
+
+    def get_recommendations(self, preferences: UserPreferences, events: Sequence[Event],
+                          limit: int = 10,
+                          candidates: Optional[np.ndarray] = None) -> List[RecommendationResponse]:
+        """
+        Generate personalized event recommendations for a user based on category matching.
+        events may be a list of Event or an EventColumns; only the returned
+        events are materialized. candidates optionally restricts scoring to
+        the given ascending event positions, e.g. the result of a FilterIndex.
+        """
+        return self.to_responses(events, self.rank(preferences, events, limit, candidates))
+
+    def rank(self, preferences: UserPreferences, events: Sequence[Event], limit: int = 10,
+             candidates: Optional[np.ndarray] = None) -> RankedRecommendations:
+        """get_recommendations as positions, scores and reasons, building no Event"""
+        if not len(events) or limit <= 0:
+            return RankedRecommendations([], [], [])
+        if candidates is not None and not len(candidates):
+            return RankedRecommendations([], [], [])
+
+        index = self.get_index(events)
+        tie_rank = self.tie_rank(index)
+        if self.scoring == "tfidf":
+            # One sparse matrix-vector product scores the whole catalog
+            profile = index.tfidf.profile(preferences.categories)
+            scores = index.tfidf.scores(profile, candidates)
+            positions, top_scores = self._top_similar(scores, limit, candidates, tie_rank)
+            return self._explain(index, profile, positions, top_scores)
+
+        user_categories = self.normalize_categories(preferences)
+        ranked = self._ranked_candidates(index, user_categories, candidates, tie_rank)
+        positions, top_scores = [], []
+        for position, score in islice(ranked, limit):
+            positions.append(position)
+            top_scores.append(score)
+        return self._explain(index, None, positions, top_scores)
+
+    def get_recommendations_batch(self, preferences_list: List[UserPreferences],
+                                  events: Sequence[Event],
+                                  limit: int = 10) -> List[List[RecommendationResponse]]:
+        """
+        Generate recommendations for many users at once.
+        Returns one list per entry of preferences_list, identical to calling
+        get_recommendations for each user.
+        """
+        # Events shared by many users are materialized once per batch
+        materialized: Dict[int, Event] = {}
+        return [self.to_responses(events, ranked, materialized)
+                for ranked in self.rank_explained_batch(preferences_list, events, limit)]
+
+    def rank_explained_batch(self, preferences_list: List[UserPreferences],
+                             events: Sequence[Event], limit: int = 10,
+                             candidates: Optional[np.ndarray] = None
+                             ) -> List[RankedRecommendations]:
+        """
+        get_recommendations_batch as positions, scores and reasons, building
+        no Event. candidates optionally restricts every user to the same
+        filtered events, as in rank.
+        """
+        if not preferences_list:
             return []
-        
-        scored_events = []
-        
-        for event in events:
-            score = self.calculate_category_score(event, preferences)
-            explanation = self.generate_explanation(event, preferences, score)
-            
-            recommendation = RecommendationResponse(
-                event=event,
-                score=score,
-                reason=explanation
-            )
-            
-            scored_events.append(recommendation)
-        
-        # Sort by score (descending) and return top recommendations
-        # Events with matching categories will have score=1.0, others will have score=0.0
-        scored_events.sort(key=lambda x: x.score, reverse=True)
-        
-        return scored_events[:limit] 
\ No newline at end of file
+        if not len(events) or limit <= 0 or (candidates is not None and not len(candidates)):
+            return [RankedRecommendations([], [], []) for _ in preferences_list]
+
+        index = self.get_index(events)
+        return [self._explain(index, profile, positions, scores)
+                for positions, scores, profile
+                in self._rank_batch(index, preferences_list, limit, candidates)]
+
+    def rank_batch(self, preferences_list: List[UserPreferences], events: Sequence[Event],
+                   limit: int = 10) -> List[Tuple[List[int], List[float]]]:
+        """
+        Event positions and scores of get_recommendations_batch, without
+        reasons or response objects. explain_ranking turns one entry back
+        into a RankedRecommendations.
+        """
+        if not len(events) or limit <= 0:
+            return [([], []) for _ in preferences_list]
+        index = self.get_index(events)
+        return [(positions, scores) for positions, scores, _
+                in self._rank_batch(index, preferences_list, limit)]
+
+    def recommendations_from_ranking(self, preferences: UserPreferences, events: Sequence[Event],
+                                     positions: Sequence[int],
+                                     scores: Sequence[float]) -> List[RecommendationResponse]:
+        """Responses for a ranking computed earlier by rank_batch over the same events"""
+        return self.to_responses(events, self.explain_ranking(preferences, events, positions, scores))
+
+    def explain_ranking(self, preferences: UserPreferences, events: Sequence[Event],
+                        positions: Sequence[int],
+                        scores: Sequence[float]) -> RankedRecommendations:
+        """Reasons for a ranking computed earlier by rank_batch over the same events"""
+        index = self.get_index(events)
+        profile = index.tfidf.profile(preferences.categories) if self.scoring == "tfidf" else None
+        return self._explain(index, profile, list(positions), list(scores))
+
+    def _rank_batch(self, index: CategoryIndex, preferences_list: List[UserPreferences],
+                    limit: int, candidates: Optional[np.ndarray] = None
+                    ) -> Iterator[Tuple[List[int], List[float], object]]:
+        """Yield (positions, scores, TF-IDF profile or None) for every user, in order"""
+        tie_rank = self.tie_rank(index)
+        if self.scoring == "tfidf":
+            yield from self._similarity_rank_batch(index, preferences_list, limit, tie_rank,
+                                                   candidates)
+            return
+
+        event_codes = index.category_codes
+        n_events = len(index.columns)
+        if candidates is not None:
+            # Columns below are candidates; candidates[column] is the catalog position
+            event_codes = event_codes[candidates]
+            n_events = len(candidates)
+        k = min(limit, n_events)
+
+        # One-hot user x category matrix
+        user_matrix = np.zeros((len(preferences_list), len(index.vocabulary)), dtype=np.float32)
+        for row, preferences in enumerate(preferences_list):
+            user_matrix[row, index.codes_for(self.normalize_categories(preferences))] = 1.0
+
+        positions = np.arange(n_events, dtype=np.int64)
+        # Secondary sort key among equal scores; candidates are ascending, so
+        # their column order is their catalog order
+        if tie_rank is None:
+            ties = positions
+        else:
+            ties = tie_rank if candidates is None else tie_rank[candidates]
+        # Tie ranks are catalog-wide, so every key stays below the catalog size
+        stride = len(index.columns)
+        chunk_rows = max(1, self.BATCH_CHUNK_CELLS // n_events)
+
+        for start in range(0, len(preferences_list), chunk_rows):
+            chunk = user_matrix[start:start + chunk_rows]
+            # Every event has exactly one category, so user_matrix @ one_hot(events).T
+            # is a gather of the user's columns by event category code
+            scores = chunk[:, event_codes]
+
+            # Rank by (-score, tie rank) with a single integer key: scores are 0/1
+            # and ranks are below stride, so non-matching events sort after every
+            # matching one
+            keys = (1 - scores.astype(np.int64)) * stride + ties
+            if k < n_events:
+                top = np.argpartition(keys, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(positions, keys.shape)
+            top_keys = np.take_along_axis(keys, top, axis=1)
+            top = np.take_along_axis(top, np.argsort(top_keys, axis=1), axis=1)
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            if candidates is not None:
+                top = candidates[top]
+
+            for row_positions, row_scores in zip(top.tolist(), top_scores.tolist()):
+                yield row_positions, row_scores, None
+
+    def _similarity_rank_batch(self, index: CategoryIndex,
+                               preferences_list: List[UserPreferences], limit: int,
+                               tie_rank: Optional[np.ndarray] = None,
+                               candidates: Optional[np.ndarray] = None
+                               ) -> Iterator[Tuple[List[int], List[float], object]]:
+        """Similarity scoring for many users: one sparse matrix product per chunk of users"""
+        tfidf = index.tfidf
+        matrix = tfidf.matrix if candidates is None else tfidf.matrix[candidates]
+        n_events = matrix.shape[0]
+        chunk_rows = max(1, self.BATCH_CHUNK_CELLS // n_events)
+        for start in range(0, len(preferences_list), chunk_rows):
+            chunk = preferences_list[start:start + chunk_rows]
+            profiles = [tfidf.profile(preferences.categories) for preferences in chunk]
+            dense = np.zeros((len(chunk), tfidf.matrix.shape[1]), dtype=np.float32)
+            for row, profile in enumerate(profiles):
+                if profile is not None:
+                    dense[row, profile.indices] = profile.data
+            # (events x terms) @ (terms x users), transposed to one row per user
+            scores = np.asarray(matrix.dot(dense.T)).T
+            for row, profile in enumerate(profiles):
+                positions, top_scores = self._top_similar(scores[row], limit, candidates, tie_rank)
+                yield positions, top_scores, profile
@@ -0,0 +1,58 @@
+"""
+Background reloader
+Periodically asks data sources to refresh themselves so that file changes are
+picked up without any request ever waiting on a parse.
+"""
+
+import logging
+import os
+import threading
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FileSignature = Tuple[int, int]
+
+
+def file_signature(path: str) -> Optional[FileSignature]:
+    """Return a cheap (mtime_ns, size) signature used for change detection"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class BackgroundReloader:
+    """
+    Daemon thread that calls refresh() on every registered source at a fixed interval.
+    A source is any object with a refresh() method returning True when it reloaded.
+    """
+
+    def __init__(self, sources: List, interval: float):
+        self.sources = list(sources)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="data-reloader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for source in self.sources:
+                try:
+                    source.refresh()
+                except Exception:
+                    # Never let one bad reload kill the watcher thread
+                    logger.exception("Background refresh failed for %r", source)
@@ -0,0 +1,95 @@
+"""
+Data-source backends
+Events and users are read through repositories so the CSV files can be
+replaced by a real store; DATA_BACKEND selects "csv" or "sqlite".
+
+Events are always served from the resident columnar catalog, which needs the
+whole table anyway, so an EventRepository is what EventCatalog loads from,
+watches for changes and folds compacted deltas into. Users are only ever
+looked up one at a time, so a UserRepository is the lookup store itself.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Iterable, List, Optional, Tuple
+
+from .columnar import EventColumns
+from .deltas import DeltaLog
+from .models import Event, User, UserPreferences
+from .reloader import FileSignature
+
+
+DATA_BACKENDS = ("csv", "sqlite")
+
+
+class RepositoryError(Exception):
+    """Raised by a backend when its store cannot be read or written"""
+
+
+class EventRepository(ABC):
+    """Base event data behind the catalog"""
+
+    # Reported as the catalog's source, e.g. "csv"
+    name: str = ""
+    # Where the data lives, for logs
+    location: str = ""
+
+    @abstractmethod
+    def signature(self) -> Optional[FileSignature]:
+        """Cheap change signature; None while the data does not exist"""
+
+    @abstractmethod
+    def load_columns(self) -> EventColumns:
+        """Every event, in catalog order"""
+
+    @abstractmethod
+    def compact(self, records: List[dict]):
+        """Fold delta records into the base data, following the ordering rules of deltas.py"""
+
+    @abstractmethod
+    def events_in_categories(self, categories: Iterable[str],
+                             limit: Optional[int] = None) -> List[Event]:
+        """Events of the given categories (case-insensitive), in catalog order"""
+
+
+class UserRepository(ABC):
+    """O(1) lookup of users by user_id, with the data sources' refresh() contract"""
+
+    # Lookups do I/O, so async callers run them on a worker thread
+    lookups_block: bool = False
+
+    @property
+    @abstractmethod
+    def version(self) -> int:
+        """Changes whenever any user changes; part of the recommendation cache key"""
+
+    @abstractmethod
+    def get(self, user_id: str) -> Tuple[Optional[User], Optional[UserPreferences]]:
+        """Return (user, preferences) for user_id, or (None, None) if unknown"""
+
+    @abstractmethod
+    def __contains__(self, user_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @abstractmethod
+    def user_ids(self) -> List[str]:
+        """All known user IDs, in storage order"""
+
+    @abstractmethod
+    def refresh(self, force: bool = False) -> bool:
+        """Pick up changes to the underlying data; True when anything changed"""
+
+    @abstractmethod
+    def apply_deltas(self, records: List[dict]):
+        """Apply a batch of logged delta records"""
+
+    @abstractmethod
+    def compact_deltas(self, log: DeltaLog) -> int:
+        """Fold the logged deltas into the base data and truncate the log"""
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
@@ -0,0 +1,248 @@
+"""
+Pre-encoded JSON payloads
+The catalog only changes when its CSV does, so events are encoded to JSON once
+per catalog version and responses are assembled from those bytes.
+Recommendation responses are assembled the same way: each event's fragment
+plus its score and reason, encoded byte-for-byte like FastAPI would encode the
+RecommendationResponse models, without building or validating them.
+"""
+
+import hashlib
+import json
+import math
+from array import array
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .columnar import contiguous_runs
+from .models import Event
+from .recommendation_engine import RankedRecommendations
+
+try:
+    # Faster string encoding with the same output as encode_json
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# Approximate size of each chunk written to a streaming response
+STREAM_CHUNK_BYTES = 64 * 1024
+# Positions converted to Python ints at a time while streaming
+STREAM_POSITIONS_SLICE = 4096
+
+
+def encode_json(value) -> bytes:
+    """Encode a JSON-compatible value exactly like FastAPI's JSONResponse"""
+    return json.dumps(
+        value,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def encode_string(value: str) -> bytes:
+    """JSON bytes of a string, identical to encode_json(value)"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.encoder.encode_basestring(value).encode("utf-8")
+
+
+def encode_score(score: float) -> bytes:
+    """JSON bytes of a score validated as a float, identical to encode_json(float(score))"""
+    score = float(score)
+    if not math.isfinite(score):
+        raise ValueError(f"Out of range float values are not JSON compliant: {score!r}")
+    # The float repr is what the json module writes, while orjson spells exponents differently
+    return float.__repr__(score).encode("ascii")
+
+
+def encode_event(event: Event) -> bytes:
+    """JSON bytes of one event, as it appears inside a response"""
+    return encode_json(event.model_dump(mode="json"))
+
+
+class EncodedEvents:
+    """
+    The whole catalog as one JSON array plus the byte range of every event.
+    Pages are slices of the same buffer, so paginating never re-encodes.
+    """
+
+    def __init__(self, events: Sequence[Event]):
+        parts = [b"["]
+        starts = array("q")
+        ends = array("q")
+        position = 1
+        for i, event in enumerate(events):
+            if i:
+                parts.append(b",")
+                position += 1
+            fragment = encode_event(event)
+            parts.append(fragment)
+            starts.append(position)
+            position += len(fragment)
+            ends.append(position)
+        parts.append(b"]")
+
+        body = b"".join(parts)
+        # Strong validator: changes whenever any encoded byte changes
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self._init(body, 0, len(body), starts, ends, digest)
+
+    @classmethod
+    def _from_body(cls, body: bytes, starts, ends) -> "EncodedEvents":
+        encoded = cls.__new__(cls)
+        encoded._init(body, 0, len(body), starts, ends, None)
+        return encoded
+
+    @classmethod
+    def from_buffer(cls, buffer, base: int, size: int, starts, ends,
+                    digest: str) -> "EncodedEvents":
+        """Wrap an already encoded body, e.g. a region of a memory-mapped snapshot"""
+        encoded = cls.__new__(cls)
+        encoded._init(buffer, base, size, starts, ends, digest)
+        return encoded
+
+    def _init(self, buffer, base: int, size: int, starts, ends, digest: Optional[str]):
+        self.buffer = buffer
+        self.base = base
+        self.size = size
+        self.starts = starts
+        self.ends = ends
+        self.count = len(starts)
+        self._digest = digest
+
+    @property
+    def digest(self) -> str:
+        """Strong validator of the body, computed on first use for spliced payloads"""
+        if self._digest is None:
+            self._digest = hashlib.blake2b(self.body, digest_size=16).hexdigest()
+        return self._digest
+
+    @property
+    def body(self) -> bytes:
+        """The full JSON array"""
+        if self.base == 0 and isinstance(self.buffer, bytes) and self.size == len(self.buffer):
+            return self.buffer
+        return self.buffer[self.base:self.base + self.size]
+
+    def fragment(self, position: int) -> bytes:
+        """Encoded JSON of the event at position"""
+        return self.buffer[self.base + int(self.starts[position]):self.base + int(self.ends[position])]
+
+    def page(self, offset: int, limit: Optional[int]) -> Tuple[bytes, str]:
+        """Return (JSON array bytes, strong ETag) for events[offset:offset + limit]"""
+        if offset == 0 and (limit is None or limit >= self.count):
+            return self.body, f'"{self.digest}"'
+
+        end = self.count if limit is None else min(self.count, offset + limit)
+        etag = f'"{self.digest}-{offset}-{limit if limit is not None else ""}"'
+        if offset >= end:
+            return b"[]", etag
+        start = self.base + int(self.starts[offset])
+        stop = self.base + int(self.ends[end - 1])
+        return b"[" + self.buffer[start:stop] + b"]", etag
+
+    def take(self, positions: Sequence[int]) -> "EncodedEvents":
+        """
+        New payload holding the events at positions, in that order, without
+        re-encoding: runs of consecutive events are copied as one slice.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = np.asarray(self.starts, dtype=np.int64)
+        ends = np.asarray(self.ends, dtype=np.int64)
+        parts = [b"["]
+        new_starts = []
+        new_ends = []
+        cursor = 1
+        for start, end in contiguous_runs(positions):
+            if cursor > 1:
+                parts.append(b",")
+                cursor += 1
+            first, last = int(starts[start]), int(ends[end - 1])
+            parts.append(self.buffer[self.base + first:self.base + last])
+            new_starts.append(starts[start:end] - first + cursor)
+            new_ends.append(ends[start:end] - first + cursor)
+            cursor += last - first
+        parts.append(b"]")
+        return self._from_body(
+            b"".join(parts),
+            np.concatenate(new_starts) if new_starts else starts[:0],
+            np.concatenate(new_ends) if new_ends else ends[:0],
+        )
+
+    def concat(self, other: "EncodedEvents") -> "EncodedEvents":
+        """New payload holding these events followed by other's"""
+        if not other.count:
+            return self
+        if not self.count:
+            return other
+        # Drop the closing and opening brackets and join the two arrays with a comma
+        body = self.body[:-1] + b"," + other.body[1:]
+        shift = self.size - 1
+        return self._from_body(
+            body,
+            np.concatenate((np.asarray(self.starts, dtype=np.int64),
+                            np.asarray(other.starts, dtype=np.int64) + shift)),
+            np.concatenate((np.asarray(self.ends, dtype=np.int64),
+                            np.asarray(other.ends, dtype=np.int64) + shift)),
+        )
+
+    def select(self, positions: Sequence[int]) -> bytes:
+        """JSON array of the events at positions, in the given order"""
+        return b"[" + b",".join(self.fragment(position) for position in positions) + b"]"
+
+
+def encode_recommendations(encoded: EncodedEvents, ranked: RankedRecommendations) -> bytes:
+    """JSON array of the RecommendationResponse objects of a ranking over encoded's events"""
+    return b"[" + b",".join([
+        b'{"event":' + encoded.fragment(position) + b',"score":' + encode_score(score)
+        + b',"reason":' + encode_string(reason) + b"}"
+        for position, score, reason in zip(*ranked)
+    ]) + b"]"
+
+
+def encode_batch_recommendations(encoded: EncodedEvents,
+                                 results: Sequence[Tuple[str, RankedRecommendations]],
+                                 missing_user_ids: List[str]) -> bytes:
+    """JSON of a BatchRecommendationResponse, from (user_id, ranking) pairs"""
+    return b'{"results":[' + b",".join([
+        b'{"user_id":' + encode_string(user_id) + b',"recommendations":'
+        + encode_recommendations(encoded, ranked) + b"}"
+        for user_id, ranked in results
+    ]) + b'],"missing_user_ids":[' + b",".join(map(encode_string, missing_user_ids)) + b"]}"
+
+
+def iter_ndjson(encoded: EncodedEvents,
+                positions: Optional[np.ndarray] = None) -> Iterator[bytes]:
+    """
+    Yield the catalog, or only the events at positions, as newline-delimited
+    JSON. Lines are grouped into ~64KB chunks, so no Event objects or full
+    document are ever built, and positions are read a slice at a time as
+    the response is consumed.
+    """
+    count = encoded.count if positions is None else len(positions)
+
+    buffer = bytearray()
+    for start in range(0, count, STREAM_POSITIONS_SLICE):
+        end = min(start + STREAM_POSITIONS_SLICE, count)
+        chunk = range(start, end) if positions is None else positions[start:end].tolist()
+        for position in chunk:
+            buffer += encoded.fragment(position)
+            buffer += b"\n"
+            if len(buffer) >= STREAM_CHUNK_BYTES:
+                yield bytes(buffer)
+                buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluate an If-None-Match header against an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
@@ -0,0 +1,281 @@
+"""
+Shared catalog for multi-process serving
+One loader process compiles the CSVs into binary snapshots and publishes them
+in a directory; worker processes never parse the CSVs and only memory-map the
+published snapshots read-only, so every worker shares the same pages through
+the OS page cache.
+
+The directory holds versioned snapshot files plus manifest.json, which names
+the current version and its events and users snapshots. The manifest is
+replaced atomically, so workers move from one version to the next together
+and always see a matching pair.
+
+Logged deltas are published between compactions without recompiling the
+CSVs: event records are spliced into a copy of the published events snapshot
+and also written next to it, so workers can patch their indexes instead of
+rebuilding them; user records are published as an overrides file applied
+on top of the users snapshot.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+from .deltas import DeltaLog, compact_csv
+from .reloader import file_signature, FileSignature
+from .snapshot import (
+    SnapshotFile, read_events_snapshot, write_event_columns, write_events_snapshot,
+    write_users_snapshot
+)
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+# Snapshot generations kept on disk: the current one and the one being replaced.
+# Older files may still be mapped by a worker; unlinking them is safe on POSIX.
+KEEP_VERSIONS = 2
+
+
+class Manifest(NamedTuple):
+    version: int
+    events_path: str
+    users_path: str
+    events_source: FileSignature
+    users_source: FileSignature
+    # Logged records published on top of each source CSV, not yet folded into it
+    events_deltas: int = 0
+    users_deltas: int = 0
+    # Records spliced into the events snapshot of version events_delta_base to
+    # give this version's, when it was published that way
+    events_delta: Optional[str] = None
+    events_delta_base: int = 0
+    # Every record published on top of the users snapshot
+    users_overrides: Optional[str] = None
+
+    @property
+    def signature(self) -> FileSignature:
+        """The published version stands in for a file signature in change detection"""
+        return self.version, 0
+
+
+def read_manifest(directory: str) -> Optional[Manifest]:
+    """Return the current manifest of a shared directory, or None if nothing is published"""
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), "r", encoding="utf-8") as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as exc:
+        logger.warning("Unreadable manifest in %s: %s", directory, exc)
+        return None
+    return Manifest(
+        version=data["version"],
+        events_path=os.path.join(directory, data["events"]),
+        users_path=os.path.join(directory, data["users"]),
+        events_source=tuple(data["events_source"]),
+        users_source=tuple(data["users_source"]),
+        events_deltas=data.get("events_deltas", 0),
+        users_deltas=data.get("users_deltas", 0),
+        events_delta=_optional_path(directory, data.get("events_delta")),
+        events_delta_base=data.get("events_delta_base", 0),
+        users_overrides=_optional_path(directory, data.get("users_overrides")),
+    )
+
+
+def _optional_path(directory: str, name: Optional[str]) -> Optional[str]:
+    return os.path.join(directory, name) if name else None
+
+
+def _optional_name(path: Optional[str]) -> Optional[str]:
+    return os.path.basename(path) if path else None
+
+
+def read_records(path: str) -> List[dict]:
+    """Delta records of a published records file"""
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def _write_records(path: str, records: List[dict]):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".records-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.writelines(json.dumps(record, separators=(",", ":")) + "\n"
+                            for record in records)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _write_manifest(directory: str, manifest: Manifest):
+    data = {
+        "version": manifest.version,
+        "events": os.path.basename(manifest.events_path),
+        "users": os.path.basename(manifest.users_path),
+        "events_source": list(manifest.events_source),
+        "users_source": list(manifest.users_source),
+        "events_deltas": manifest.events_deltas,
+        "users_deltas": manifest.users_deltas,
+        "events_delta": _optional_name(manifest.events_delta),
+        "events_delta_base": manifest.events_delta_base,
+        "users_overrides": _optional_name(manifest.users_overrides),
+        "published_at": time.time(),
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".manifest-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, os.path.join(directory, MANIFEST_NAME))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+# (snapshot path, source signature, published records, records file)
+Published = Tuple[str, FileSignature, int, Optional[str]]
+
+
+class SharedDataPublisher:
+    """
+    The single loader: recompiles whichever CSV changed and publishes a new
+    version. Has the same refresh() contract as the data sources, so it can
+    be driven by a BackgroundReloader. Workers log deltas without applying
+    them; the publisher publishes the new records on every check and folds
+    the logs into the CSVs every compact_interval seconds (0: only on the
+    first publish and on forced ones).
+    """
+
+    def __init__(self, directory: str, events_csv: str, users_csv: str,
+                 events_delta: Optional[DeltaLog] = None, users_delta: Optional[DeltaLog] = None,
+                 compact_interval: float = 0.0):
+        self.directory = directory
+        self.events_csv = events_csv
+        self.users_csv = users_csv
+        self.events_delta = events_delta
+        self.users_delta = users_delta
+        self.compact_interval = compact_interval
+        self._lock = threading.Lock()
+        self._last_compaction = time.monotonic()
+        self.publish_count = 0
+
+    def refresh(self, force: bool = False) -> bool:
+        """Publish a new version if a source CSV or delta log changed; True when one was published"""
+        with self._lock:
+            if file_signature(self.events_csv) is None or file_signature(self.users_csv) is None:
+                return False
+            current = read_manifest(self.directory)
+            compact = force or current is None or (
+                self.compact_interval > 0 and
+                time.monotonic() - self._last_compaction >= self.compact_interval)
+            os.makedirs(self.directory, exist_ok=True)
+            version = current.version + 1 if current is not None else 1
+            started = time.perf_counter()
+
+            events = self._publish_events(current, version, force, compact)
+            users = self._publish_users(current, version, force, compact)
+            if compact:
+                self._last_compaction = time.monotonic()
+            if current is not None and events[:3] == (current.events_path, current.events_source,
+                                                      current.events_deltas) \
+                    and users == (current.users_path, current.users_source,
+                                  current.users_deltas, current.users_overrides):
+                return False
+
+            _write_manifest(self.directory, Manifest(
+                version, events[0], users[0], events[1], users[1], events[2], users[2],
+                events[3], current.version if events[3] else 0, users[3]))
+            self.publish_count += 1
+            logger.info("Published shared catalog version %d in %.3fs",
+                        version, time.perf_counter() - started)
+            self._remove_old_versions(version)
+            return True
+
+    def _fold(self, log: Optional[DeltaLog], csv_file: str, id_field: str,
+              compact: bool) -> List[dict]:
+        """Every logged record, folded into csv_file when compacting"""
+        if log is None:
+            return []
+        if not compact:
+            return log.read()
+        records: List[dict] = []
+
+        def fold(logged: List[dict]):
+            compact_csv(csv_file, id_field, logged)
+            records.extend(logged)
+
+        log.compact(fold)
+        return records
+
+    def _publish_events(self, current: Optional[Manifest], version: int, force: bool,
+                        compact: bool) -> Published:
+        from .catalog import apply_event_deltas
+
+        if force or current is None or current.events_source != file_signature(self.events_csv):
+            # First publish, or the CSV was replaced: compile it with every record folded in
+            self._fold(self.events_delta, self.events_csv, "event_id", True)
+            path = os.path.join(self.directory, f"events-{version}.snapshot")
+            write_events_snapshot(self.events_csv, path)
+            return path, file_signature(self.events_csv), 0, None
+
+        source = current.events_source
+        records = self._fold(self.events_delta, self.events_csv, "event_id", compact)
+        pending = records[current.events_deltas:]
+        path, delta_path = current.events_path, None
+        if pending:
+            # Only the new records are spliced into the published columns
+            columns, encoded = read_events_snapshot(SnapshotFile(current.events_path))
+            columns, encoded, _ = apply_event_deltas(columns, encoded, pending)
+            path = os.path.join(self.directory, f"events-{version}.snapshot")
+            write_event_columns(columns, encoded, path, self.events_csv, source)
+            delta_path = os.path.join(self.directory, f"events-delta-{version}.jsonl")
+            _write_records(delta_path, pending)
+        if compact and records:
+            # The CSV now holds every published record; adopted without recompiling
+            return path, file_signature(self.events_csv), 0, delta_path
+        return path, source, len(records), delta_path
+
+    def _publish_users(self, current: Optional[Manifest], version: int, force: bool,
+                       compact: bool) -> Published:
+        users_path = os.path.join(self.directory, f"users-{version}.snapshot")
+        if force or current is None or current.users_source != file_signature(self.users_csv):
+            self._fold(self.users_delta, self.users_csv, "user_id", True)
+            write_users_snapshot(self.users_csv, users_path)
+            return users_path, file_signature(self.users_csv), 0, None
+
+        records = self._fold(self.users_delta, self.users_csv, "user_id", compact)
+        if compact and records:
+            # The users snapshot holds no columns to splice into, so it is recompiled
+            write_users_snapshot(self.users_csv, users_path)
+            return users_path, file_signature(self.users_csv), 0, None
+        if len(records) == current.users_deltas:
+            return current.users_path, current.users_source, current.users_deltas, \
+                current.users_overrides
+        overrides_path = os.path.join(self.directory, f"users-delta-{version}.jsonl")
+        _write_records(overrides_path, records)
+        return current.users_path, current.users_source, len(records), overrides_path
+
+    def _remove_old_versions(self, version: int):
+        current = read_manifest(self.directory)
+        in_use = {os.path.basename(path) for path in (
+            current.events_path, current.users_path, current.events_delta,
+            current.users_overrides) if path}
+        for name in os.listdir(self.directory):
+            if not name.endswith((".snapshot", ".jsonl")) or name in in_use:
+                continue
+            try:
+                file_version = int(name.rsplit(".", 1)[0].rsplit("-", 1)[1])
+            except (IndexError, ValueError):
+                continue
+            if file_version <= version - KEEP_VERSIONS:
+                os.unlink(os.path.join(self.directory, name))
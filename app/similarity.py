@@ -0,0 +1,178 @@
+"""
+TF-IDF similarity index
+Each event's category, tags and description are turned into an L2-normalized
+TF-IDF vector once per catalog version, stored as a sparse events x terms
+matrix. Scoring a user is one sparse matrix-vector product against a profile
+vector built from their interests.
+"""
+
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from .columnar import ColumnsSplice, EventColumns
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOP_WORDS = frozenset("""
+    a an and are as at be by for from has have in into is it its of on or our that the
+    their this to was were will with you your all more new over about up out
+""".split())
+
+# Relative weight of each field in an event's term counts
+CATEGORY_WEIGHT = 2.0
+TAG_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric tokens with stop words and single characters removed"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower())
+            if len(token) > 1 and token not in STOP_WORDS]
+
+
+def top_k_positions(scores: np.ndarray, k: int, ties: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Positions of the k highest scores, ordered by (-score, position).
+    Ties at the cut-off are resolved by position, so results are deterministic.
+    ties, an optional distinct rank per score, replaces position as the tie-break.
+    """
+    n = len(scores)
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        threshold = np.partition(scores, n - k)[n - k]
+        above = np.flatnonzero(scores > threshold)
+        # flatnonzero is ascending, so the earliest tied positions are kept
+        tied = np.flatnonzero(scores == threshold)
+        if ties is not None:
+            tied = tied[np.argsort(ties[tied], kind="stable")]
+        candidates = np.concatenate([above, tied[:k - len(above)]])
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((candidates if ties is None else ties[candidates], -scores[candidates]))
+    return candidates[order]
+
+
+class TfidfIndex:
+    """Sparse TF-IDF vectors of every event in a catalog"""
+
+    def __init__(self, columns: EventColumns):
+        self.vocabulary: Dict[str, int] = {}
+        self._weigh(self._count_terms(columns))
+
+    @classmethod
+    def patched(cls, base: "TfidfIndex", splice: ColumnsSplice) -> "TfidfIndex":
+        """
+        Index of a catalog spliced from base's: only the upserted events are
+        tokenized, the term counts of the other rows are reused. Terms whose
+        events were all removed keep their column, with no document.
+        """
+        index = cls.__new__(cls)
+        index.vocabulary = dict(base.vocabulary)
+        upserted = index._count_terms(splice.upserted)
+        n_terms = len(index.vocabulary)
+        counts = base.counts
+        kept = sparse.csr_matrix((counts.data, counts.indices, counts.indptr),
+                                 shape=(counts.shape[0], n_terms))
+        index._weigh(sparse.vstack([kept, upserted], format="csr")[splice.order])
+        return index
+
+    def _count_terms(self, columns: EventColumns) -> sparse.csr_matrix:
+        """Weighted term counts of every event, adding new terms to the vocabulary"""
+        # Interned categories and tags are tokenized once, not once per event
+        category_terms = [self._term_counts(tokenize(category), CATEGORY_WEIGHT)
+                          for category in columns.categories]
+        tag_terms = [self._term_counts(tokenize(tag), TAG_WEIGHT) for tag in columns.tags]
+
+        rows: List[int] = []
+        cols: List[int] = []
+        values: List[float] = []
+        tag_offsets = columns.tag_offsets
+        for position in range(len(columns)):
+            counts: Counter = Counter()
+            counts.update(category_terms[columns.category_codes[position]])
+            for code in columns.tag_codes[tag_offsets[position]:tag_offsets[position + 1]]:
+                counts.update(tag_terms[code])
+            counts.update(self._term_counts(tokenize(columns.descriptions[position]),
+                                            DESCRIPTION_WEIGHT))
+            rows.extend([position] * len(counts))
+            cols.extend(counts.keys())
+            values.extend(counts.values())
+
+        return sparse.csr_matrix(
+            (np.asarray(values, dtype=np.float32), (rows, cols)),
+            shape=(len(columns), len(self.vocabulary))
+        )
+
+    def _weigh(self, counts: sparse.csr_matrix):
+        """TF-IDF matrix from the term counts, which are kept for patching"""
+        self.counts = counts
+        n_events, n_terms = counts.shape
+        self.document_frequency = np.bincount(counts.indices, minlength=n_terms)
+        # Smoothed idf, as in scikit-learn
+        self.idf = (np.log((1 + n_events) / (1 + self.document_frequency)) + 1).astype(np.float32)
+
+        # Sublinear tf, idf weighting, then L2-normalize every row
+        matrix = counts.copy()
+        matrix.data = np.log1p(matrix.data) * self.idf[matrix.indices]
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        self.matrix: sparse.csr_matrix = sparse.diags(1 / norms).dot(matrix).tocsr()
+        self.terms = [None] * n_terms
+        for term, column in self.vocabulary.items():
+            self.terms[column] = term
+
+    def _term_counts(self, tokens: Iterable[str], weight: float) -> Dict[int, float]:
+        counts: Dict[int, float] = {}
+        for token in tokens:
+            column = self.vocabulary.setdefault(token, len(self.vocabulary))
+            counts[column] = counts.get(column, 0.0) + weight
+        return counts
+
+    def profile(self, interests: Iterable[str]) -> Optional[sparse.csr_matrix]:
+        """
+        L2-normalized 1 x terms profile vector for a user's interests.
+        Returns None when none of the interests occur in the catalog.
+        """
+        weights: Dict[int, float] = {}
+        for interest in interests:
+            for token in tokenize(interest):
+                column = self.vocabulary.get(token)
+                # Terms left without events by deltas do not count, as after a full build
+                if column is not None and self.document_frequency[column]:
+                    weights[column] = weights.get(column, 0.0) + 1.0
+        if not weights:
+            return None
+        columns = np.fromiter(weights.keys(), dtype=np.int64, count=len(weights))
+        values = np.log1p(np.fromiter(weights.values(), dtype=np.float32,
+                                      count=len(weights))) * self.idf[columns]
+        values /= np.linalg.norm(values)
+        return sparse.csr_matrix((values, (np.zeros(len(columns), dtype=np.int64), columns)),
+                                 shape=(1, len(self.vocabulary)))
+
+    def scores(self, profile: Optional[sparse.csr_matrix],
+               rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine similarity with the profile of every event, or only of the events at rows"""
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        if profile is None:
+            return np.zeros(matrix.shape[0], dtype=np.float32)
+        return matrix.dot(profile.toarray().ravel())
+
+    def shared_terms(self, position: int, profile: Optional[sparse.csr_matrix]) -> List[str]:
+        """Profile terms that also occur in the event, strongest first"""
+        if profile is None:
+            return []
+        start, end = self.matrix.indptr[position], self.matrix.indptr[position + 1]
+        event_weights = dict(zip(self.matrix.indices[start:end].tolist(),
+                                 self.matrix.data[start:end].tolist()))
+        shared: List[Tuple[float, str]] = [
+            (event_weights[column] * weight, self.terms[column])
+            for column, weight in zip(profile.indices.tolist(), profile.data.tolist())
+            if column in event_weights
+        ]
+        return [term for _, term in sorted(shared, key=lambda item: (-item[0], item[1]))]
@@ -0,0 +1,403 @@
+"""
+Binary catalog snapshots
+events.csv and users.csv can be compiled into versioned binary snapshots made
+of fixed-width columns and string blobs. Loading a snapshot only memory-maps
+the file: nothing is parsed, the pages are loaded lazily and shared between
+processes through the OS page cache.
+
+File layout:
+    MAGIC (8 bytes) | header length (uint64, little endian) | JSON header | arrays...
+Every array starts on an 8-byte boundary; the header records the dtype,
+offset and length of each one plus small metadata such as vocabularies and
+the signature of the source CSV the snapshot was compiled from.
+"""
+
+import csv
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from .columnar import (
+    EventColumns, StringColumn, datetime_offset, datetime_to_micros, micros_to_datetime,
+    load_event_columns
+)
+from .models import User, UserPreferences
+from .reloader import file_signature, FileSignature
+from .serialization import EncodedEvents
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RECSNAP\x00"
+# Bump whenever the layout or the meaning of a column changes
+FORMAT_VERSION = 2
+
+NO_AGE = -1
+EMPTY_SLOT = -1
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is missing, corrupt or of another format"""
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+class SnapshotWriter:
+    """Collects named arrays and metadata and writes them as one snapshot file"""
+
+    def __init__(self, kind: str, source: str, signature: FileSignature):
+        self.meta = {
+            "format_version": FORMAT_VERSION,
+            "kind": kind,
+            "source": os.path.abspath(source),
+            "source_mtime_ns": signature[0],
+            "source_size": signature[1],
+        }
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    def add_array(self, name: str, array: np.ndarray):
+        self._arrays[name] = np.ascontiguousarray(array)
+
+    def add_bytes(self, name: str, data: bytes):
+        self._arrays[name] = np.frombuffer(data, dtype=np.uint8)
+
+    def add_strings(self, name: str, column: StringColumn):
+        self.add_bytes(f"{name}.blob", bytes(column.blob[column.base:column.base + int(column.offsets[-1])]))
+        self.add_array(f"{name}.offsets", column.offsets)
+
+    def write(self, path: str):
+        """Write the snapshot atomically: readers see the old or the new file, never a mix"""
+        layout = {}
+        offset = 0
+        for name, array in self._arrays.items():
+            offset = _align(offset)
+            layout[name] = [array.dtype.str, offset, int(array.size)]
+            offset += array.nbytes
+
+        header = json.dumps({"meta": self.meta, "arrays": layout}).encode("utf-8")
+        data_start = _align(len(MAGIC) + 8 + len(header))
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(MAGIC)
+                file.write(struct.pack("<Q", len(header)))
+                file.write(header)
+                for name, array in self._arrays.items():
+                    file.seek(data_start + layout[name][1])
+                    file.write(array.tobytes())
+                file.flush()
+                os.fsync(file.fileno())
+            # mkstemp creates the file private; snapshots are shared with workers
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+class SnapshotFile:
+    """A read-only, memory-mapped snapshot"""
+
+    def __init__(self, path: str):
+        try:
+            with open(path, "rb") as file:
+                self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as exc:
+            raise SnapshotError(f"Cannot map snapshot {path}: {exc}")
+
+        if self.mmap[:len(MAGIC)] != MAGIC:
+            raise SnapshotError(f"{path} is not a snapshot file")
+        (header_length,) = struct.unpack_from("<Q", self.mmap, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        header = json.loads(self.mmap[header_start:header_start + header_length])
+        self.meta: dict = header["meta"]
+        self._layout: dict = header["arrays"]
+        self._data_start = _align(header_start + header_length)
+
+        if self.meta.get("format_version") != FORMAT_VERSION:
+            raise SnapshotError(f"{path} has format version {self.meta.get('format_version')}, "
+                                f"expected {FORMAT_VERSION}")
+
+    def array(self, name: str) -> np.ndarray:
+        """Zero-copy, read-only view of a stored array"""
+        dtype, offset, count = self._layout[name]
+        return np.frombuffer(self.mmap, dtype=np.dtype(dtype), count=count,
+                             offset=self._data_start + offset)
+
+    def region(self, name: str) -> Tuple[int, int]:
+        """(absolute offset, byte length) of a stored byte array"""
+        dtype, offset, count = self._layout[name]
+        return self._data_start + offset, count * np.dtype(dtype).itemsize
+
+    def strings(self, name: str) -> StringColumn:
+        base, _ = self.region(f"{name}.blob")
+        return StringColumn(self.mmap, self.array(f"{name}.offsets"), base)
+
+    def is_fresh(self, source: str) -> bool:
+        """True when the source file still has the signature the snapshot was built from"""
+        signature = file_signature(source)
+        return signature is not None and \
+            signature == (self.meta["source_mtime_ns"], self.meta["source_size"])
+
+
+def open_fresh_snapshot(path: Optional[str], source: str, kind: str) -> Optional[SnapshotFile]:
+    """Map the snapshot at path if it exists, is valid and matches source; otherwise None"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        snapshot = SnapshotFile(path)
+    except SnapshotError as exc:
+        logger.warning("Ignoring snapshot: %s", exc)
+        return None
+    if snapshot.meta.get("kind") != kind:
+        logger.warning("Ignoring snapshot %s: holds %s, not %s", path, snapshot.meta.get("kind"), kind)
+        return None
+    if not snapshot.is_fresh(source):
+        logger.info("Snapshot %s is stale for %s, falling back to CSV", path, source)
+        return None
+    return snapshot
+
+
+def _stable_signature(csv_file: str) -> FileSignature:
+    signature = file_signature(csv_file)
+    if signature is None:
+        raise FileNotFoundError(csv_file)
+    return signature
+
+
+# Events
+
+def write_events_snapshot(csv_file: str, path: str) -> int:
+    """Compile events.csv into a snapshot; returns the number of events"""
+    signature = _stable_signature(csv_file)
+    columns = load_event_columns(csv_file)
+    encoded = EncodedEvents(columns)
+    if file_signature(csv_file) != signature:
+        raise SnapshotError(f"{csv_file} changed while the snapshot was being built")
+    return write_event_columns(columns, encoded, path, csv_file, signature)
+
+
+def write_event_columns(columns: EventColumns, encoded: EncodedEvents, path: str,
+                        csv_file: str, signature: FileSignature) -> int:
+    """Write an events snapshot of columns, derived from csv_file at signature"""
+    writer = SnapshotWriter("events", csv_file, signature)
+    writer.meta.update({
+        "count": len(columns),
+        "categories": columns.categories,
+        "locations": columns.locations,
+        "organizers": columns.organizers,
+        "tags": columns.tags,
+        "json_digest": encoded.digest,
+    })
+    writer.add_strings("event_ids", columns.event_ids)
+    writer.add_strings("titles", columns.titles)
+    writer.add_strings("descriptions", columns.descriptions)
+    for name in ("category_codes", "location_codes", "organizer_codes", "tag_codes",
+                 "tag_offsets", "dates", "date_offsets", "prices", "capacities", "ratings"):
+        writer.add_array(name, getattr(columns, name))
+    # The encoded JSON is stored too, so serving /events/ needs no encoding at startup
+    writer.add_bytes("json.body", encoded.body)
+    writer.add_array("json.starts", np.asarray(encoded.starts, dtype=np.int64))
+    writer.add_array("json.ends", np.asarray(encoded.ends, dtype=np.int64))
+    writer.write(path)
+    return len(columns)
+
+
+def read_events_snapshot(snapshot: SnapshotFile) -> Tuple[EventColumns, EncodedEvents]:
+    """Build the columnar catalog and its encoded payload as views over a mapped snapshot"""
+    meta = snapshot.meta
+    columns = EventColumns(
+        event_ids=snapshot.strings("event_ids"),
+        titles=snapshot.strings("titles"),
+        descriptions=snapshot.strings("descriptions"),
+        category_codes=snapshot.array("category_codes"),
+        categories=meta["categories"],
+        location_codes=snapshot.array("location_codes"),
+        locations=meta["locations"],
+        organizer_codes=snapshot.array("organizer_codes"),
+        organizers=meta["organizers"],
+        tag_codes=snapshot.array("tag_codes"),
+        tag_offsets=snapshot.array("tag_offsets"),
+        tags=meta["tags"],
+        dates=snapshot.array("dates"),
+        date_offsets=snapshot.array("date_offsets"),
+        prices=snapshot.array("prices"),
+        capacities=snapshot.array("capacities"),
+        ratings=snapshot.array("ratings"),
+    )
+    base, size = snapshot.region("json.body")
+    encoded = EncodedEvents.from_buffer(snapshot.mmap, base, size,
+                                        snapshot.array("json.starts"),
+                                        snapshot.array("json.ends"),
+                                        meta["json_digest"])
+    return columns, encoded
+
+
+# Users
+
+def user_id_hash(user_id: str) -> int:
+    """Stable 63-bit hash of a user_id, identical in every process"""
+    digest = hashlib.blake2b(user_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") >> 1
+
+
+def build_hash_table(keys) -> np.ndarray:
+    """
+    Open-addressing table of positions by user_id hash. A power-of-two table
+    at most half full keeps probe sequences short.
+    """
+    table_size = 1
+    while table_size < 2 * max(1, len(keys)):
+        table_size <<= 1
+    table = np.full(table_size, EMPTY_SLOT, dtype=np.int64)
+    mask = table_size - 1
+    for position, key in enumerate(keys):
+        slot = user_id_hash(key) & mask
+        while table[slot] != EMPTY_SLOT:
+            slot = (slot + 1) & mask
+        table[slot] = position
+    return table
+
+
+def probe_hash_table(table: np.ndarray, keys: StringColumn, key: str) -> Optional[int]:
+    """Position of key in a table built by build_hash_table, or None"""
+    mask = len(table) - 1
+    slot = user_id_hash(key) & mask
+    while True:
+        position = int(table[slot])
+        if position == EMPTY_SLOT:
+            return None
+        if keys[position] == key:
+            return position
+        slot = (slot + 1) & mask
+
+
+def strings_column(values) -> StringColumn:
+    """Build a StringColumn from a list of str"""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return StringColumn(b"".join(encoded), offsets)
+
+
+class SnapshotUsers:
+    """
+    Read-only user index over a mapped snapshot.
+    Lookups go through an open-addressing hash table stored in the file, so
+    they are O(1) without building a dict at startup; User/UserPreferences
+    objects are built only for the user that was asked for.
+    """
+
+    def __init__(self, snapshot: SnapshotFile):
+        self.snapshot = snapshot
+        meta = snapshot.meta
+        self.locations = meta["locations"]
+        self.categories = meta["categories"]
+        self.user_ids = snapshot.strings("user_ids")
+        self.names = snapshot.strings("names")
+        self.emails = snapshot.strings("emails")
+        self.ages = snapshot.array("ages")
+        self.location_codes = snapshot.array("location_codes")
+        self.created_at = snapshot.array("created_at")
+        self.created_at_offsets = snapshot.array("created_at_offsets")
+        self.category_codes = snapshot.array("category_codes")
+        self.category_offsets = snapshot.array("category_offsets")
+        self.table = snapshot.array("hash_table")
+
+    def position(self, user_id: str) -> Optional[int]:
+        return probe_hash_table(self.table, self.user_ids, user_id)
+
+    def get(self, user_id: str) -> Optional[Tuple[User, UserPreferences]]:
+        position = self.position(user_id)
+        if position is None:
+            return None
+        age = int(self.ages[position])
+        start, end = self.category_offsets[position], self.category_offsets[position + 1]
+        user = User.model_construct(
+            user_id=user_id,
+            name=self.names[position],
+            email=self.emails[position],
+            age=None if age == NO_AGE else age,
+            location=self.locations[self.location_codes[position]],
+            created_at=micros_to_datetime(self.created_at[position],
+                                          self.created_at_offsets[position])
+        )
+        preferences = UserPreferences.model_construct(
+            user_id=user_id,
+            categories=[self.categories[code] for code in self.category_codes[start:end]]
+        )
+        return user, preferences
+
+    def __contains__(self, user_id: str) -> bool:
+        return self.position(user_id) is not None
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.user_ids)
+
+
+def write_users_snapshot(csv_file: str, path: str) -> int:
+    """Compile users.csv into a snapshot; returns the number of users"""
+    from .user_store import parse_user_row
+
+    signature = _stable_signature(csv_file)
+    user_ids, names, emails = [], [], []
+    ages, location_codes, created_at, created_at_offsets = [], [], [], []
+    category_codes, category_offsets = [], [0]
+    locations: Dict[str, int] = {}
+    categories: Dict[str, int] = {}
+    seen = set()
+
+    with open(csv_file, "r", encoding="utf-8", newline="") as file:
+        for row in csv.DictReader(file):
+            # The first occurrence of a user_id wins, as in the user store
+            if row["user_id"] in seen:
+                continue
+            seen.add(row["user_id"])
+            user, preferences = parse_user_row(row)
+            user_ids.append(user.user_id)
+            names.append(user.name)
+            emails.append(user.email)
+            ages.append(NO_AGE if user.age is None else user.age)
+            location_codes.append(locations.setdefault(user.location or "", len(locations)))
+            created_at.append(datetime_to_micros(user.created_at))
+            created_at_offsets.append(datetime_offset(user.created_at))
+            category_codes.extend(categories.setdefault(category, len(categories))
+                                  for category in preferences.categories)
+            category_offsets.append(len(category_codes))
+
+    if file_signature(csv_file) != signature:
+        raise SnapshotError(f"{csv_file} changed while the snapshot was being built")
+
+    table = build_hash_table(user_ids)
+
+    writer = SnapshotWriter("users", csv_file, signature)
+    writer.meta.update({
+        "count": len(user_ids),
+        "locations": list(locations),
+        "categories": list(categories),
+    })
+    for name, values in (("user_ids", user_ids), ("names", names), ("emails", emails)):
+        writer.add_strings(name, strings_column(values))
+    writer.add_array("ages", np.asarray(ages, dtype=np.int64))
+    writer.add_array("location_codes", np.asarray(location_codes, dtype=np.int32))
+    writer.add_array("created_at", np.asarray(created_at, dtype=np.int64))
+    writer.add_array("created_at_offsets", np.asarray(created_at_offsets, dtype=np.int32))
+    writer.add_array("category_codes", np.asarray(category_codes, dtype=np.int32))
+    writer.add_array("category_offsets", np.asarray(category_offsets, dtype=np.int64))
+    writer.add_array("hash_table", table)
+    writer.write(path)
+    return len(user_ids)
@@ -0,0 +1,401 @@
+"""
+SQLite backend
+Events and users live in one SQLite database instead of the CSV files. Rows
+keep the CSV representation (every column is the CSV text), so both backends
+parse into identical objects and the catalog's encoded payload, and its
+digest, do not depend on the backend.
+
+Tables are ordered by an INTEGER PRIMARY KEY "seq" that plays the role of the
+CSV line order: an upsert of an existing id keeps its seq and a new id gets
+the next one, which are the ordering rules of deltas.py. event_id and user_id
+are unique keys and events are indexed by lowercased category and by date.
+A counter per table in "meta" is bumped by every write made through this
+module; it is the change signature polled by the background reloader.
+
+Connections come from a fixed-size pool shared by the worker threads. The
+database runs in WAL mode, so readers never wait for a writer.
+"""
+
+import csv
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .catalog import parse_event_row
+from .columnar import EventColumns, EventColumnsBuilder
+from .deltas import DeltaLog
+from .models import Event, User, UserPreferences
+from .reloader import FileSignature
+from .repository import EventRepository, RepositoryError, UserRepository
+from .user_store import UserStoreUnavailableError, parse_user_row
+
+logger = logging.getLogger(__name__)
+
+EVENT_FIELDS = ("event_id", "title", "description", "category", "tags", "location", "date",
+                "price", "organizer", "capacity", "rating")
+USER_FIELDS = ("user_id", "name", "email", "age", "location", "created_at", "categories")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY,
+    event_id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    category TEXT NOT NULL,
+    tags TEXT NOT NULL,
+    location TEXT NOT NULL,
+    date TEXT NOT NULL,
+    price TEXT NOT NULL,
+    organizer TEXT NOT NULL,
+    capacity TEXT NOT NULL,
+    rating TEXT NOT NULL,
+    category_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_category ON events (category_key, seq);
+CREATE INDEX IF NOT EXISTS events_date ON events (date);
+CREATE TABLE IF NOT EXISTS users (
+    seq INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    age TEXT NOT NULL,
+    location TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    categories TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def _upsert_sql(table: str, fields: Tuple[str, ...]) -> str:
+    columns = ", ".join(fields)
+    placeholders = ", ".join("?" * len(fields))
+    updates = ", ".join(f"{field} = excluded.{field}" for field in fields[1:])
+    return (f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT({fields[0]}) DO UPDATE SET {updates}")
+
+
+EVENT_COLUMNS = EVENT_FIELDS + ("category_key",)
+UPSERT_EVENT = _upsert_sql("events", EVENT_COLUMNS)
+UPSERT_USER = _upsert_sql("users", USER_FIELDS)
+SELECT_EVENTS = f"SELECT {', '.join(EVENT_FIELDS)} FROM events"
+SELECT_USERS = f"SELECT {', '.join(USER_FIELDS)} FROM users"
+
+
+def _event_values(row: dict) -> Tuple[str, ...]:
+    values = tuple(row.get(field) or "" for field in EVENT_FIELDS)
+    return values + (row["category"].lower(),)
+
+
+def _user_values(row: dict) -> Tuple[str, ...]:
+    return tuple(row.get(field) or "" for field in USER_FIELDS)
+
+
+class SqlitePool:
+    """
+    Fixed-size pool of connections to one database. Connections are opened
+    on demand up to size; a thread that finds none idle waits up to timeout.
+    """
+
+    def __init__(self, path: str, size: int = 4, timeout: float = 30.0):
+        if size < 1:
+            raise ValueError("A SQLite pool needs at least one connection")
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self.waits = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.executescript(SCHEMA)
+        return connection
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except sqlite3.Error as exc:
+                    self._opened -= 1
+                    raise RepositoryError(f"Cannot open SQLite database {self.path}: {exc}")
+            self.waits += 1
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RepositoryError(f"No SQLite connection to {self.path} freed within "
+                                  f"{self.timeout}s")
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection; SQLite errors are raised as RepositoryError"""
+        connection = self._acquire()
+        try:
+            yield connection
+        except sqlite3.Error as exc:
+            raise RepositoryError(f"SQLite error on {self.path}: {exc}") from exc
+        finally:
+            self._idle.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            connection.close()
+            with self._lock:
+                self._opened -= 1
+
+    def stats(self) -> dict:
+        return {"size": self.size, "open": self._opened, "idle": self._idle.qsize(),
+                "waits": self.waits}
+
+
+def _bump_version(connection: sqlite3.Connection, table: str):
+    connection.execute("INSERT INTO meta (name, value) VALUES (?, 1) "
+                       "ON CONFLICT(name) DO UPDATE SET value = value + 1", (table,))
+
+
+def _read_version(connection: sqlite3.Connection, table: str) -> int:
+    row = connection.execute("SELECT value FROM meta WHERE name = ?", (table,)).fetchone()
+    return row[0] if row is not None else 0
+
+
+def table_versions(pool: SqlitePool) -> Tuple[int, int]:
+    """Change counters of the (events, users) tables; 0 for a table never written"""
+    with pool.connection() as connection:
+        return _read_version(connection, "events"), _read_version(connection, "users")
+
+
+def _write_records(connection: sqlite3.Connection, table: str, upsert: str,
+                   values, records: List[dict]):
+    """Apply delta records in order inside the caller's transaction"""
+    key = "event_id" if table == "events" else "user_id"
+    for record in records:
+        if record["op"] == "upsert":
+            connection.execute(upsert, values(record["row"]))
+        else:
+            connection.execute(f"DELETE FROM {table} WHERE {key} = ?", (record["id"],))
+    _bump_version(connection, table)
+
+
+def _import_rows(connection: sqlite3.Connection, table: str, upsert: str, values,
+                 csv_file: str) -> int:
+    connection.execute(f"DELETE FROM {table}")
+    with open(csv_file, "r", encoding="utf-8", newline="") as file:
+        cursor = connection.executemany(upsert, (values(row) for row in csv.DictReader(file)))
+    _bump_version(connection, table)
+    return cursor.rowcount
+
+
+def import_csv(pool: SqlitePool, events_csv: Optional[str] = None,
+               users_csv: Optional[str] = None) -> Tuple[int, int]:
+    """
+    Replace the events and/or users tables with the rows of the CSV files,
+    each in one transaction. Returns the number of (events, users) imported.
+    """
+    counts = [0, 0]
+    with pool.connection() as connection:
+        if events_csv:
+            with connection:
+                counts[0] = _import_rows(connection, "events", UPSERT_EVENT, _event_values,
+                                         events_csv)
+        if users_csv:
+            with connection:
+                counts[1] = _import_rows(connection, "users", UPSERT_USER, _user_values,
+                                         users_csv)
+    return counts[0], counts[1]
+
+
+class SqliteEventRepository(EventRepository):
+    """The events table as the catalog's backend"""
+
+    name = "sqlite"
+
+    def __init__(self, pool: SqlitePool):
+        self.pool = pool
+        self.location = pool.path
+
+    def signature(self) -> Optional[FileSignature]:
+        with self.pool.connection() as connection:
+            version = _read_version(connection, "events")
+            last = connection.execute("SELECT max(seq) FROM events").fetchone()[0]
+        # Never written: there is no catalog to load yet
+        return (version, last or 0) if version else None
+
+    def load_columns(self) -> EventColumns:
+        builder = EventColumnsBuilder()
+        with self.pool.connection() as connection:
+            for row in connection.execute(f"{SELECT_EVENTS} ORDER BY seq"):
+                builder.append_row(row)
+        return builder.build()
+
+    def compact(self, records: List[dict]):
+        with self.pool.connection() as connection, connection:
+            _write_records(connection, "events", UPSERT_EVENT, _event_values, records)
+
+    def events_in_categories(self, categories: Iterable[str],
+                             limit: Optional[int] = None) -> List[Event]:
+        keys = sorted({category.lower() for category in categories})
+        if not keys:
+            return []
+        query = (f"{SELECT_EVENTS} WHERE category_key IN ({', '.join('?' * len(keys))}) "
+                 f"ORDER BY seq")
+        parameters: list = list(keys)
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        with self.pool.connection() as connection:
+            return [parse_event_row(row) for row in connection.execute(query, parameters)]
+
+
+class SqliteUserStore(UserRepository):
+    """
+    The users table as the user backend. Lookups are one indexed query on a
+    pooled connection, so nothing is held in memory. Delta batches are
+    written to the table directly; compaction re-applies the whole log, which
+    is idempotent, so records logged by other processes are not lost.
+    """
+
+    lookups_block = True
+
+    def __init__(self, pool: SqlitePool, delta_log: Optional[DeltaLog] = None):
+        self.pool = pool
+        self.delta_log = delta_log
+        # Table version as of the last refresh or write, None before the first load
+        self._version: Optional[int] = None
+        self._reload_lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+        self.full_reloads = 0
+        self.incremental_reloads = 0
+        self.reload_errors = 0
+
+    @property
+    def version(self) -> int:
+        return self._version or 0
+
+    def _ensure_loaded(self):
+        if self._version is None:
+            self.refresh()
+            if self._version is None:
+                raise UserStoreUnavailableError(f"No users imported into {self.pool.path}")
+
+    def get(self, user_id: str) -> Tuple[Optional[User], Optional[UserPreferences]]:
+        self._ensure_loaded()
+        with self.pool.connection() as connection:
+            row = connection.execute(f"{SELECT_USERS} WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None, None
+        self.hits += 1
+        return parse_user_row(row)
+
+    def __contains__(self, user_id: str) -> bool:
+        self._ensure_loaded()
+        with self.pool.connection() as connection:
+            return connection.execute("SELECT 1 FROM users WHERE user_id = ?",
+                                      (user_id,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        with self.pool.connection() as connection:
+            return connection.execute("SELECT count(*) FROM users").fetchone()[0]
+
+    def user_ids(self) -> List[str]:
+        self._ensure_loaded()
+        with self.pool.connection() as connection:
+            return [row[0] for row in connection.execute("SELECT user_id FROM users ORDER BY seq")]
+
+    def _write(self, records: List[dict]):
+        # Parse first so a bad record writes nothing
+        for record in records:
+            if record["op"] == "upsert":
+                parse_user_row(record["row"])
+        with self.pool.connection() as connection:
+            with connection:
+                _write_records(connection, "users", UPSERT_USER, _user_values, records)
+            self._version = _read_version(connection, "users")
+
+    def apply_deltas(self, records: List[dict]):
+        self._write(records)
+        logger.info("Applied %d user deltas to %s", len(records), self.pool.path)
+
+    def compact_deltas(self, log: DeltaLog) -> int:
+        with self._reload_lock:
+            folded = log.compact(self._write)
+            if folded:
+                logger.info("Compacted %d user deltas into %s", folded, self.pool.path)
+            return folded
+
+    def refresh(self, force: bool = False) -> bool:
+        """Pick up the table version; True when it changed since the last refresh"""
+        with self._reload_lock:
+            started = time.perf_counter()
+            previous = self._version
+            try:
+                with self.pool.connection() as connection:
+                    version = _read_version(connection, "users")
+                if not version:
+                    return False
+                if previous is None and self.delta_log is not None:
+                    # Deltas logged before a restart, possibly never applied
+                    records = self.delta_log.read()
+                    if records:
+                        self._write(records)
+                        version = self._version
+            except (RepositoryError, ValueError, KeyError) as exc:
+                self.reload_errors += 1
+                logger.warning("Failed to refresh users from %s: %s", self.pool.path, exc)
+                return False
+
+            if previous is not None and not force and version == previous:
+                return False
+            if previous is not None:
+                self.full_reloads += 1
+            self._version = version
+            self.load_seconds = time.perf_counter() - started
+            return True
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        loaded = self._version is not None
+        try:
+            users = len(self) if loaded else 0
+        except RepositoryError:
+            users = 0
+        return {
+            "mode": "sqlite",
+            "loaded": loaded,
+            "version": self.version,
+            "users": users,
+            "overridden_users": 0,
+            "load_seconds": self.load_seconds,
+            "source": "sqlite",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "full_reloads": self.full_reloads,
+            "incremental_reloads": self.incremental_reloads,
+            "reload_errors": self.reload_errors,
+            "pool": self.pool.stats(),
+        }
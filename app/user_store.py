@@ -0,0 +1,403 @@
+"""
+Indexed user store
+Users are indexed by user_id once instead of scanning users.csv on every request.
+Two modes are available:
+  - "memory": every row is parsed into User/UserPreferences objects up front
+  - "offset": only the byte offset of each row is kept and the row is read
+    with a single pread on lookup, for user files too large to hold as objects
+In both modes a fresh binary snapshot of users.csv is memory-mapped instead,
+when one is configured, and worker processes of a multi-process deployment
+attach to the snapshot published by the loader. Upserts and deletes from the
+delta log are kept in a small override map consulted before the index, until
+compaction folds them into the CSV.
+"""
+
+import csv
+import io
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .deltas import DeltaLog, compact_csv
+from .models import User, UserPreferences
+from .reloader import file_signature, FileSignature
+from .repository import UserRepository
+from .shared import Manifest, read_manifest, read_records
+from .snapshot import SnapshotError, SnapshotFile, SnapshotUsers, open_fresh_snapshot
+
+logger = logging.getLogger(__name__)
+
+USER_STORE_MODES = ("memory", "offset")
+
+# Bytes remembered from the end of the file to confirm a change was a pure append
+TAIL_CHECK_BYTES = 64
+
+
+class UserStoreUnavailableError(Exception):
+    """Raised when the users file has never been loaded successfully"""
+
+
+def parse_user_row(row: dict) -> Tuple[User, UserPreferences]:
+    """Build the User and UserPreferences objects for one users.csv row"""
+    user = User(
+        user_id=row['user_id'],
+        name=row['name'],
+        email=row['email'],
+        age=int(row['age']) if row['age'] else None,
+        location=row['location'],
+        created_at=datetime.fromisoformat(row['created_at'])
+    )
+
+    categories = row['categories'].split(';') if row['categories'] else []
+    preferences = UserPreferences(
+        user_id=user.user_id,
+        categories=categories
+    )
+    return user, preferences
+
+
+def user_to_row(user: User, preferences: UserPreferences) -> dict:
+    """The users.csv row of a user, the inverse of parse_user_row"""
+    return {
+        'user_id': user.user_id,
+        'name': user.name,
+        'email': user.email,
+        'age': '' if user.age is None else str(user.age),
+        'location': user.location or '',
+        'created_at': user.created_at.isoformat(),
+        'categories': ';'.join(preferences.categories),
+    }
+
+
+def iter_record_offsets(data: bytes, base_offset: int = 0) -> Iterator[Tuple[int, int]]:
+    """
+    Yield (offset, length) for every CSV record in data.
+    Quoted fields may contain newlines, so a record ends only at a newline
+    outside of quotes.
+    """
+    start = 0
+    pos = 0
+    in_quotes = False
+    size = len(data)
+    while pos < size:
+        newline = data.find(b'\n', pos)
+        end = size if newline == -1 else newline + 1
+        if data.count(b'"', pos, end) % 2:
+            in_quotes = not in_quotes
+        pos = end
+        if not in_quotes:
+            if data[start:end].strip():
+                yield base_offset + start, end - start
+            start = end
+    if start < size and data[start:].strip():
+        yield base_offset + start, size - start
+
+
+class _UserIndex:
+    """One immutable-by-convention version of the user index"""
+
+    __slots__ = ("entries", "header", "signature", "size", "tail", "file",
+                 "version", "load_seconds", "source")
+
+    def __init__(self, entries: Dict, header: List[str], signature: FileSignature,
+                 size: int, tail: bytes, file, version: int, load_seconds: float,
+                 source: str = "csv"):
+        # Where the index came from: "csv", "snapshot" or "shared"
+        self.source = source
+        self.entries = entries
+        self.header = header
+        self.signature = signature
+        self.size = size
+        self.tail = tail
+        self.file = file
+        self.version = version
+        self.load_seconds = load_seconds
+
+
+class UserStore(UserRepository):
+    """
+    users.csv as the user backend: O(1) lookup of users by user_id with
+    change-detected refresh.
+    Appends to the users file are applied incrementally; any other change
+    triggers a full rebuild that is swapped in atomically.
+    """
+
+    def __init__(self, csv_file: str, mode: str = "memory", snapshot_file: Optional[str] = None,
+                 shared_dir: Optional[str] = None, delta_log: Optional[DeltaLog] = None):
+        if mode not in USER_STORE_MODES:
+            raise ValueError(f"Unknown user store mode {mode!r}, expected one of {USER_STORE_MODES}")
+        self.csv_file = csv_file
+        self.mode = mode
+        # Offset-mode lookups read the CSV
+        self.lookups_block = mode == "offset"
+        # Optional binary snapshot, used instead of the CSV while it is fresh
+        self.snapshot_file = snapshot_file
+        # Directory published by a SharedDataPublisher; when set, only published
+        # snapshots are used and the CSV is never read
+        self.shared_dir = shared_dir
+        # Upserts and deletes not yet folded into the CSV, replayed on first load
+        self.delta_log = delta_log
+        self._index: Optional[_UserIndex] = None
+        # user_id -> (user, preferences), or None for a deleted user. Replaced as
+        # a whole on every batch, so readers never see a half-applied one
+        self._overrides: Dict[str, Optional[Tuple[User, UserPreferences]]] = {}
+        self._delta_batches = 0
+        self._reload_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.full_reloads = 0
+        self.incremental_reloads = 0
+        self.reload_errors = 0
+
+    @property
+    def version(self) -> int:
+        index = self._index
+        # Both terms only grow, so every index rebuild or delta batch changes the sum
+        return (index.version if index is not None else 0) + self._delta_batches
+
+    def _get_index(self) -> _UserIndex:
+        index = self._index
+        if index is None:
+            self.refresh()
+            index = self._index
+            if index is None:
+                if self.shared_dir:
+                    raise UserStoreUnavailableError(f"No users published in {self.shared_dir}")
+                raise UserStoreUnavailableError(f"Users data file {self.csv_file} not found")
+        return index
+
+    def get(self, user_id: str) -> Tuple[Optional[User], Optional[UserPreferences]]:
+        """Return (user, preferences) for user_id, or (None, None) if unknown"""
+        index = self._get_index()
+        overrides = self._overrides
+        if user_id in overrides:
+            entry = overrides[user_id]
+            if entry is None:
+                self.misses += 1
+                return None, None
+            self.hits += 1
+            return entry
+
+        entry = index.entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None, None
+        self.hits += 1
+
+        # Snapshot entries are built by the lookup itself
+        if self.mode == "memory" or index.source != "csv":
+            return entry
+
+        offset, length = entry
+        raw = os.pread(index.file.fileno(), length, offset)
+        values = next(csv.reader(io.StringIO(raw.decode('utf-8'))))
+        return parse_user_row(dict(zip(index.header, values)))
+
+    def __contains__(self, user_id: str) -> bool:
+        entries = self._get_index().entries
+        overrides = self._overrides
+        if user_id in overrides:
+            return overrides[user_id] is not None
+        return user_id in entries
+
+    def __len__(self) -> int:
+        return len(self.user_ids())
+
+    def user_ids(self) -> List[str]:
+        """All known user IDs in file order, followed by users added by deltas"""
+        entries = self._get_index().entries
+        overrides = self._overrides
+        if not overrides:
+            return list(entries)
+        user_ids = [user_id for user_id in entries if overrides.get(user_id, True) is not None]
+        user_ids.extend(user_id for user_id, entry in overrides.items()
+                        if entry is not None and user_id not in entries)
+        return user_ids
+
+    def apply_deltas(self, records: List[dict]):
+        """Apply a batch of delta records on top of the index"""
+        # Parse first so a bad record leaves the live overrides untouched
+        overrides = self._overridden(dict(self._overrides), records)
+        self._overrides = overrides
+        self._delta_batches += 1
+        logger.info("Applied %d user deltas (%d overridden users)", len(records), len(overrides))
+
+    @staticmethod
+    def _overridden(overrides: Dict, records: List[dict]) -> Dict:
+        for record in records:
+            if record["op"] == "upsert":
+                overrides[record["id"]] = parse_user_row(record["row"])
+            else:
+                overrides[record["id"]] = None
+        return overrides
+
+    def compact_deltas(self, log: DeltaLog) -> int:
+        """Fold the logged deltas into the CSV, re-index it and drop the overrides"""
+        with self._reload_lock:
+            folded = log.compact(lambda records: compact_csv(self.csv_file, 'user_id', records))
+            # Overrides stay in place until the rebuilt index holds the same data
+            if folded and self._refresh(force=True):
+                self._overrides = {}
+            if folded:
+                logger.info("Compacted %d user deltas into %s", folded, self.csv_file)
+            return folded
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Bring the index up to date with the users file.
+        Returns True when the index changed.
+        """
+        with self._reload_lock:
+            return self._refresh(force)
+
+    def _refresh(self, force: bool) -> bool:
+        if self.shared_dir:
+            manifest = read_manifest(self.shared_dir)
+            signature = manifest.signature if manifest is not None else None
+        else:
+            manifest = None
+            signature = file_signature(self.csv_file)
+        if signature is None:
+            return False
+
+        current = self._index
+        if not force and current is not None and current.signature == signature:
+            return False
+
+        started = time.perf_counter()
+        try:
+            if not force and current is not None and self._try_append(current, signature, started):
+                self.incremental_reloads += 1
+                return True
+            if manifest is not None:
+                index = self._attach(manifest, started)
+                # Records the loader published on top of the users snapshot
+                overrides = self._overridden({}, read_records(manifest.users_overrides)) \
+                    if manifest.users_overrides else {}
+            else:
+                index = self._build(signature, started, current.version + 1 if current else 1)
+            if current is None and self.delta_log is not None and manifest is None:
+                # Deltas logged before a restart; published versions already include them
+                records = self.delta_log.read()
+                if records:
+                    self.apply_deltas(records)
+        except (OSError, ValueError, KeyError, UnicodeDecodeError, SnapshotError) as exc:
+            self.reload_errors += 1
+            logger.warning("Failed to reload users from %s: %s", self.csv_file, exc)
+            return False
+
+        self._index = index
+        if manifest is not None:
+            self._overrides = overrides
+        if current is not None:
+            self.full_reloads += 1
+        logger.info("Indexed %d users (%s mode) from %s in %.3fs", len(index.entries),
+                    self.mode, index.source, index.load_seconds)
+        return True
+
+    def _attach(self, manifest: Manifest, started: float) -> _UserIndex:
+        """Map the users snapshot of a published version"""
+        return _UserIndex(SnapshotUsers(SnapshotFile(manifest.users_path)), [],
+                          manifest.signature, 0, b"", None, manifest.version,
+                          time.perf_counter() - started, "shared")
+
+    def _build(self, signature: FileSignature, started: float, version: int) -> _UserIndex:
+        binary = open_fresh_snapshot(self.snapshot_file, self.csv_file, "users")
+        if binary is not None:
+            return _UserIndex(SnapshotUsers(binary), [], signature, signature[1], b"", None,
+                              version, time.perf_counter() - started, "snapshot")
+
+        file = open(self.csv_file, 'rb')
+        try:
+            data = file.read()
+            header_end = data.find(b'\n') + 1 or len(data)
+            header = next(csv.reader([data[:header_end].decode('utf-8')]), [])
+            entries: Dict = {}
+            self._index_records(entries, header, data[header_end:], header_end)
+        except Exception:
+            file.close()
+            raise
+
+        if self.mode == "memory":
+            # Objects are built up front, no need to keep the file open
+            file.close()
+            file = None
+
+        return _UserIndex(entries, header, signature, len(data),
+                          data[-TAIL_CHECK_BYTES:], file, version,
+                          time.perf_counter() - started)
+
+    def _try_append(self, current: _UserIndex, signature: FileSignature,
+                    started: float) -> bool:
+        """Apply a pure append in place; returns False when a full rebuild is needed"""
+        new_size = signature[1]
+        if new_size <= current.size or current.source != "csv":
+            return False
+
+        with open(self.csv_file, 'rb') as file:
+            tail_start = current.size - len(current.tail)
+            file.seek(tail_start)
+            if file.read(len(current.tail)) != current.tail:
+                return False
+            appended = file.read(new_size - current.size)
+
+        # The previous last line must have been complete, or it was edited
+        if not current.tail.endswith(b'\n') and not appended.startswith((b'\n', b'\r\n')):
+            return False
+
+        # Parse first so a bad append leaves the live index untouched
+        added: Dict = {}
+        self._index_records(added, current.header, appended, current.size)
+
+        # New keys are inserted into the live dict; concurrent readers only ever
+        # see a lookup either miss or hit a fully built entry
+        for user_id, entry in added.items():
+            current.entries.setdefault(user_id, entry)
+
+        tail = (current.tail + appended)[-TAIL_CHECK_BYTES:]
+        self._index = _UserIndex(current.entries, current.header, signature, new_size,
+                                 tail, current.file, current.version + 1,
+                                 time.perf_counter() - started)
+        logger.info("Appended users from %s (%d total)", self.csv_file, len(current.entries))
+        return True
+
+    def _index_records(self, entries: Dict, header: List[str], data: bytes, base_offset: int):
+        """Index the records contained in data; the first occurrence of a user_id wins"""
+        if self.mode == "memory":
+            reader = csv.DictReader(io.StringIO(data.decode('utf-8')), fieldnames=header)
+            for row in reader:
+                if row['user_id'] not in entries:
+                    entries[row['user_id']] = parse_user_row(row)
+            return
+
+        user_id_column = header.index('user_id')
+        for offset, length in iter_record_offsets(data, base_offset):
+            record = data[offset - base_offset:offset - base_offset + length]
+            values = next(csv.reader(io.StringIO(record.decode('utf-8'))))
+            if len(values) <= user_id_column:
+                continue
+            user_id = values[user_id_column]
+            if user_id not in entries:
+                entries[user_id] = (offset, length)
+
+    def stats(self) -> dict:
+        index = self._index
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "loaded": index is not None,
+            "version": self.version,
+            "users": len(index.entries) if index else 0,
+            "overridden_users": len(self._overrides),
+            "load_seconds": index.load_seconds if index else None,
+            "source": index.source if index else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "full_reloads": self.full_reloads,
+            "incremental_reloads": self.incremental_reloads,
+            "reload_errors": self.reload_errors,
+        }
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Data backend comparison: the CSV files vs the SQLite database
+Times a cold catalog load, user lookups (one thread and several threads
+sharing the connection pool) and category queries on each backend, and
+saves the results as JSON.
+
+Usage:
+    python benchmarks/backends.py [--events 100000] [--users 50000] [--output bench_results/backends.json]
+"""
+
+import argparse
+import os
+import random
+import threading
+import time
+
+from harness import environment_info, prepare_environment, summarize, write_results
+
+
+def time_calls(func, iterations: int):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def time_threaded(func, threads: int, iterations: int):
+    """Per-call latency with `threads` threads calling func concurrently"""
+    samples = []
+    lock = threading.Lock()
+
+    def worker():
+        local = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            func()
+            local.append(time.perf_counter() - started)
+        with lock:
+            samples.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the CSV and SQLite data backends")
+    parser.add_argument("--events", type=int, default=100_000, help="Number of synthetic events")
+    parser.add_argument("--users", type=int, default=50_000, help="Number of synthetic users")
+    parser.add_argument("--data-dir", default="bench_data", help="Where the dataset is generated")
+    parser.add_argument("--iterations", type=int, default=200, help="Calls per benchmark")
+    parser.add_argument("--load-iterations", type=int, default=3, help="Cold catalog loads")
+    parser.add_argument("--threads", type=int, default=8, help="Threads for the concurrent lookups")
+    parser.add_argument("--pool-size", type=int, default=8, help="SQLite connections")
+    parser.add_argument("--output", default="bench_results/backends.json", help="JSON results file")
+    args = parser.parse_args()
+
+    dataset = prepare_environment(args.data_dir, args.events, args.users)
+
+    # Imported after the environment points app.config at the synthetic data
+    from app.catalog import CsvEventRepository, EventCatalog
+    from app.config import EVENTS_CSV_PATH, USERS_CSV_PATH
+    from app.sqlite_store import SqliteEventRepository, SqlitePool, SqliteUserStore, import_csv
+    from app.user_store import UserStore
+
+    db_path = os.path.join(args.data_dir, "recsys.db")
+    pool = SqlitePool(db_path, args.pool_size)
+    started = time.perf_counter()
+    import_csv(pool, EVENTS_CSV_PATH, USERS_CSV_PATH)
+    import_seconds = time.perf_counter() - started
+    print(f"Imported into {db_path} in {import_seconds:.2f}s")
+
+    backends = {
+        "csv": (CsvEventRepository(EVENTS_CSV_PATH), UserStore(USERS_CSV_PATH)),
+        "sqlite": (SqliteEventRepository(pool), SqliteUserStore(pool)),
+    }
+    rng = random.Random(0)
+    results = {"sqlite_import_seconds": import_seconds}
+
+    for name, (repository, users) in backends.items():
+        results[f"{name}_catalog_cold_load"] = time_calls(
+            lambda: EventCatalog(repository=repository).refresh(force=True), args.load_iterations
+        )
+
+        users.refresh()
+        user_ids = users.user_ids()
+        results[f"{name}_user_lookup"] = time_calls(
+            lambda: users.get(rng.choice(user_ids)), args.iterations
+        )
+        results[f"{name}_user_lookup_{args.threads}_threads"] = time_threaded(
+            lambda: users.get(rng.choice(user_ids)), args.threads, args.iterations
+        )
+
+        categories = sorted({event.category for event in repository.events_in_categories(
+            {"Technology", "Music", "Business"}, limit=1000)})
+        results[f"{name}_events_in_categories_limit_20"] = time_calls(
+            lambda: repository.events_in_categories([rng.choice(categories)], limit=20),
+            args.iterations
+        )
+        results[f"{name}_events_in_categories_all"] = time_calls(
+            lambda: repository.events_in_categories(categories),
+            max(1, args.iterations // 20)
+        )
+
+    for name, summary in results.items():
+        if isinstance(summary, dict):
+            print(f"{name:40s} p50 {summary['p50_ms']:9.3f} ms   p95 {summary['p95_ms']:9.3f} ms   "
+                  f"p99 {summary['p99_ms']:9.3f} ms")
+    pool.close()
+
+    write_results(args.output, {
+        "benchmark": "backends",
+        "dataset": dataset,
+        "environment": environment_info(),
+        "results": results,
+    })
+
+
+if __name__ == "__main__":
+    main()
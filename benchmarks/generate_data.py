@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator for benchmarks
+Writes events.csv and users.csv in the same format as data/, with skewed
+(Zipf-like) category and city popularity and per-category tag vocabularies.
+
+Usage:
+    python benchmarks/generate_data.py --events 1000000 --users 500000 --out bench_data
+"""
+
+import argparse
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterator
+
+CATEGORIES = [
+    "Technology", "Music", "Business", "Art", "Food", "Sports", "Health", "Education",
+    "Film", "Theater", "Science", "Travel", "Fashion", "Gaming", "Literature", "Charity",
+]
+CITIES = [
+    "New York, NY", "Los Angeles, CA", "Chicago, IL", "Houston, TX", "Phoenix, AZ",
+    "Philadelphia, PA", "San Antonio, TX", "San Diego, CA", "Dallas, TX", "San Francisco, CA",
+    "Austin, TX", "Seattle, WA", "Denver, CO", "Boston, MA", "Nashville, TN", "Portland, OR",
+]
+GENERIC_TAGS = ["networking", "evening", "weekend", "family", "outdoor", "indoor", "beginner",
+                "advanced", "free", "workshop", "community", "live", "online", "culture"]
+FIRST_NAMES = ["Alice", "Bob", "Carol", "Dan", "Eve", "Frank", "Grace", "Heidi", "Ivan", "Judy",
+               "Mallory", "Niaj", "Olivia", "Peggy", "Rupert", "Sybil", "Trent", "Victor", "Wendy"]
+LAST_NAMES = ["Johnson", "Smith", "Davis", "Lee", "Brown", "Garcia", "Miller", "Wilson", "Moore",
+              "Taylor", "Anderson", "Thomas", "Jackson", "White", "Harris", "Martin", "Clark"]
+
+EVENT_FIELDS = ["event_id", "title", "description", "category", "tags", "location", "date",
+                "price", "organizer", "capacity", "rating"]
+USER_FIELDS = ["user_id", "name", "email", "age", "location", "created_at", "categories"]
+
+
+def zipf_weights(count: int, exponent: float = 1.1):
+    return [1.0 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def category_tags(category: str):
+    """A small tag vocabulary specific to each category"""
+    base = category.lower()
+    return [f"{base}", f"{base} meetup", f"{base} talk", f"{base} expo", f"intro to {base}",
+            f"{base} masterclass", f"{base} night", f"{base} festival"]
+
+
+def generate_events(count: int, seed: int = 42,
+                    start: datetime = datetime(2025, 1, 1)) -> Iterator[Dict[str, str]]:
+    """Yield events.csv rows as dicts"""
+    rng = random.Random(seed)
+    category_weights = zipf_weights(len(CATEGORIES))
+    city_weights = zipf_weights(len(CITIES), 0.8)
+    tag_pools = {category: category_tags(category) for category in CATEGORIES}
+
+    for i in range(1, count + 1):
+        category = rng.choices(CATEGORIES, category_weights)[0]
+        tags = rng.sample(tag_pools[category], rng.randint(1, 3)) + \
+            rng.sample(GENERIC_TAGS, rng.randint(1, 3))
+        free = rng.random() < 0.2
+        yield {
+            "event_id": f"event_{i}",
+            "title": f"{rng.choice(tag_pools[category]).title()} #{i}",
+            "description": f"A {category.lower()} event featuring {', '.join(tags[:-1])} and {tags[-1]}",
+            "category": category,
+            "tags": ";".join(tags),
+            "location": rng.choices(CITIES, city_weights)[0],
+            "date": (start + timedelta(minutes=30 * rng.randint(0, 2 * 365 * 48))).isoformat(),
+            "price": "0.0" if free else f"{rng.lognormvariate(3.5, 0.8):.2f}",
+            "organizer": f"Organizer {int(rng.paretovariate(1.2)) % 5000}",
+            "capacity": "" if rng.random() < 0.05 else str(rng.choice([25, 50, 100, 200, 500, 1000])),
+            "rating": "" if rng.random() < 0.1 else f"{min(5.0, max(1.0, rng.gauss(4.2, 0.5))):.1f}",
+        }
+
+
+def generate_users(count: int, seed: int = 7,
+                   start: datetime = datetime(2024, 1, 1)) -> Iterator[Dict[str, str]]:
+    """Yield users.csv rows as dicts"""
+    rng = random.Random(seed)
+    category_weights = zipf_weights(len(CATEGORIES))
+
+    for i in range(1, count + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        interests = set()
+        for _ in range(rng.randint(1, 4)):
+            interests.add(rng.choices(CATEGORIES, category_weights)[0])
+        yield {
+            "user_id": f"user_{i}",
+            "name": f"{first} {last}",
+            "email": f"{first.lower()}.{last.lower()}{i}@example.com",
+            "age": "" if rng.random() < 0.1 else str(rng.randint(18, 75)),
+            "location": rng.choice(CITIES).split(",")[0],
+            "created_at": (start + timedelta(seconds=rng.randint(0, 365 * 86400))).isoformat(),
+            "categories": ";".join(sorted(interests)),
+        }
+
+
+def write_csv(path: str, fields, rows: Iterator[Dict[str, str]]) -> int:
+    written = 0
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            written += 1
+    return written
+
+
+def generate_dataset(out_dir: str, events: int, users: int, seed: int = 42):
+    """Write events.csv and users.csv into out_dir; returns their paths"""
+    os.makedirs(out_dir, exist_ok=True)
+    events_path = os.path.join(out_dir, "events.csv")
+    users_path = os.path.join(out_dir, "users.csv")
+    write_csv(events_path, EVENT_FIELDS, generate_events(events, seed))
+    write_csv(users_path, USER_FIELDS, generate_users(users, seed + 1))
+    return events_path, users_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic events.csv and users.csv")
+    parser.add_argument("--events", type=int, default=100_000, help="Number of events")
+    parser.add_argument("--users", type=int, default=50_000, help="Number of users")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--out", default="bench_data", help="Output directory")
+    args = parser.parse_args()
+
+    events_path, users_path = generate_dataset(args.out, args.events, args.users, args.seed)
+    print(f"Wrote {args.events:,} events to {events_path}")
+    print(f"Wrote {args.users:,} users to {users_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Shared helpers for the benchmark scripts
+Prepares a synthetic dataset, points the app configuration at it and
+summarizes latency samples.
+"""
+
+import json
+import os
+import platform
+import sys
+import time
+from typing import Dict, List
+
+# Make the app package importable when run as a script
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from generate_data import generate_dataset  # noqa: E402
+
+
+def prepare_environment(data_dir: str, events: int, users: int, cache_size: int = 10000) -> Dict:
+    """
+    Generate the dataset (unless it already exists with these sizes) and
+    configure the app to use it. Must run before anything imports app.config.
+    """
+    marker = os.path.join(data_dir, "dataset.json")
+    dataset = {"events": events, "users": users}
+    try:
+        with open(marker) as file:
+            existing = json.load(file)
+    except (FileNotFoundError, ValueError):
+        existing = None
+    if existing != dataset:
+        started = time.perf_counter()
+        generate_dataset(data_dir, events, users)
+        with open(marker, "w") as file:
+            json.dump(dataset, file)
+        print(f"Generated {events:,} events and {users:,} users in "
+              f"{time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    os.environ["EVENTS_CSV_PATH"] = os.path.join(data_dir, "events.csv")
+    os.environ["USERS_CSV_PATH"] = os.path.join(data_dir, "users.csv")
+    os.environ["EVENTS_SNAPSHOT_PATH"] = os.path.join(data_dir, "events.snapshot")
+    os.environ["USERS_SNAPSHOT_PATH"] = os.path.join(data_dir, "users.snapshot")
+    # Data does not change during a run
+    os.environ["DATA_RELOAD_INTERVAL"] = "0"
+    os.environ["RECOMMENDATION_CACHE_MAX_SIZE"] = str(cache_size)
+    return dataset
+
+
+def percentile(sorted_samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, int(round(fraction * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds from samples in seconds"""
+    ordered = sorted(samples)
+    count = len(ordered)
+    return {
+        "count": count,
+        "mean_ms": 1000 * sum(ordered) / count if count else 0.0,
+        "min_ms": 1000 * ordered[0] if count else 0.0,
+        "p50_ms": 1000 * percentile(ordered, 0.50),
+        "p95_ms": 1000 * percentile(ordered, 0.95),
+        "p99_ms": 1000 * percentile(ordered, 0.99),
+        "max_ms": 1000 * ordered[-1] if count else 0.0,
+    }
+
+
+def environment_info() -> Dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": str(os.cpu_count()),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def write_results(path: str, results: Dict):
+    """Save results as JSON so runs can be compared"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {path}", file=sys.stderr)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+In-process load harness
+Drives the ASGI app through httpx's ASGITransport (no network, no server
+process) with a fixed number of concurrent clients per endpoint, and reports
+throughput and p50/p95/p99 latency. Results are saved as JSON.
+
+Usage:
+    python benchmarks/load.py [--events 100000] [--users 50000] [--requests 2000] [--concurrency 32]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+from harness import environment_info, prepare_environment, summarize, write_results
+
+
+def build_scenarios(user_ids, categories, rng, batch_size):
+    """Endpoint name -> function returning (method, url, json body) for one request"""
+    return {
+        "events_page": lambda: ("GET", f"/events/?offset={rng.randrange(1000)}&limit=50", None),
+        "events_stream_filtered": lambda: (
+            "GET", f"/events/stream?category={rng.choice(categories)}&max_price=20", None
+        ),
+        "user_recommendations": lambda: (
+            "GET", f"/users/{rng.choice(user_ids)}/recommendations/", None
+        ),
+        "batch_recommendations": lambda: (
+            "POST", "/recommendations/batch", {"user_ids": rng.sample(user_ids, batch_size)}
+        ),
+    }
+
+
+async def run_scenario(client, make_request, requests: int, concurrency: int):
+    samples = []
+    statuses = Counter()
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            method, url, body = make_request()
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            await response.aread()
+            samples.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    summary = summarize(samples)
+    summary["throughput_rps"] = len(samples) / elapsed if elapsed else 0.0
+    summary["elapsed_s"] = elapsed
+    summary["status_codes"] = {str(code): count for code, count in sorted(statuses.items())}
+    return summary
+
+
+async def run(args):
+    import httpx
+
+    # Imported after the environment points app.config at the synthetic data
+    from app.main import app, user_store, event_catalog
+
+    rng = random.Random(0)
+    results = {}
+    async with app.router.lifespan_context(app):
+        user_ids = user_store.user_ids()
+        categories = list(event_catalog.get_snapshot().events.categories)
+        scenarios = build_scenarios(user_ids, categories, rng,
+                                    min(args.batch_size, len(user_ids)))
+        selected = args.endpoints or list(scenarios)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for name in selected:
+                requests = args.requests if name != "batch_recommendations" else \
+                    max(1, args.requests // 20)
+                results[name] = await run_scenario(client, scenarios[name], requests,
+                                                   args.concurrency)
+                summary = results[name]
+                print(f"{name:24s} {summary['throughput_rps']:9.1f} req/s   "
+                      f"p50 {summary['p50_ms']:8.2f} ms   p95 {summary['p95_ms']:8.2f} ms   "
+                      f"p99 {summary['p99_ms']:8.2f} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process ASGI load harness")
+    parser.add_argument("--events", type=int, default=100_000, help="Number of synthetic events")
+    parser.add_argument("--users", type=int, default=50_000, help="Number of synthetic users")
+    parser.add_argument("--data-dir", default="bench_data", help="Where the dataset is generated")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--batch-size", type=int, default=100, help="Users per batch request")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the recommendation cache")
+    parser.add_argument("--endpoints", nargs="*", help="Subset of endpoints to run")
+    parser.add_argument("--output", default="bench_results/load.json", help="JSON results file")
+    args = parser.parse_args()
+
+    dataset = prepare_environment(args.data_dir, args.events, args.users,
+                                  cache_size=0 if args.no_cache else 10000)
+    results = asyncio.run(run(args))
+
+    write_results(args.output, {
+        "benchmark": "load",
+        "dataset": dataset,
+        "environment": environment_info(),
+        "settings": {"requests": args.requests, "concurrency": args.concurrency,
+                     "batch_size": args.batch_size, "cache": not args.no_cache},
+        "results": results,
+    })
+
+
+if __name__ == "__main__":
+    main()
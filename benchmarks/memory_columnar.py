@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Memory comparison: list of pydantic Event objects vs the columnar event store
+
+Usage:
+    python benchmarks/memory_columnar.py [--events 100000]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+# Make the app package importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.catalog import parse_event_row  # noqa: E402
+from app.columnar import EventColumns  # noqa: E402
+from generate_data import generate_events  # noqa: E402
+
+
+def make_events(count: int, seed: int = 42):
+    for row in generate_events(count, seed):
+        yield parse_event_row(row)
+
+
+def measure(build):
+    """Return (result, bytes still allocated after building it)"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=100_000, help="Number of synthetic events")
+    args = parser.parse_args()
+
+    events, list_bytes = measure(lambda: list(make_events(args.events)))
+    del events
+    columns, columnar_bytes = measure(lambda: EventColumns.from_events(make_events(args.events)))
+
+    print(f"Events:               {args.events:,}")
+    print(f"List[Event]:          {list_bytes / 2**20:10.1f} MiB  ({list_bytes / args.events:.0f} B/event)")
+    print(f"EventColumns:         {columnar_bytes / 2**20:10.1f} MiB  ({columnar_bytes / args.events:.0f} B/event)")
+    print(f"  of which buffers:   {columns.nbytes / 2**20:10.1f} MiB")
+    print(f"Reduction:            {list_bytes / columnar_bytes:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the data access and scoring functions
+Times read_events_from_csv, read_user_from_csv and
+ContentBasedRecommendationEngine.get_recommendations on synthetic data,
+plus a cold catalog load, and saves the results as JSON.
+
+Usage:
+    python benchmarks/micro.py [--events 100000] [--users 50000] [--output bench_results/micro.json]
+"""
+
+import argparse
+import random
+import time
+
+from harness import environment_info, prepare_environment, summarize, write_results
+
+
+def time_calls(func, iterations: int):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for data access and scoring")
+    parser.add_argument("--events", type=int, default=100_000, help="Number of synthetic events")
+    parser.add_argument("--users", type=int, default=50_000, help="Number of synthetic users")
+    parser.add_argument("--data-dir", default="bench_data", help="Where the dataset is generated")
+    parser.add_argument("--iterations", type=int, default=200, help="Calls per benchmark")
+    parser.add_argument("--load-iterations", type=int, default=3, help="Cold catalog loads")
+    parser.add_argument("--limit", type=int, default=10, help="Recommendations per user")
+    parser.add_argument("--output", default="bench_results/micro.json", help="JSON results file")
+    args = parser.parse_args()
+
+    dataset = prepare_environment(args.data_dir, args.events, args.users)
+
+    # Imported after the environment points app.config at the synthetic data
+    from app import main as app_main
+    from app.catalog import EventCatalog
+    from app.config import EVENTS_CSV_PATH
+
+    rng = random.Random(0)
+    results = {}
+
+    results["catalog_cold_load"] = time_calls(
+        lambda: EventCatalog(EVENTS_CSV_PATH).refresh(force=True), args.load_iterations
+    )
+
+    app_main.event_catalog.refresh()
+    app_main.user_store.refresh()
+    user_ids = app_main.user_store.user_ids()
+    preferences = [app_main.user_store.get(user_id)[1]
+                   for user_id in rng.sample(user_ids, min(len(user_ids), 1000))]
+
+    results["read_events_from_csv"] = time_calls(app_main.read_events_from_csv, args.iterations)
+    results["read_user_from_csv"] = time_calls(
+        lambda: app_main.read_user_from_csv(rng.choice(user_ids)), args.iterations
+    )
+
+    events = app_main.read_events_from_csv()
+    engine = app_main.recommendation_engine
+    results["get_recommendations"] = time_calls(
+        lambda: engine.get_recommendations(rng.choice(preferences), events, args.limit),
+        args.iterations
+    )
+
+    batch = preferences[:100]
+    results["get_recommendations_batch_100"] = time_calls(
+        lambda: engine.get_recommendations_batch(batch, events, args.limit),
+        max(1, args.iterations // 10)
+    )
+
+    for name, summary in results.items():
+        print(f"{name:32s} p50 {summary['p50_ms']:9.3f} ms   p95 {summary['p95_ms']:9.3f} ms   "
+              f"p99 {summary['p99_ms']:9.3f} ms")
+
+    write_results(args.output, {
+        "benchmark": "micro",
+        "dataset": dataset,
+        "environment": environment_info(),
+        "results": results,
+    })
+
+
+if __name__ == "__main__":
+    main()
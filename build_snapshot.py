@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Events Recommendation System - Snapshot Builder
+Compile events.csv and users.csv into binary snapshots that the server
+memory-maps at startup instead of parsing the CSV files
+"""
+
+import argparse
+import time
+
+from app.config import EVENTS_CSV_PATH, USERS_CSV_PATH, EVENTS_SNAPSHOT_PATH, USERS_SNAPSHOT_PATH
+from app.snapshot import write_events_snapshot, write_users_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the CSV data files into binary snapshots")
+    parser.add_argument("--events", default=EVENTS_CSV_PATH, help="Source events CSV")
+    parser.add_argument("--users", default=USERS_CSV_PATH, help="Source users CSV")
+    parser.add_argument("--events-out", default=EVENTS_SNAPSHOT_PATH, help="Events snapshot to write")
+    parser.add_argument("--users-out", default=USERS_SNAPSHOT_PATH, help="Users snapshot to write")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    count = write_events_snapshot(args.events, args.events_out)
+    print(f"Wrote {count} events to {args.events_out} in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    count = write_users_snapshot(args.users, args.users_out)
+    print(f"Wrote {count} users to {args.users_out} in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
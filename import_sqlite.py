@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Events Recommendation System - SQLite Importer
+Load events.csv and users.csv into the SQLite database served with
+DATA_BACKEND=sqlite, replacing the tables' previous contents
+"""
+
+import argparse
+import time
+
+from app.config import EVENTS_CSV_PATH, USERS_CSV_PATH, SQLITE_PATH
+from app.sqlite_store import SqlitePool, import_csv
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the CSV data files into SQLite")
+    parser.add_argument("--events", default=EVENTS_CSV_PATH, help="Source events CSV")
+    parser.add_argument("--users", default=USERS_CSV_PATH, help="Source users CSV")
+    parser.add_argument("--db", default=SQLITE_PATH, help="SQLite database to write")
+    args = parser.parse_args()
+
+    pool = SqlitePool(args.db, 1)
+    started = time.perf_counter()
+    events, users = import_csv(pool, args.events, args.users)
+    pool.close()
+    print(f"Imported {events} events and {users} users into {args.db} "
+          f"in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
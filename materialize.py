@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Events Recommendation System - Recommendations Materializer
+Rank every user ahead of time and write the top-N events of each to the store
+that /users/{user_id}/recommendations/ serves from while it matches the
+current catalog
+
+    python materialize.py                   # build the store once
+    python materialize.py --interval 600    # rebuild whenever the inputs changed, every 10 minutes
+"""
+
+import argparse
+import logging
+import time
+
+from app.config import (
+    EVENTS_CSV_PATH, USERS_CSV_PATH, EVENTS_SNAPSHOT_PATH, USERS_SNAPSHOT_PATH,
+    EVENTS_DELTA_PATH, USERS_DELTA_PATH, RATINGS_LOG_PATH, SCORING_MODE, DATA_BACKEND, SQLITE_PATH,
+    MATERIALIZED_PATH, MATERIALIZE_LIMIT, MATERIALIZE_WORKERS, MATERIALIZE_CHUNK_SIZE
+)
+from app.materialized import MaterializeJob, MaterializeSources
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the recommendations of every user")
+    parser.add_argument("--events", default=EVENTS_CSV_PATH, help="Source events CSV")
+    parser.add_argument("--users", default=USERS_CSV_PATH, help="Source users CSV")
+    parser.add_argument("--out", default=MATERIALIZED_PATH or "data/recommendations.snapshot",
+                        help="Store to write")
+    parser.add_argument("--limit", type=int, default=MATERIALIZE_LIMIT,
+                        help="Recommendations stored per user")
+    parser.add_argument("--scoring", default=SCORING_MODE, help="Scoring mode, as served")
+    parser.add_argument("--workers", type=int, default=MATERIALIZE_WORKERS,
+                        help="Worker processes")
+    parser.add_argument("--chunk-size", type=int, default=MATERIALIZE_CHUNK_SIZE,
+                        help="Users scored per task")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="Keep running and rebuild every INTERVAL seconds when the inputs changed")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # The same inputs the server loads, so the store matches its catalog
+    sources = MaterializeSources(args.events, args.users, EVENTS_SNAPSHOT_PATH, USERS_SNAPSHOT_PATH,
+                                 EVENTS_DELTA_PATH, USERS_DELTA_PATH, RATINGS_LOG_PATH,
+                                 SQLITE_PATH if DATA_BACKEND == "sqlite" else None)
+    job = MaterializeJob(sources, args.out, args.limit, args.scoring, args.workers,
+                         args.chunk_size)
+
+    started = time.perf_counter()
+    job.refresh(force=True)
+    print(f"Wrote recommendations to {args.out} in {time.perf_counter() - started:.2f}s")
+    while args.interval > 0:
+        time.sleep(args.interval)
+        started = time.perf_counter()
+        if job.refresh():
+            print(f"Rebuilt {args.out} in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
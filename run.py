@@ -2,10 +2,93 @@
 """
 Events Recommendation System - Startup Script
 Run this script to start the FastAPI server
+
+    python run.py                              # development server with auto-reload
+    python run.py --production --workers 4     # multi-process server sharing one catalog
 """
 
+import argparse
+import os
+import sys
+import tempfile
+
 import uvicorn
 
+# Outside data/, which may be a read-only mount (see docker-compose.yml)
+DEFAULT_SHARED_CATALOG_DIR = os.path.join(tempfile.gettempdir(), "recommendation-shared")
+
+
+def run_production(workers=None):
+    """
+    Serve with several worker processes. With the CSV backend this process is
+    the single loader: it compiles the CSVs into snapshots and publishes them,
+    and every worker attaches to the published snapshots read-only instead of
+    parsing the CSVs. With the SQLite backend every worker reads the database.
+    """
+    if os.getenv("DATA_BACKEND", "csv") == "csv":
+        # Set before the app configuration is imported here or in any worker
+        os.environ.setdefault("SHARED_CATALOG_DIR", DEFAULT_SHARED_CATALOG_DIR)
+
+    from app.config import (
+        API_HOST, API_PORT, API_WORKERS, DATA_RELOAD_INTERVAL, EVENTS_CSV_PATH, USERS_CSV_PATH,
+        EVENTS_DELTA_PATH, USERS_DELTA_PATH, DELTA_COMPACT_INTERVAL, SHARED_CATALOG_DIR, RATINGS_LOG_PATH, SCORING_MODE,
+        DATA_BACKEND, SQLITE_PATH, MATERIALIZED_PATH, MATERIALIZE_LIMIT, MATERIALIZE_INTERVAL,
+        MATERIALIZE_WORKERS, MATERIALIZE_CHUNK_SIZE
+    )
+    from app.deltas import DeltaLog
+    from app.materialized import MaterializeJob, MaterializeSources
+    from app.reloader import BackgroundReloader
+    from app.shared import SharedDataPublisher
+
+    if SHARED_CATALOG_DIR:
+        # Workers log /admin deltas; the loader publishes them on its next check
+        # and periodically folds them into the CSVs
+        publisher = SharedDataPublisher(SHARED_CATALOG_DIR, EVENTS_CSV_PATH, USERS_CSV_PATH,
+                                        DeltaLog(EVENTS_DELTA_PATH), DeltaLog(USERS_DELTA_PATH),
+                                        DELTA_COMPACT_INTERVAL)
+        try:
+            # Publish before any worker starts so none of them has to wait for data
+            publisher.refresh()
+        except OSError as exc:
+            # Without a writable directory every worker loads the data itself
+            print(f"Cannot publish the shared catalog in {SHARED_CATALOG_DIR}: {exc}; "
+                  f"workers will load the data themselves", file=sys.stderr)
+            os.environ["SHARED_CATALOG_DIR"] = ""
+        else:
+            # Later CSV changes are published as new versions that workers pick up together
+            BackgroundReloader([publisher], DATA_RELOAD_INTERVAL).start()
+    if MATERIALIZED_PATH:
+        # The store is rebuilt here once for all workers, from the compacted CSVs or the database
+        if DATA_BACKEND == "sqlite":
+            sources = MaterializeSources(EVENTS_CSV_PATH, USERS_CSV_PATH,
+                                         events_delta=EVENTS_DELTA_PATH,
+                                         ratings_log=RATINGS_LOG_PATH, sqlite_path=SQLITE_PATH)
+        else:
+            sources = MaterializeSources(EVENTS_CSV_PATH, USERS_CSV_PATH,
+                                         ratings_log=RATINGS_LOG_PATH)
+        job = MaterializeJob(sources, MATERIALIZED_PATH, MATERIALIZE_LIMIT, SCORING_MODE,
+                             MATERIALIZE_WORKERS, MATERIALIZE_CHUNK_SIZE)
+        BackgroundReloader([job], MATERIALIZE_INTERVAL).start()
+        # Workers inherit the environment; only this process runs the schedule
+        os.environ["MATERIALIZE_INTERVAL"] = "0"
+
+    uvicorn.run("app.main:app", host=API_HOST, port=API_PORT, workers=workers or API_WORKERS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start the Events Recommendation System API")
+    parser.add_argument("--production", action="store_true",
+                        help="Run without auto-reload, with worker processes sharing one catalog")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes in production mode (default: API_WORKERS)")
+    args = parser.parse_args()
+
+    if args.production:
+        run_production(args.workers)
+    else:
+        # Run the FastAPI app from the app module
+        uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+
+
 if __name__ == "__main__":
-    # Run the FastAPI app from the app module
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    main()
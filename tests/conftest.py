@@ -0,0 +1,49 @@
+"""
+Fixtures shared by the test modules
+"""
+
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.columnar import EventColumnsBuilder
+
+
+@pytest.fixture
+def new_event_row():
+    """Factory of events.csv rows, as carried by event upsert records"""
+    def make(event_id, title="New Event", category="Music"):
+        return {
+            "event_id": event_id, "title": title, "description": "Added by a delta",
+            "category": category, "tags": "live;jazz", "location": "Austin, TX",
+            "date": "2025-02-01T20:00:00", "price": "10.0", "organizer": "Someone",
+            "capacity": "", "rating": "4.0",
+        }
+    return make
+
+
+@pytest.fixture
+def make_columns():
+    """Factory of synthetic columnar catalogs with random categories, places, dates and prices"""
+    def make(count=500, seed=11, categories=("Music", "Art", "Technology"),
+             locations=("Austin, TX",)):
+        rng = random.Random(seed)
+        builder = EventColumnsBuilder()
+        for i in range(count):
+            category = rng.choice(categories)
+            builder.append(
+                event_id=f"event_{i}", title=f"Event {i}", description=f"{category} event",
+                category=category, tags=[category.lower()], location=rng.choice(locations),
+                date=datetime(2025, 1, 1) + timedelta(hours=rng.randint(0, 24 * 60)),
+                price=rng.choice([0.0, 10.0, 25.5, 80.0, 150.0]), organizer="Someone",
+                capacity=None, rating=rng.choice([None, 3.0, 4.2, 4.5, 5.0])
+            )
+        return builder.build()
+    return make
+
+
+@pytest.fixture
+def dumps():
+    """model_dump of every item, to compare lists of pydantic models"""
+    return lambda items: [item.model_dump() for item in items]
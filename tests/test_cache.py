@@ -0,0 +1,45 @@
+"""
+Tests for the recommendation result cache
+"""
+
+import time
+
+from app.cache import RecommendationCache, preferences_fingerprint
+from app.models import UserPreferences
+
+
+def test_lru_eviction_keeps_recently_used_entries():
+    cache = RecommendationCache(max_size=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = RecommendationCache(max_size=10, ttl=0.01)
+    cache.put("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_zero_size_disables_cache():
+    cache = RecommendationCache(max_size=0, ttl=60)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_fingerprint_ignores_order_case_and_duplicates():
+    first = UserPreferences(categories=["Music", "Art"])
+    second = UserPreferences(categories=["art", "MUSIC", "Music"])
+    assert preferences_fingerprint(first) == preferences_fingerprint(second)
+    assert preferences_fingerprint(first) != preferences_fingerprint(UserPreferences(categories=["Art"]))
@@ -0,0 +1,52 @@
+"""
+Tests for the in-memory event catalog and its hot reload
+"""
+
+import os
+import shutil
+
+from app.catalog import EventCatalog
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+EVENTS_FILE = os.path.join(PROJECT_ROOT, "data", "events.csv")
+
+
+def test_catalog_loads_once_and_reloads_on_change(tmp_path):
+    """The catalog keeps its snapshot until the file changes, then swaps it"""
+    events_file = tmp_path / "events.csv"
+    shutil.copy(EVENTS_FILE, events_file)
+
+    catalog = EventCatalog(str(events_file))
+    first = catalog.get_snapshot()
+    assert len(first.events) == 8
+    assert first.version == 1
+
+    # No change on disk: refresh is a no-op and the same snapshot is served
+    assert catalog.refresh() is False
+    assert catalog.get_snapshot() is first
+
+    with open(events_file, "a", encoding="utf-8") as file:
+        file.write('\nevent_9,"Extra","Added later",Music,"jazz","Boston, MA",'
+                   '2025-02-01T19:00:00,10.0,Somebody,,\n')
+
+    assert catalog.refresh() is True
+    second = catalog.get_snapshot()
+    assert second.version == 2
+    assert len(second.events) == 9
+    # Readers holding the old snapshot still see a complete, unchanged list
+    assert len(first.events) == 8
+
+
+def test_catalog_keeps_last_good_snapshot_on_bad_file(tmp_path):
+    events_file = tmp_path / "events.csv"
+    shutil.copy(EVENTS_FILE, events_file)
+
+    catalog = EventCatalog(str(events_file))
+    first = catalog.get_snapshot()
+
+    with open(events_file, "a", encoding="utf-8") as file:
+        file.write("\nevent_9,broken,row,Music,,x,not-a-date,free,x,,\n")
+
+    assert catalog.refresh() is False
+    assert catalog.get_snapshot() is first
+    assert catalog.reload_errors == 1
@@ -0,0 +1,106 @@
+"""
+Tests for the columnar event store
+"""
+
+import csv
+import os
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.catalog import event_to_row, load_events_csv
+from app.columnar import EventColumns, load_event_columns
+from app.models import Event, UserPreferences
+from app.recommendation_engine import ContentBasedRecommendationEngine
+from app.serialization import EncodedEvents
+from app.snapshot import SnapshotFile, read_events_snapshot, write_events_snapshot
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+EVENTS_FILE = os.path.join(PROJECT_ROOT, "data", "events.csv")
+
+AWARE_DATES = ["2025-01-24T09:00:00+02:00", "2025-01-24T09:00:00-05:30",
+               "2025-01-24T09:00:00+00:00", "2025-01-24T09:00:00.250000+09:00",
+               "2025-01-24T09:00:00"]
+
+
+def write_aware_events(path):
+    """The sample events with dates given in several UTC offsets"""
+    with open(EVENTS_FILE, newline="") as file:
+        reader = csv.DictReader(file)
+        fieldnames = reader.fieldnames
+        rows = list(reader)
+    for row, date in zip(rows, AWARE_DATES):
+        row["date"] = date
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+def baseline_events(path):
+    """Events as the original per-request CSV reader built them"""
+    with open(path, encoding="utf-8") as file:
+        return [Event(event_id=row["event_id"], title=row["title"],
+                      description=row["description"], category=row["category"],
+                      tags=row["tags"].split(";") if row["tags"] else [],
+                      location=row["location"], date=datetime.fromisoformat(row["date"]),
+                      price=float(row["price"]), organizer=row["organizer"],
+                      capacity=int(row["capacity"]) if row["capacity"] else None,
+                      rating=float(row["rating"]) if row["rating"] else None)
+                for row in csv.DictReader(file)]
+
+
+def test_columns_materialize_the_same_events_as_the_csv_parser():
+    events = load_events_csv(EVENTS_FILE)
+    columns = load_event_columns(EVENTS_FILE)
+
+    assert len(columns) == len(events)
+    assert [event.model_dump() for event in columns] == [event.model_dump() for event in events]
+
+
+def test_missing_values_and_unicode_round_trip():
+    event = Event(event_id="e1", title="Café ☕", description="Ünïcode", category="Food",
+                  tags=[], location="Paris", date=datetime(2025, 3, 1, 12, 30, 15, 250),
+                  organizer="Chez Nous")
+
+    restored = EventColumns.from_events([event])[0]
+
+    assert restored.model_dump() == event.model_dump()
+    assert restored.capacity is None and restored.rating is None
+
+
+def test_aware_dates_match_the_baseline_encoding(tmp_path):
+    path = str(tmp_path / "events.csv")
+    rows = write_aware_events(path)
+    expected = JSONResponse(jsonable_encoder(baseline_events(path))).body
+
+    columns = load_event_columns(path)
+    assert EncodedEvents(columns).body == expected
+    assert EncodedEvents(columns.take(range(len(columns)))).body == expected
+    assert EncodedEvents(columns.take([0, 1]).concat(columns.take(range(2, len(columns))))).body \
+        == expected
+    # Dates are still compared as UTC, e.g. by the date filters
+    assert columns.dates[0] == columns.dates[2] - 2 * 3600 * 1_000_000
+
+    snapshot_path = str(tmp_path / "events.snapshot")
+    write_events_snapshot(path, snapshot_path)
+    snapshot_columns, encoded = read_events_snapshot(SnapshotFile(snapshot_path))
+    assert encoded.body == expected
+    assert EncodedEvents(snapshot_columns).body == expected
+
+    # Rows written back by delta compaction keep the original offsets
+    assert [event_to_row(event)["date"] for event in columns] == [row["date"] for row in rows]
+
+
+def test_engine_scores_columns_like_a_list_of_events():
+    events = load_events_csv(EVENTS_FILE)
+    columns = load_event_columns(EVENTS_FILE)
+    engine = ContentBasedRecommendationEngine()
+    preferences = UserPreferences(categories=["Food", "Art", "Business"])
+
+    from_list = engine.get_recommendations(preferences, events, limit=6)
+    from_columns = engine.get_recommendations(preferences, columns, limit=6)
+
+    assert [rec.model_dump() for rec in from_columns] == [rec.model_dump() for rec in from_list]
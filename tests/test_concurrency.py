@@ -0,0 +1,58 @@
+"""
+Tests for the worker pool helpers and single-flight request coalescing
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.concurrency import SingleFlight, run_blocking
+
+
+def test_concurrent_calls_share_one_computation():
+    calls = []
+
+    def compute():
+        calls.append(threading.current_thread().name)
+        time.sleep(0.05)
+        return "result"
+
+    async def scenario():
+        flights = SingleFlight()
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="pool") as pool:
+            results = await asyncio.gather(*(
+                flights.run("key", lambda: run_blocking(pool, compute)) for _ in range(10)
+            ))
+        return flights, results
+
+    flights, results = asyncio.run(scenario())
+
+    assert results == ["result"] * 10
+    assert len(calls) == 1 and calls[0].startswith("pool")
+    assert flights.stats() == {"in_flight": 0, "started": 1, "shared": 9}
+
+
+def test_errors_reach_every_caller_and_are_not_cached():
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def scenario():
+        flights = SingleFlight()
+        results = await asyncio.gather(flights.run("key", failing), flights.run("key", failing),
+                                       return_exceptions=True)
+        # A later call starts a fresh computation
+        with pytest.raises(ValueError):
+            await flights.run("key", failing)
+        return results
+
+    results = asyncio.run(scenario())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(attempts) == 2
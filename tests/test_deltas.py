@@ -0,0 +1,241 @@
+"""
+Tests for incremental delta ingestion and compaction
+"""
+
+import csv
+import os
+import random
+import shutil
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.catalog import (
+    EventCatalog, apply_event_deltas, event_to_row, load_events_csv, parse_event_row
+)
+from app.columnar import EventColumns
+from app.deltas import DeltaBatcher, DeltaLog, delete_record, resolve_deltas, upsert_record
+from app.filters import FilterIndex
+from app.recommendation_engine import ContentBasedRecommendationEngine
+from app.serialization import EncodedEvents
+from app.user_store import UserStore
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+EVENTS_FILE = os.path.join(PROJECT_ROOT, "data", "events.csv")
+USERS_FILE = os.path.join(PROJECT_ROOT, "data", "users.csv")
+
+
+def parse_planned_rows(plan, rows):
+    return [parse_event_row(rows[entry] if isinstance(entry, int) else entry) for entry in plan]
+
+
+def test_resolve_deltas_ordering():
+    records = [
+        upsert_record("b", {"v": "b2"}),      # replaced in place
+        upsert_record("x", {"v": "x1"}),      # appended
+        delete_record("c"),
+        upsert_record("c", {"v": "c2"}),      # deleted then re-added: moves to the end
+        upsert_record("x", {"v": "x2"}),      # replaces the appended row
+        upsert_record("y", {"v": "y1"}),
+        delete_record("y"),                   # never reaches the output
+        delete_record("missing"),
+    ]
+    assert resolve_deltas(["a", "b", "c", "d"], records) == \
+        [0, {"v": "b2"}, 3, {"v": "x2"}, {"v": "c2"}]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_splice_matches_full_rebuild(seed, new_event_row, dumps):
+    rng = random.Random(seed)
+    events = load_events_csv(EVENTS_FILE)
+    columns = EventColumns.from_events(events)
+    rows = [event_to_row(event) for event in events]
+    ids = [f"event_{i}" for i in range(1, 13)]
+    records = []
+    for _ in range(rng.randint(1, 8)):
+        event_id = rng.choice(ids)
+        if rng.random() < 0.35:
+            records.append(delete_record(event_id))
+        else:
+            row = new_event_row(event_id, title=f"T{rng.random()}",
+                                category=rng.choice(["Music", "Brand New"]))
+            records.append(upsert_record(event_id, row))
+
+    spliced, encoded, _ = apply_event_deltas(columns, EncodedEvents(columns), records)
+
+    expected = EventColumns.from_events(
+        parse_planned_rows(resolve_deltas([row["event_id"] for row in rows], records), rows))
+    assert dumps(spliced) == dumps(expected)
+    assert encoded.body == EncodedEvents(expected).body
+    assert [encoded.fragment(i) for i in range(encoded.count)] == \
+        [EncodedEvents(expected).fragment(i) for i in range(len(expected))]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_patched_indexes_match_full_build(seed, new_event_row):
+    rng = random.Random(seed)
+    events = load_events_csv(EVENTS_FILE)
+    columns = EventColumns.from_events(events)
+    ids = [event.event_id for event in events] + ["event_new_1", "event_new_2"]
+    records = []
+    for _ in range(rng.randint(1, 8)):
+        event_id = rng.choice(ids)
+        if rng.random() < 0.3:
+            records.append(delete_record(event_id))
+            continue
+        # Values shared with other events, so upserted rows land inside runs of ties
+        other = rng.choice(events)
+        row = new_event_row(event_id, title=f"T{rng.random()}",
+                            category=rng.choice([other.category, "Brand New", "music"]))
+        row.update(date=other.date.isoformat(), price=str(other.price),
+                   location=rng.choice([other.location, "Nowhere, ZZ"]),
+                   rating=rng.choice(["", "4.0", str(other.rating or "")]))
+        records.append(upsert_record(event_id, row))
+
+    spliced, _, splice = apply_event_deltas(columns, EncodedEvents(columns), records)
+
+    patched = FilterIndex(spliced, FilterIndex(columns), splice)
+    fresh = FilterIndex(spliced)
+    for name in ("date_order", "sorted_dates", "price_order", "sorted_prices",
+                 "rating_order", "sorted_ratings"):
+        # NaN ratings compare equal here
+        np.testing.assert_array_equal(getattr(patched, name), getattr(fresh, name))
+    assert patched.rated == fresh.rated
+    for name in ("category_positions", "location_positions"):
+        assert {key: positions.tolist() for key, positions in getattr(patched, name).items()} \
+            == {key: positions.tolist() for key, positions in getattr(fresh, name).items()
+                if len(positions)}
+
+    engine = ContentBasedRecommendationEngine(scoring="tfidf")
+    engine.build_index(columns)
+    patched = engine.patch_index(spliced, columns, splice)
+    fresh = ContentBasedRecommendationEngine(scoring="tfidf").build_index(spliced)
+    assert {key: positions.tolist() for key, positions in patched.positions.items()} == \
+        {key: positions.tolist() for key, positions in fresh.positions.items()}
+    # Term columns are numbered differently, so vectors are compared by term
+    patched_terms = patched.tfidf.matrix.toarray()[:, [patched.tfidf.vocabulary[term]
+                                                      for term in fresh.tfidf.terms]]
+    assert np.allclose(patched_terms, fresh.tfidf.matrix.toarray())
+    interests = ["music", "jazz", "technology"]
+    assert np.allclose(patched.tfidf.scores(patched.tfidf.profile(interests)),
+                       fresh.tfidf.scores(fresh.tfidf.profile(interests)))
+
+
+def make_catalog(tmp_path):
+    csv_file = str(tmp_path / "events.csv")
+    shutil.copy(EVENTS_FILE, csv_file)
+    log = DeltaLog(str(tmp_path / "events.delta.jsonl"))
+    return EventCatalog(csv_file, delta_log=log), log
+
+
+def test_catalog_batches_and_compaction(tmp_path, new_event_row, dumps):
+    catalog, log = make_catalog(tmp_path)
+    published = []
+    catalog.add_listener(published.append)
+    batcher = DeltaBatcher(log, catalog.apply_deltas, catalog.compact_deltas)
+    catalog.get_snapshot()
+
+    batcher.submit([upsert_record("event_9", new_event_row("event_9"))])
+    batcher.submit([delete_record("event_2")])
+    assert batcher.pending == 2
+    assert batcher.refresh()
+    # Both records were applied in a single new version
+    assert len(published) == 2
+    snapshot = catalog.get_snapshot()
+    assert snapshot.version == 2
+    ids = [event.event_id for event in snapshot.events]
+    assert ids[-1] == "event_9" and "event_2" not in ids
+
+    # A restarted catalog replays the log on top of the CSV
+    replayed = EventCatalog(catalog.csv_file, delta_log=log)
+    assert dumps(replayed.get_snapshot().events) == dumps(snapshot.events)
+
+    assert batcher.compact() == 2
+    assert log.read() == []
+    assert [row["event_id"] for row in csv.DictReader(open(catalog.csv_file))] == ids
+    # The rewritten CSV is adopted without reloading it
+    assert not catalog.refresh()
+    assert catalog.get_snapshot().version == 2
+    assert dumps(EventCatalog(catalog.csv_file, delta_log=log).get_snapshot().events) == \
+        dumps(snapshot.events)
+
+
+@pytest.mark.parametrize("mode", ["memory", "offset"])
+def test_user_overrides_and_compaction(tmp_path, mode):
+    csv_file = str(tmp_path / "users.csv")
+    shutil.copy(USERS_FILE, csv_file)
+    log = DeltaLog(str(tmp_path / "users.delta.jsonl"))
+    store = UserStore(csv_file, mode=mode, delta_log=log)
+    batcher = DeltaBatcher(log, store.apply_deltas, store.compact_deltas)
+    user_ids = store.user_ids()
+    version = store.version
+
+    row = {"user_id": "user_9", "name": "New User", "email": "new@example.com", "age": "",
+           "location": "Austin", "created_at": "2025-01-20T10:00:00", "categories": "Music"}
+    updated = dict(row, user_id="user_2", name="Bob Updated", categories="Food")
+    batcher.submit([upsert_record("user_9", row), upsert_record("user_2", updated),
+                    delete_record("user_3")])
+    batcher.refresh()
+
+    assert store.version > version
+    assert store.get("user_9")[1].categories == ["Music"]
+    assert store.get("user_2")[0].name == "Bob Updated"
+    assert store.get("user_3") == (None, None)
+    assert "user_3" not in store and "user_9" in store
+    expected_ids = [user_id for user_id in user_ids if user_id != "user_3"] + ["user_9"]
+    assert store.user_ids() == expected_ids
+    assert UserStore(csv_file, mode=mode, delta_log=log).user_ids() == expected_ids
+
+    assert batcher.compact() == 3
+    assert store.stats()["overridden_users"] == 0
+    assert store.user_ids() == expected_ids
+    assert store.get("user_2")[0].name == "Bob Updated"
+    assert UserStore(csv_file, mode=mode).get("user_9")[0].email == "new@example.com"
+
+
+def test_admin_endpoints(tmp_path, monkeypatch):
+    monkeypatch.setattr(main.event_delta_log, "path", str(tmp_path / "events.delta.jsonl"))
+    monkeypatch.setattr(main.user_delta_log, "path", str(tmp_path / "users.delta.jsonl"))
+    event = load_events_csv(EVENTS_FILE)[0].model_dump(mode="json")
+    event.update(event_id="event_100", category="Art", title="Delta Gallery")
+
+    with TestClient(main.app) as client:
+        # Closed until a token is configured, then the token is required
+        assert client.post("/admin/events", json={"upserts": [event]}).status_code == 403
+        assert client.post("/admin/compact").status_code == 403
+        monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+        assert client.delete("/admin/users/user_1",
+                             headers={"X-Admin-Token": "wrong"}).status_code == 403
+        assert main.event_delta_log.read() == [] and main.user_delta_log.read() == []
+        client.headers["X-Admin-Token"] = "secret"
+
+        accepted = client.post("/admin/events", json={"upserts": [event]})
+        assert accepted.status_code == 202
+        assert accepted.json()["accepted"] == 1
+        patched = client.patch("/admin/users/user_100",
+                               json={"name": "Delta User", "email": "delta@example.com",
+                                     "categories": ["Art"]})
+        assert patched.status_code == 202
+        assert client.patch("/admin/users/user_101", json={"name": "No Email"}).status_code == 422
+        for tags in (["live;jazz"], ["live", ""]):
+            bad_tags = dict(event, event_id="event_101", tags=tags)
+            assert client.post("/admin/events", json={"upserts": [bad_tags]}).status_code == 422
+        main.event_deltas.refresh()
+        main.user_deltas.refresh()
+
+        listed = client.get("/events/").json()
+        assert listed[-1]["event_id"] == "event_100"
+        recommendations = client.get("/users/user_100/recommendations/").json()
+        assert "event_100" in [rec["event"]["event_id"] for rec in recommendations]
+
+        # Restore the shared application state
+        client.post("/admin/events", json={"deletes": ["event_100"]})
+        assert client.delete("/admin/users/user_100").status_code == 202
+        main.event_deltas.refresh()
+        main.user_deltas.refresh()
+        assert client.delete("/admin/users/user_100").status_code == 404
+        assert [item["event_id"] for item in client.get("/events/").json()] == \
+            [f"event_{i}" for i in range(1, 9)]
+        assert client.get("/users/user_100/recommendations/").status_code == 404
@@ -0,0 +1,218 @@
+"""
+Tests for the indexed event filters and the endpoints that apply them
+"""
+
+import csv
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.catalog import EventCatalog
+from app.columnar import datetime_to_micros
+from app.filters import EventFilters, FilterIndex, location_keys, naive_utc
+from app.main import app
+from app.models import UserPreferences
+from app.recommendation_engine import ContentBasedRecommendationEngine
+
+CATEGORIES = ["Technology", "Music", "Business", "art"]
+LOCATIONS = ["New York, NY", "San Francisco, CA", "new york", "Austin, TX"]
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+EVENTS_FILE = os.path.join(PROJECT_ROOT, "data", "events.csv")
+
+
+def matches(filters, event):
+    """Reference check of one event against filters"""
+    date = naive_utc(event.date)
+    if filters.category is not None and event.category.lower() != filters.category:
+        return False
+    if filters.location is not None and filters.location not in location_keys(event.location):
+        return False
+    if filters.date_from is not None and date < filters.date_from:
+        return False
+    if filters.date_to is not None and date > filters.date_to:
+        return False
+    if filters.max_price is not None and event.price > filters.max_price:
+        return False
+    if filters.min_rating is not None and (event.rating is None or
+                                           event.rating < filters.min_rating):
+        return False
+    return True
+
+
+def full_scan_mask(filters, columns):
+    """Reference boolean mask of the matching rows of a columnar catalog"""
+    mask = np.ones(len(columns), dtype=bool)
+    if filters.category is not None:
+        codes = [code for code, category in enumerate(columns.categories)
+                 if category.lower() == filters.category]
+        mask &= np.isin(columns.category_codes, codes)
+    if filters.location is not None:
+        codes = [code for code, location in enumerate(columns.locations)
+                 if filters.location in location_keys(location)]
+        mask &= np.isin(columns.location_codes, codes)
+    if filters.date_from is not None:
+        mask &= columns.dates >= datetime_to_micros(filters.date_from)
+    if filters.date_to is not None:
+        mask &= columns.dates <= datetime_to_micros(filters.date_to)
+    if filters.max_price is not None:
+        mask &= columns.prices <= filters.max_price
+    if filters.min_rating is not None:
+        # NaN (no rating) compares False
+        mask &= columns.ratings >= filters.min_rating
+    return mask
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_index_matches_full_scan(seed, make_columns):
+    columns = make_columns(categories=CATEGORIES, locations=LOCATIONS)
+    index = FilterIndex(columns)
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1) + timedelta(days=rng.randint(0, 60))
+    filters = EventFilters(
+        category=rng.choice([None, "technology", "ART", "unknown"]),
+        location=rng.choice([None, "new york", "San Francisco, CA", "nowhere"]),
+        date_from=rng.choice([None, start]),
+        date_to=rng.choice([None, start + timedelta(days=rng.randint(0, 30))]),
+        max_price=rng.choice([None, 0.0, 25.5, 100.0]),
+        free_only=rng.random() < 0.2,
+        min_rating=rng.choice([None, 4.2, 4.6]),
+    )
+
+    expected = np.flatnonzero(full_scan_mask(filters, columns))
+    assert index.select(filters).tolist() == expected.tolist()
+    assert [position for position in range(len(columns))
+            if matches(filters, columns[position])] == expected.tolist()
+
+
+def test_no_filters_select_everything(make_columns):
+    columns = make_columns(50, categories=CATEGORIES, locations=LOCATIONS)
+    filters = EventFilters()
+    assert not filters.active
+    assert FilterIndex(columns).select(filters).tolist() == list(range(50))
+
+
+@pytest.mark.parametrize("scoring", ["category", "tfidf"])
+def test_recommendations_only_rank_candidates(scoring, make_columns):
+    columns = make_columns(categories=CATEGORIES, locations=LOCATIONS)
+    engine = ContentBasedRecommendationEngine(scoring=scoring)
+    candidates = FilterIndex(columns).select(EventFilters(max_price=25.5, min_rating=4.2))
+    preferences = UserPreferences(categories=["Music"])
+
+    result = engine.get_recommendations(preferences, columns, 20, candidates)
+    allowed = {columns.event_ids[position] for position in candidates.tolist()}
+
+    assert len(result) == min(20, len(candidates))
+    assert all(rec.event.event_id in allowed for rec in result)
+    assert [rec.score for rec in result] == sorted((rec.score for rec in result), reverse=True)
+    assert engine.get_recommendations(preferences, columns, 20, candidates[:0]) == []
+
+
+def test_category_ranking_with_candidates_matches_filtered_list(make_columns):
+    columns = make_columns(categories=CATEGORIES, locations=LOCATIONS)
+    engine = ContentBasedRecommendationEngine()
+    candidates = FilterIndex(columns).select(EventFilters(location="austin"))
+    filtered = [columns[position] for position in candidates.tolist()]
+    preferences = UserPreferences(categories=["Business", "Art"])
+
+    restricted = engine.get_recommendations(preferences, columns, 15, candidates)
+    on_subset = engine.get_recommendations(preferences, filtered, 15)
+
+    assert [rec.model_dump() for rec in restricted] == [rec.model_dump() for rec in on_subset]
+
+
+@pytest.mark.parametrize("scoring", ["category", "tfidf"])
+def test_batch_ranking_with_candidates_matches_single_user_path(scoring, make_columns):
+    columns = make_columns(categories=CATEGORIES, locations=LOCATIONS)
+    engine = ContentBasedRecommendationEngine(scoring=scoring)
+    engine.BATCH_CHUNK_CELLS = 1000
+    candidates = FilterIndex(columns).select(EventFilters(location="new york", max_price=80.0))
+    rng = random.Random(2)
+    preferences_list = [UserPreferences(categories=rng.sample(CATEGORIES, rng.randint(0, 2)))
+                        for _ in range(12)]
+
+    for limit in (1, 10, len(columns)):
+        batch = engine.rank_explained_batch(preferences_list, columns, limit, candidates)
+        for preferences, ranked in zip(preferences_list, batch):
+            assert ranked == engine.rank(preferences, columns, limit, candidates)
+    assert engine.rank_explained_batch(preferences_list[:2], columns, 10, candidates[:0]) == \
+        [engine.rank(preferences, columns, 10, candidates[:0])
+         for preferences in preferences_list[:2]]
+
+
+def test_batch_endpoint_excludes_past_events_like_single_endpoint(tmp_path, monkeypatch):
+    # Half of the sample events moved to the future
+    events_file = str(tmp_path / "events.csv")
+    with open(EVENTS_FILE, newline="") as source, open(events_file, "w", newline="") as target:
+        reader = csv.DictReader(source)
+        writer = csv.DictWriter(target, fieldnames=reader.fieldnames)
+        writer.writeheader()
+        for i, row in enumerate(reader):
+            if i % 2:
+                row["date"] = row["date"].replace("2025", "2099", 1)
+            writer.writerow(row)
+    user_ids = ["user_1", "user_2", "user_3"]
+
+    with TestClient(app) as client:
+        monkeypatch.setattr(main, "event_catalog", EventCatalog(events_file))
+        monkeypatch.setattr(main, "EXCLUDE_PAST_EVENTS", True)
+        main.recommendation_cache.clear()
+        try:
+            for _ in range(2):
+                # Scored, then served from the cache
+                batch = client.post("/recommendations/batch",
+                                    json={"user_ids": user_ids, "limit": 10}).json()
+                for user_id, result in zip(user_ids, batch["results"]):
+                    single = client.get(f"/users/{user_id}/recommendations/",
+                                        params={"limit": 10}).json()
+                    assert result["recommendations"] == single
+                    assert single and all(rec["event"]["date"].startswith("2099")
+                                          for rec in single)
+        finally:
+            main.recommendation_cache.clear()
+
+
+def test_upcoming_view_starts_at_the_current_utc_minute(monkeypatch):
+    # A zone far from UTC, so a local clock would be hours off
+    monkeypatch.setenv("TZ", "Pacific/Kiritimati")
+    time.tzset()
+    try:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        date_from = main.upcoming_date_from()
+        assert date_from.tzinfo is None
+        assert timedelta(0) <= now - date_from < timedelta(minutes=2)
+        aware = datetime(2099, 1, 1, 12, tzinfo=timezone(timedelta(hours=2)))
+        assert main.upcoming_date_from(aware) == datetime(2099, 1, 1, 10)
+    finally:
+        monkeypatch.delenv("TZ")
+        time.tzset()
+
+
+def test_endpoints_apply_filters():
+    with TestClient(app) as client:
+        events = client.get("/events/", params={"location": "New York", "max_price": 50})
+        assert [event["event_id"] for event in events.json()] == ["event_2", "event_4"]
+        assert events.headers["x-total-count"] == "2"
+        not_modified = client.get("/events/", params={"location": "New York", "max_price": 50},
+                                  headers={"If-None-Match": events.headers["etag"]})
+        assert not_modified.status_code == 304
+        assert events.headers["etag"] != client.get("/events/").headers["etag"]
+
+        page = client.get("/events/", params={"free_only": True, "offset": 1, "limit": 5})
+        assert [event["event_id"] for event in page.json()] == ["event_5"]
+
+        recommendations = client.get("/users/user_2/recommendations/",
+                                     params={"min_rating": 4.4, "limit": 10})
+        assert [rec["event"]["event_id"] for rec in recommendations.json()] == \
+            ["event_2", "event_7", "event_1", "event_5", "event_6"]
+
+        # The sample events all took place in January 2025
+        assert client.get("/events/", params={"upcoming_only": True}).json() == []
+        assert client.get("/users/user_1/recommendations/",
+                          params={"upcoming_only": True}).json() == []
@@ -0,0 +1,178 @@
+"""
+Tests for the materialized recommendations store and its fallback to live scoring
+"""
+
+import csv
+import os
+import random
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.cache import preferences_fingerprint
+from app.catalog import EventCatalog
+from app.materialized import (
+    MaterializeJob, MaterializeSources, MaterializedRecommendations, materialize_recommendations
+)
+from app.models import EventRating, UserPreferences
+from app.ratings import RatingAggregates, RatingIngestor, RatingLog
+from app.recommendation_engine import ContentBasedRecommendationEngine
+from app.serialization import EncodedEvents
+from app.snapshot import SnapshotFile
+from app.user_store import UserStore
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+EVENTS_FILE = os.path.join(PROJECT_ROOT, "data", "events.csv")
+USERS_FILE = os.path.join(PROJECT_ROOT, "data", "users.csv")
+
+CATEGORIES = ["Technology", "Business", "Music", "Art", "Sports", "Food", "Unknown"]
+
+
+def write_users(path, count, seed=3):
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(["user_id", "name", "email", "age", "location", "created_at", "categories"])
+        for i in range(count):
+            categories = ";".join(rng.sample(CATEGORIES, rng.randint(1, 3)))
+            writer.writerow([f"user_{i}", f"User {i}", f"user{i}@example.com", 30, "Austin",
+                             "2025-01-17T10:00:00", categories])
+
+
+@pytest.fixture
+def users_file(tmp_path):
+    path = str(tmp_path / "users.csv")
+    write_users(path, 60)
+    return path
+
+
+@pytest.mark.parametrize("scoring", ["category", "tfidf"])
+def test_store_matches_live_scoring(tmp_path, users_file, scoring, dumps):
+    path = str(tmp_path / "recommendations.snapshot")
+    assert materialize_recommendations(MaterializeSources(EVENTS_FILE, users_file), path,
+                                       limit=5, scoring=scoring) == 60
+
+    events = EventCatalog(EVENTS_FILE).get_snapshot().events
+    digest = EncodedEvents(events).digest
+    engine = ContentBasedRecommendationEngine(scoring=scoring)
+    store = MaterializedRecommendations(path)
+    assert store.refresh()
+    users = UserStore(users_file)
+    for user_id in users.user_ids():
+        preferences = users.get(user_id)[1]
+        for limit in (1, 5):
+            ranking = store.lookup(user_id, preferences, limit, digest, scoring)
+            assert dumps(engine.recommendations_from_ranking(preferences, events, *ranking)) == \
+                dumps(engine.get_recommendations(preferences, events, limit))
+    assert store.stats(digest)["hit_rate"] == 1.0
+    # Users with the same categories share one stored ranking
+    assert store.stats()["rankings"] == \
+        len({preferences_fingerprint(users.get(user_id)[1]) for user_id in users.user_ids()})
+    assert store.stats(digest)["matches_catalog"]
+
+
+def test_process_pool_matches_inline(tmp_path, users_file):
+    sources = MaterializeSources(EVENTS_FILE, users_file)
+    inline, pooled = str(tmp_path / "inline.snapshot"), str(tmp_path / "pooled.snapshot")
+    materialize_recommendations(sources, inline, limit=4)
+    materialize_recommendations(sources, pooled, limit=4, workers=2, chunk_size=7)
+    for name in ("user_table", "user_rankings", "preferences", "offsets", "positions", "scores"):
+        assert np.array_equal(SnapshotFile(inline).array(name), SnapshotFile(pooled).array(name))
+
+
+def test_stale_entries_fall_back(tmp_path, users_file):
+    path = str(tmp_path / "recommendations.snapshot")
+    materialize_recommendations(MaterializeSources(EVENTS_FILE, users_file), path, limit=3)
+    store = MaterializedRecommendations(path)
+    store.refresh()
+    digest = store.meta["catalog_digest"]
+    preferences = UserStore(users_file).get("user_1")[1]
+
+    assert store.lookup("user_1", preferences, 3, digest, "category") is not None
+    assert store.lookup("user_1", preferences, 3, "other", "category") is None
+    assert store.lookup("user_1", preferences, 3, digest, "tfidf") is None
+    assert store.lookup("user_1", preferences, 4, digest, "category") is None
+    assert store.lookup("user_1", UserPreferences(categories=["Nothing"]), 3, digest,
+                        "category") is None
+    assert store.lookup("user_999", preferences, 3, digest, "category") is None
+    # Categories are compared as a case-insensitive set
+    reordered = UserPreferences(categories=[c.upper() for c in reversed(preferences.categories)])
+    assert store.lookup("user_1", reordered, 3, digest, "category") is not None
+
+    stats = store.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == {"no_store": 0, "unknown_user": 1, "stale_catalog": 2,
+                               "stale_ratings": 0, "stale_preferences": 1, "limit": 1}
+    assert stats["staleness_seconds"] >= 0
+
+
+def test_job_only_reruns_when_inputs_change(tmp_path, users_file):
+    path = str(tmp_path / "recommendations.snapshot")
+    job = MaterializeJob(MaterializeSources(EVENTS_FILE, users_file), path, limit=3)
+    assert job.refresh()
+    assert not job.refresh()
+    with open(users_file, "a") as file:
+        file.write('user_60,New,new@example.com,40,Austin,2025-01-17T10:00:00,Music\n')
+    assert job.refresh()
+    assert job.runs == 2
+    store = MaterializedRecommendations(path)
+    store.refresh()
+    assert store.stats()["users"] == 61
+
+
+def test_store_built_with_ratings_serves_until_the_log_changes(tmp_path, users_file):
+    path = str(tmp_path / "recommendations.snapshot")
+    ratings_log = RatingLog(str(tmp_path / "ratings.jsonl"))
+    ratings_log.append([EventRating(user_id="user_1", event_id="event_5", rating=5.0)])
+    sources = MaterializeSources(EVENTS_FILE, users_file, ratings_log=ratings_log.path)
+    job = MaterializeJob(sources, path, limit=3)
+    assert job.refresh()
+    assert not job.refresh()
+
+    aggregates = RatingAggregates()
+    ingestor = RatingIngestor(RatingLog(ratings_log.path), aggregates, 10)
+    ingestor.refresh()
+    store = MaterializedRecommendations(path, ratings_log.path, aggregates)
+    store.refresh()
+    digest = store.meta["catalog_digest"]
+    preferences = UserStore(users_file).get("user_1")[1]
+    assert store.lookup("user_1", preferences, 3, digest, "category") is not None
+    assert store.misses["stale_ratings"] == 0
+
+    # A new rating makes the store stale until the job catches up
+    ingestor.offer([EventRating(user_id="user_2", event_id="event_2", rating=1.0)])
+    ingestor.refresh()
+    assert store.lookup("user_1", preferences, 3, digest, "category") is None
+    assert store.misses["stale_ratings"] == 1
+    assert job.refresh()
+    store.refresh()
+    assert store.lookup("user_1", preferences, 3, digest, "category") is not None
+    assert store.hits == 2
+
+
+def test_endpoint_serves_from_store(tmp_path, monkeypatch):
+    path = str(tmp_path / "recommendations.snapshot")
+    materialize_recommendations(MaterializeSources(EVENTS_FILE, USERS_FILE), path, limit=5,
+                                scoring=main.recommendation_engine.scoring)
+    monkeypatch.setattr(main.materialized_recommendations, "path", path)
+    try:
+        with TestClient(main.app) as client:
+            main.recommendation_cache.clear()
+            hits = main.materialized_recommendations.hits
+            # Larger than the stored lists: scored live
+            live = client.get("/users/user_1/recommendations/?limit=8").json()
+            assert main.materialized_recommendations.hits == hits
+
+            main.recommendation_cache.clear()
+            assert client.get("/users/user_1/recommendations/?limit=3").json() == live[:3]
+            assert main.materialized_recommendations.hits == hits + 1
+
+            stats = client.get("/stats/").json()["materialized"]
+            assert stats["loaded"] and stats["matches_catalog"]
+            assert "recsys_materialized_hits_total" in client.get("/metrics").text
+    finally:
+        main.recommendation_cache.clear()
+        main.materialized_recommendations._store = None
+        main.materialized_recommendations._signature = None
@@ -0,0 +1,61 @@
+"""
+Tests for the stage histograms, Prometheus rendering and Server-Timing headers
+"""
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.metrics import Histogram, StageMetrics, render_histograms, server_timing_header
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+    for value in (0.005, 0.01, 0.05, 0.5, 3.0):
+        histogram.observe(value)
+
+    cumulative, total, count = histogram.snapshot()
+    assert cumulative == [2, 3, 4, 5]
+    assert count == 5
+    assert abs(total - 3.565) < 1e-9
+
+
+def test_render_histograms_prometheus_format():
+    metrics = StageMetrics(buckets=(0.1, 1.0))
+    metrics.observe("score", 0.05)
+    metrics.observe("score", 2.0)
+
+    lines = render_histograms("stage_seconds", "Stage latency", "stage", metrics.histograms())
+    assert lines[:2] == ["# HELP stage_seconds Stage latency", "# TYPE stage_seconds histogram"]
+    assert 'stage_seconds_bucket{stage="score",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="score",le="+Inf"} 2' in lines
+    assert 'stage_seconds_count{stage="score"} 2' in lines
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = StageMetrics(enabled=False)
+    with metrics.time("score"):
+        pass
+    assert metrics.histograms() == {}
+
+
+def test_server_timing_header_format():
+    assert server_timing_header([("read_user", 0.0012), ("total", 0.0105)]) == \
+        "read_user;dur=1.200, total;dur=10.500"
+
+
+def test_recommendations_carry_server_timing_and_metrics_endpoint():
+    with TestClient(app) as client:
+        response = client.get("/users/user_1/recommendations/", params={"limit": 3})
+        assert response.status_code == 200
+        stages = [part.split(";")[0] for part in response.headers["server-timing"].split(", ")]
+        assert {"read_user", "read_events", "serialize", "total"} <= set(stages)
+        assert stages[-1] == "total"
+
+        metrics = client.get("/metrics")
+
+    assert metrics.status_code == 200
+    assert metrics.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = metrics.text
+    assert 'recsys_stage_duration_seconds_count{stage="read_user"}' in text
+    assert "recsys_catalog_events 8" in text
+    assert "# TYPE recsys_recommendation_cache_hits_total counter" in text
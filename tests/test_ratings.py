@@ -0,0 +1,204 @@
+"""
+Tests for rating ingestion, rolling aggregates and rating tie-breaks
+"""
+
+import os
+import random
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.materialized import MaterializeSources, materialize_recommendations
+from app.models import EventRating, UserPreferences
+from app.ratings import RatingAggregates, RatingIngestor, RatingLog
+from app.recommendation_engine import ContentBasedRecommendationEngine
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+EVENTS_FILE = os.path.join(PROJECT_ROOT, "data", "events.csv")
+USERS_FILE = os.path.join(PROJECT_ROOT, "data", "users.csv")
+
+
+def rating(event_id, value, user_id="user_1"):
+    return EventRating(user_id=user_id, event_id=event_id, rating=value)
+
+
+def test_aggregates_are_updated_incrementally():
+    aggregates = RatingAggregates()
+    assert aggregates.get("event_1") == (0, None)
+    aggregates.add_many([("event_1", 5.0), ("event_2", 2.0), ("event_1", 4.0)])
+    aggregates.add("event_1", 3.0)
+    assert aggregates.get("event_1") == (3, 4.0)
+    assert aggregates.get("event_2") == (1, 2.0)
+    assert len(aggregates) == 2
+
+
+def test_queue_is_bounded_and_all_or_nothing(tmp_path):
+    ingestor = RatingIngestor(RatingLog(str(tmp_path / "ratings.jsonl")), RatingAggregates(), 3)
+    assert ingestor.offer([rating("event_1", 5), rating("event_2", 4)])
+    assert not ingestor.offer([rating("event_3", 3), rating("event_4", 2)])
+    assert ingestor.queued == 2
+    assert ingestor.stats()["rejected"] == 2
+
+    assert ingestor.refresh()
+    assert ingestor.queued == 0
+    assert ingestor.aggregates.get("event_2") == (1, 4.0)
+    assert not ingestor.refresh()
+
+
+def test_workers_sharing_a_log_agree(tmp_path):
+    path = str(tmp_path / "ratings.jsonl")
+    first = RatingIngestor(RatingLog(path), RatingAggregates(), 100)
+    second = RatingIngestor(RatingLog(path), RatingAggregates(), 100)
+    first.offer([rating("event_1", 5), rating("event_1", 3)])
+    second.offer([rating("event_1", 1)])
+    first.refresh()
+    second.refresh()
+    first.refresh()
+    assert first.aggregates.get("event_1") == second.aggregates.get("event_1") == (3, 3.0)
+
+    # A restarted process rebuilds the aggregates from the log
+    restarted = RatingIngestor(RatingLog(path), RatingAggregates(), 100)
+    restarted.refresh()
+    assert restarted.aggregates.get("event_1") == (3, 3.0)
+
+
+@pytest.mark.parametrize("scoring", ["category", "tfidf"])
+def test_ratings_break_ties(scoring, make_columns):
+    columns = make_columns(200)
+    aggregates = RatingAggregates()
+    engine = ContentBasedRecommendationEngine(scoring=scoring, ratings=aggregates)
+    preferences = UserPreferences(categories=["Music"])
+    unrated = engine.get_recommendations(preferences, columns, 10)
+
+    # Rate events that tied with the first one; higher means move ahead of it
+    tied = [rec.event.event_id for rec in unrated if rec.score == unrated[0].score]
+    aggregates.add_many([(tied[-1], 5.0), (tied[-2], 4.0), (tied[0], 1.0)])
+    ranked = engine.get_recommendations(preferences, columns, 10)
+
+    assert [rec.event.event_id for rec in ranked[:3]] == [tied[-1], tied[-2], tied[0]]
+    assert [rec.score for rec in ranked] == [rec.score for rec in unrated]
+    batch = engine.get_recommendations_batch([preferences, UserPreferences(categories=["Art"])],
+                                             columns, 10)
+    assert [rec.model_dump() for rec in batch[0]] == [rec.model_dump() for rec in ranked]
+    assert [rec.model_dump() for rec in batch[1]] == \
+        [rec.model_dump() for rec in engine.get_recommendations(
+            UserPreferences(categories=["Art"]), columns, 10)]
+
+
+@pytest.mark.parametrize("filtered", [False, True])
+def test_tie_rank_ordering_matches_full_sort(filtered, make_columns):
+    columns = make_columns(300)
+    aggregates = RatingAggregates()
+    engine = ContentBasedRecommendationEngine(ratings=aggregates)
+    rng = random.Random(3)
+    aggregates.add_many([(f"event_{rng.randrange(300)}", float(rng.randint(1, 5)))
+                         for _ in range(120)])
+    candidates = np.arange(0, 300, 3) if filtered else None
+    preferences = UserPreferences(categories=["music", "Art"])
+
+    ranked = engine.rank(preferences, columns, 300, candidates)
+
+    positions = np.arange(300) if candidates is None else candidates
+    tie_rank = aggregates.tie_rank(columns)
+    matches = [columns.categories[code] in ("Music", "Art")
+               for code in columns.category_codes[positions].tolist()]
+    expected = sorted(zip(positions.tolist(), matches),
+                      key=lambda entry: (not entry[1], tie_rank[entry[0]]))
+    assert ranked.positions == [position for position, _ in expected]
+    assert ranked.scores == [1.0 if match else 0.0 for _, match in expected]
+
+
+def test_tie_rank_updates_match_full_sort(make_columns):
+    columns = make_columns(300)
+    aggregates = RatingAggregates()
+    assert aggregates.tie_rank(columns) is None
+    rng = random.Random(4)
+    seen = []
+    for round_number in range(6):
+        batch = [(f"event_{rng.randrange(300)}", float(rng.randint(1, 5)))
+                 for _ in range(rng.randint(1, 40))]
+        seen.extend(batch)
+        aggregates.add_many(batch)
+        if round_number == 3:
+            # Rebuilt from scratch after a reset, as when the log is truncated
+            aggregates.reset()
+            aggregates.add_many(seen)
+        # What the flusher does after every batch
+        aggregates.refresh_rank()
+
+        rebuilt = RatingAggregates()
+        rebuilt.add_many(seen)
+        assert aggregates.tie_rank(columns).tolist() == rebuilt.tie_rank(columns).tolist()
+
+
+def test_rating_endpoints(tmp_path, monkeypatch):
+    monkeypatch.setattr(main.rating_ingestor.log, "path", str(tmp_path / "ratings.jsonl"))
+    monkeypatch.setattr(main.rating_ingestor.log, "offset", 0)
+    try:
+        with TestClient(main.app) as client:
+            response = client.post("/ratings", json={"user_id": "user_1", "event_id": "event_3",
+                                                     "rating": 4})
+            assert response.status_code == 202
+            bulk = client.post("/ratings/bulk", json=[
+                {"user_id": "user_2", "event_id": "event_3", "rating": 5},
+                {"user_id": "user_3", "event_id": "event_8", "rating": 2},
+            ])
+            assert bulk.json()["accepted"] == 2
+            assert client.post("/ratings", json={"user_id": "user_1", "event_id": "event_3",
+                                                 "rating": 9}).status_code == 422
+
+            monkeypatch.setattr(main.rating_ingestor, "capacity", 0)
+            full = client.post("/ratings", json={"user_id": "user_1", "event_id": "event_1",
+                                                 "rating": 3})
+            assert full.status_code == 503
+            assert full.headers["retry-after"] == "1"
+
+            main.rating_ingestor.refresh()
+            assert client.get("/events/event_3/ratings").json() == \
+                {"event_id": "event_3", "count": 2, "mean": 4.5}
+            assert client.get("/events/unknown/ratings").json()["count"] == 0
+    finally:
+        main.rating_aggregates.reset()
+
+
+def test_new_ratings_reach_cached_and_materialized_recommendations(tmp_path, monkeypatch):
+    log_path = str(tmp_path / "ratings.jsonl")
+    store_path = str(tmp_path / "recommendations.snapshot")
+    materialize_recommendations(MaterializeSources(EVENTS_FILE, USERS_FILE, ratings_log=log_path),
+                                store_path, limit=5, scoring=main.recommendation_engine.scoring)
+    monkeypatch.setattr(main.rating_ingestor.log, "path", log_path)
+    monkeypatch.setattr(main.rating_ingestor.log, "offset", 0)
+    monkeypatch.setattr(main.materialized_recommendations, "path", store_path)
+    monkeypatch.setattr(main.materialized_recommendations, "ratings_log", log_path)
+
+    def top_ids():
+        response = client.get("/users/user_1/recommendations/", params={"limit": 3})
+        return [rec["event"]["event_id"] for rec in response.json()]
+
+    try:
+        with TestClient(main.app) as client:
+            main.recommendation_cache.clear()
+            hits = main.materialized_recommendations.hits
+            assert top_ids() == ["event_1", "event_3", "event_5"]
+            assert main.materialized_recommendations.hits == hits + 1
+            # Served from the cache
+            assert top_ids() == ["event_1", "event_3", "event_5"]
+
+            stale = main.materialized_recommendations.misses["stale_ratings"]
+            client.post("/ratings/bulk", json=[rating("event_3", 5, f"user_{i}").model_dump(mode="json")
+                                               for i in range(3)])
+            main.rating_ingestor.refresh()
+            # The cached list keeps its order until it expires
+            assert top_ids() == ["event_1", "event_3", "event_5"]
+            main.recommendation_cache.clear()
+            # The store does not serve the old tie-breaks
+            assert top_ids() == ["event_3", "event_1", "event_5"]
+            assert main.materialized_recommendations.misses["stale_ratings"] == stale + 1
+            assert main.materialized_recommendations.hits == hits + 1
+    finally:
+        main.rating_aggregates.reset()
+        main.recommendation_cache.clear()
+        main.materialized_recommendations._store = None
+        main.materialized_recommendations._signature = None
@@ -0,0 +1,160 @@
+"""
+Tests for the content-based recommendation engine
+"""
+
+import os
+import random
+from datetime import datetime
+
+import pytest
+
+from app.catalog import load_events_csv
+from app.models import Event, UserPreferences
+from app.recommendation_engine import ContentBasedRecommendationEngine
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+EVENTS_FILE = os.path.join(PROJECT_ROOT, "data", "events.csv")
+
+CATEGORIES = ["Technology", "Music", "Business", "Art", "Food", "Sports"]
+
+
+def reference_recommendations(preferences, events, limit):
+    """The original score-everything-then-sort algorithm"""
+    user_categories = [category.lower() for category in preferences.categories]
+    scored = [(1.0 if event.category.lower() in user_categories else 0.0, event)
+              for event in events]
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [(event.event_id, score) for score, event in scored[:limit]]
+
+
+def make_events(count, seed=7):
+    rng = random.Random(seed)
+    return [
+        Event(
+            event_id=f"event_{i}",
+            title=f"Event {i}",
+            description="Synthetic event",
+            category=rng.choice(CATEGORIES + [c.lower() for c in CATEGORIES]),
+            tags=[],
+            location="Somewhere",
+            date=datetime(2025, 1, 1),
+            organizer="Someone",
+        )
+        for i in range(count)
+    ]
+
+
+@pytest.mark.parametrize("categories", [
+    ["Technology", "Business"],
+    ["music", "ART", "Art"],
+    ["Unknown"],
+    [],
+])
+@pytest.mark.parametrize("limit", [1, 5, 50, 500])
+def test_matches_reference_ranking(categories, limit):
+    events = make_events(200)
+    engine = ContentBasedRecommendationEngine()
+    preferences = UserPreferences(user_id="u", categories=categories)
+
+    result = engine.get_recommendations(preferences, events, limit)
+
+    assert [(rec.event.event_id, rec.score) for rec in result] == \
+        reference_recommendations(preferences, events, limit)
+
+
+def test_explanations_on_sample_data():
+    events = load_events_csv(EVENTS_FILE)
+    engine = ContentBasedRecommendationEngine()
+    preferences = UserPreferences(user_id="user_2", categories=["Music", "Art"])
+
+    result = engine.get_recommendations(preferences, events, limit=4)
+
+    assert [rec.event.event_id for rec in result] == ["event_2", "event_4", "event_7", "event_1"]
+    assert result[0].reason == "This event matches your interest in Music."
+    assert result[3].reason == "This event is in a different category from your preferences."
+
+
+def test_index_is_rebuilt_for_a_new_events_list():
+    engine = ContentBasedRecommendationEngine()
+    preferences = UserPreferences(categories=["Music"])
+    first = make_events(20, seed=1)
+    second = make_events(20, seed=2)
+
+    engine.get_recommendations(preferences, first, 5)
+    result = engine.get_recommendations(preferences, second, 5)
+
+    assert [(rec.event.event_id, rec.score) for rec in result] == \
+        reference_recommendations(preferences, second, 5)
+
+
+@pytest.mark.parametrize("limit", [1, 7, 200, 1000])
+def test_batch_matches_single_user_path(limit):
+    events = make_events(200)
+    engine = ContentBasedRecommendationEngine()
+    rng = random.Random(3)
+    preferences_list = [
+        UserPreferences(user_id=f"user_{i}",
+                        categories=rng.sample(CATEGORIES + ["Unknown"], rng.randint(0, 3)))
+        for i in range(40)
+    ]
+    # Force several chunks to exercise the chunked scoring loop
+    engine.BATCH_CHUNK_CELLS = 1000
+
+    batch = engine.get_recommendations_batch(preferences_list, events, limit)
+
+    assert len(batch) == len(preferences_list)
+    for preferences, recommendations in zip(preferences_list, batch):
+        single = engine.get_recommendations(preferences, events, limit)
+        assert [rec.model_dump() for rec in recommendations] == \
+            [rec.model_dump() for rec in single]
+
+
+def test_similarity_scoring_ranks_by_tags_and_description():
+    events = load_events_csv(EVENTS_FILE)
+    engine = ContentBasedRecommendationEngine(scoring="tfidf")
+    preferences = UserPreferences(user_id="user_2", categories=["Music", "Art"])
+
+    result = engine.get_recommendations(preferences, events, limit=len(events))
+
+    scores = [rec.score for rec in result]
+    assert scores == sorted(scores, reverse=True)
+    assert {rec.event.category for rec in result[:2]} == {"Music", "Art"}
+    assert result[0].score > 0
+    assert "match your interests" in result[0].reason
+    assert result[-1].score == 0
+    assert result[-1].reason == "This event is not related to your interests."
+
+
+def test_similarity_scoring_with_unknown_interests_keeps_catalog_order():
+    events = make_events(30)
+    engine = ContentBasedRecommendationEngine(scoring="tfidf")
+    preferences = UserPreferences(categories=["Underwater basket weaving"])
+
+    result = engine.get_recommendations(preferences, events, limit=5)
+
+    assert [(rec.event.event_id, rec.score) for rec in result] == \
+        [(f"event_{i}", 0.0) for i in range(5)]
+
+
+@pytest.mark.parametrize("limit", [1, 10, 500])
+def test_similarity_batch_matches_single_user_path(limit):
+    events = make_events(200)
+    engine = ContentBasedRecommendationEngine(scoring="tfidf")
+    rng = random.Random(5)
+    preferences_list = [
+        UserPreferences(categories=rng.sample(CATEGORIES + ["Unknown"], rng.randint(0, 3)))
+        for _ in range(25)
+    ]
+    engine.BATCH_CHUNK_CELLS = 1000
+
+    batch = engine.get_recommendations_batch(preferences_list, events, limit)
+
+    for preferences, recommendations in zip(preferences_list, batch):
+        single = engine.get_recommendations(preferences, events, limit)
+        assert [rec.model_dump() for rec in recommendations] == \
+            [rec.model_dump() for rec in single]
+
+
+def test_unknown_scoring_mode_is_rejected():
+    with pytest.raises(ValueError):
+        ContentBasedRecommendationEngine(scoring="neural")
@@ -0,0 +1,178 @@
+"""
+Tests for the pre-encoded JSON payloads and the endpoints that serve them
+"""
+
+import csv
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from app import main, serialization
+from app.catalog import EventCatalog, load_events_csv
+from app.columnar import EventColumns
+from app.main import app
+from app.models import BatchRecommendationResponse, UserPreferences, UserRecommendations
+from app.recommendation_engine import ContentBasedRecommendationEngine
+from app.serialization import (
+    EncodedEvents, encode_batch_recommendations, encode_recommendations, encode_score,
+    encode_string, etag_matches
+)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+EVENTS_FILE = os.path.join(PROJECT_ROOT, "data", "events.csv")
+
+
+def test_encoded_events_match_fastapi_encoding():
+    events = load_events_csv(EVENTS_FILE)
+    encoded = EncodedEvents(events)
+
+    assert encoded.body == JSONResponse(jsonable_encoder(events)).body
+    body, _ = encoded.page(2, 3)
+    assert body == JSONResponse(jsonable_encoder(events[2:5])).body
+    assert encoded.fragment(7) == JSONResponse(jsonable_encoder(events[7])).body
+
+
+def awkward_events():
+    """The sample events with text that needs escaping, aware dates and optional fields unset"""
+    events = load_events_csv(EVENTS_FILE)
+    events[0] = events[0].model_copy(update={
+        "date": datetime(2025, 1, 24, 9, tzinfo=timezone(timedelta(hours=2)))})
+    events[2] = events[2].model_copy(update={
+        "date": datetime(2025, 1, 24, 9, tzinfo=timezone(timedelta(hours=-5, minutes=-30)))})
+    events[1] = events[1].model_copy(update={"title": 'Say "hi"\n\tto \\ café ☃ \u2028 😀',
+                                             "capacity": None})
+    events[4] = events[4].model_copy(update={"description": "\x00\x1f\x7f </script>",
+                                             "tags": []})
+    return events
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_scalar_encoding_matches_json(fast, monkeypatch):
+    if not fast:
+        # The json fallback used when orjson is not installed
+        monkeypatch.setattr(serialization, "orjson", None)
+    for value in ["", "plain", 'quote " and \\', "ünïcödé 😀 \u2028", "\x01\n\r\b\f"]:
+        assert encode_string(value) == JSONResponse(value).body
+    for score in [0, 1, 0.0, 1.0, 0.5, 0.1234, 1e-05, 0.30000000000000004, 1e16, 123456.789]:
+        assert encode_score(score) == JSONResponse(float(score)).body
+    with pytest.raises(ValueError):
+        encode_score(float("nan"))
+
+
+@pytest.mark.parametrize("scoring", ["category", "tfidf"])
+def test_recommendations_match_fastapi_encoding(scoring):
+    events = awkward_events()
+    # Fragments come from the columnar catalog, the expected output from the models
+    columns = EventColumns.from_events(events)
+    encoded = EncodedEvents(columns)
+    engine = ContentBasedRecommendationEngine(scoring=scoring)
+    preferences_list = [UserPreferences(categories=categories) for categories in
+                        (["Technology"], ["music", "ART"], ["Nothing"], [], ["Food", "Sports"])]
+
+    for preferences in preferences_list:
+        for limit in (1, 3, 20):
+            expected = JSONResponse(jsonable_encoder(
+                engine.get_recommendations(preferences, events, limit))).body
+            assert encode_recommendations(encoded, engine.rank(preferences, columns, limit)) == \
+                expected
+
+    batch = engine.rank_explained_batch(preferences_list, columns, 4)
+    results = [(f"user_{i}", ranked) for i, ranked in enumerate(batch)]
+    expected = BatchRecommendationResponse(
+        results=[UserRecommendations(user_id=user_id,
+                                     recommendations=engine.to_responses(events, ranked))
+                 for user_id, ranked in results],
+        missing_user_ids=["gone", "ünknown \"user\""],
+    )
+    assert encode_batch_recommendations(encoded, results, expected.missing_user_ids) == \
+        JSONResponse(jsonable_encoder(expected)).body
+    assert encode_batch_recommendations(encoded, [], []) == \
+        JSONResponse(jsonable_encoder(BatchRecommendationResponse(results=[]))).body
+
+
+def test_recommendation_endpoints_match_fastapi_encoding(tmp_path, monkeypatch):
+    # A catalog with aware dates, served from its columns
+    events_file = str(tmp_path / "events.csv")
+    with open(EVENTS_FILE, newline="") as source, open(events_file, "w", newline="") as target:
+        reader = csv.DictReader(source)
+        writer = csv.DictWriter(target, fieldnames=reader.fieldnames)
+        writer.writeheader()
+        for i, row in enumerate(reader):
+            if i % 2 == 0:
+                row["date"] = row["date"] + ("+02:00" if i % 4 else "-05:30")
+            writer.writerow(row)
+    events = load_events_csv(events_file)
+    assert events[0].date.utcoffset() is not None
+
+    with TestClient(app) as client:
+        monkeypatch.setattr(main, "event_catalog", EventCatalog(events_file))
+        main.recommendation_cache.clear()
+        preferences = main.user_store.get("user_1")[1]
+        expected = main.recommendation_engine.get_recommendations(preferences, events, 5)
+        assert any(rec.event.date.utcoffset() is not None for rec in expected)
+        for _ in range(2):
+            # Scored, then served from the cache
+            response = client.get("/users/user_1/recommendations/", params={"limit": 5})
+            assert response.headers["content-type"] == "application/json"
+            assert response.content == JSONResponse(jsonable_encoder(expected)).body
+
+        batch = client.post("/recommendations/batch",
+                            json={"user_ids": ["user_1", "user_999"], "limit": 5})
+        assert batch.content == JSONResponse(jsonable_encoder(BatchRecommendationResponse(
+            results=[UserRecommendations(user_id="user_1", recommendations=expected)],
+            missing_user_ids=["user_999"]))).body
+        main.recommendation_cache.clear()
+
+
+def test_etag_matching():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_events_endpoint_conditional_get_and_pagination():
+    with TestClient(app) as client:
+        response = client.get("/events/")
+        assert response.status_code == 200
+        assert len(response.json()) == 8
+        assert response.headers["x-total-count"] == "8"
+
+        etag = response.headers["etag"]
+        not_modified = client.get("/events/", headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+
+        page = client.get("/events/", params={"offset": 6, "limit": 5})
+        assert [event["event_id"] for event in page.json()] == ["event_7", "event_8"]
+        assert page.headers["etag"] != etag
+
+
+def test_ndjson_stream_applies_filters():
+    with TestClient(app) as client:
+        response = client.get("/events/stream", params={"location": "New York", "max_price": 50})
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.content.splitlines()
+    events = [json.loads(line) for line in lines]
+    assert [event["event_id"] for event in events] == ["event_2", "event_4"]
+
+
+@pytest.mark.parametrize("filtered", [False, True])
+def test_ndjson_reads_positions_a_slice_at_a_time(filtered, monkeypatch):
+    monkeypatch.setattr(serialization, "STREAM_POSITIONS_SLICE", 3)
+    monkeypatch.setattr(serialization, "STREAM_CHUNK_BYTES", 1)
+    encoded = EncodedEvents(load_events_csv(EVENTS_FILE))
+    positions = np.array([0, 2, 3, 5, 6, 7]) if filtered else None
+
+    chunks = list(serialization.iter_ndjson(encoded, positions))
+
+    expected = positions.tolist() if filtered else list(range(encoded.count))
+    assert chunks == [encoded.fragment(position) + b"\n" for position in expected]
@@ -0,0 +1,147 @@
+"""
+Tests for the shared catalog published by a single loader for worker processes
+"""
+
+import os
+import shutil
+import time
+
+from app.catalog import EventCatalog, event_to_row, load_events_csv
+from app.deltas import DeltaLog, delete_record, upsert_record
+from app.reloader import file_signature
+from app.shared import SharedDataPublisher, read_manifest
+from app.user_store import UserStore
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+EVENTS_FILE = os.path.join(PROJECT_ROOT, "data", "events.csv")
+USERS_FILE = os.path.join(PROJECT_ROOT, "data", "users.csv")
+
+
+def make_publisher(tmp_path):
+    events_csv = str(tmp_path / "events.csv")
+    users_csv = str(tmp_path / "users.csv")
+    shutil.copy(EVENTS_FILE, events_csv)
+    shutil.copy(USERS_FILE, users_csv)
+    return SharedDataPublisher(str(tmp_path / "shared"), events_csv, users_csv)
+
+
+def test_workers_attach_to_published_version(tmp_path):
+    publisher = make_publisher(tmp_path)
+    assert publisher.refresh()
+    assert not publisher.refresh()
+
+    # Workers are given a CSV path that does not exist: they must never parse it
+    catalog = EventCatalog(str(tmp_path / "missing.csv"), shared_dir=publisher.directory)
+    users = UserStore(str(tmp_path / "missing.csv"), shared_dir=publisher.directory)
+
+    snapshot = catalog.get_snapshot()
+    assert snapshot.source == "shared"
+    assert snapshot.version == 1
+    assert [event.model_dump() for event in snapshot.events] == \
+        [event.model_dump() for event in load_events_csv(EVENTS_FILE)]
+    user, preferences = users.get("user_2")
+    assert user.name == "Bob Smith"
+    assert preferences.categories == ["Music", "Art"]
+    assert users.stats()["source"] == "shared"
+
+
+def test_new_version_is_picked_up_by_every_worker(tmp_path):
+    publisher = make_publisher(tmp_path)
+    publisher.refresh()
+    workers = [EventCatalog(publisher.events_csv, shared_dir=publisher.directory)
+               for _ in range(2)]
+    for catalog in workers:
+        catalog.get_snapshot()
+    users_before = read_manifest(publisher.directory).users_path
+
+    with open(publisher.events_csv, "a", encoding="utf-8") as file:
+        file.write('\nevent_9,New Event,Desc,Music,live,"Austin, TX",2025-02-01T20:00:00,'
+                   '10.0,Someone,100,4.0')
+    assert publisher.refresh()
+
+    manifest = read_manifest(publisher.directory)
+    assert manifest.version == 2
+    # Only the CSV that changed is recompiled
+    assert manifest.users_path == users_before
+    for catalog in workers:
+        assert catalog.refresh()
+        assert catalog.get_snapshot().version == 2
+        assert len(catalog.get_snapshot().events) == 9
+        assert not catalog.refresh()
+
+
+def test_old_versions_are_removed(tmp_path):
+    publisher = make_publisher(tmp_path)
+    for _ in range(4):
+        publisher.refresh(force=True)
+
+    assert sorted(os.listdir(publisher.directory)) == [
+        "events-3.snapshot", "events-4.snapshot", "manifest.json",
+        "users-3.snapshot", "users-4.snapshot",
+    ]
+
+
+def test_logged_deltas_are_folded_and_published(tmp_path):
+    publisher = make_publisher(tmp_path)
+    publisher.events_delta = DeltaLog(str(tmp_path / "events.delta.jsonl"))
+    publisher.refresh()
+    catalog = EventCatalog(publisher.events_csv, shared_dir=publisher.directory,
+                           delta_log=publisher.events_delta)
+    assert len(catalog.get_snapshot().events) == 8
+
+    # A worker only logs the change; the loader folds it into the CSV and publishes it
+    publisher.events_delta.append([delete_record("event_1")])
+    assert len(catalog.get_snapshot().events) == 8
+    assert publisher.refresh(force=True)
+    assert publisher.events_delta.read() == []
+    assert catalog.refresh()
+    assert [event.event_id for event in catalog.get_snapshot().events] == \
+        [f"event_{i}" for i in range(2, 9)]
+
+
+def test_deltas_are_published_without_recompiling_until_compaction(tmp_path):
+    publisher = make_publisher(tmp_path)
+    publisher.events_delta = DeltaLog(str(tmp_path / "events.delta.jsonl"))
+    publisher.users_delta = DeltaLog(str(tmp_path / "users.delta.jsonl"))
+    publisher.compact_interval = 0.05
+    publisher.refresh()
+    catalog = EventCatalog(publisher.events_csv, shared_dir=publisher.directory)
+    users = UserStore(publisher.users_csv, shared_dir=publisher.directory)
+    patched = []
+    catalog.add_listener(lambda snapshot: patched.append(snapshot.derived_from is not None))
+    catalog.get_snapshot()
+    users.get("user_1")
+    csv_sources = file_signature(publisher.events_csv), file_signature(publisher.users_csv)
+
+    row = dict(event_to_row(catalog.get_snapshot().events[1]), event_id="event_9")
+    publisher.events_delta.append([delete_record("event_1"), upsert_record("event_9", row)])
+    user_row = {"user_id": "user_9", "name": "New User", "email": "new@example.com", "age": "",
+                "location": "Austin", "created_at": "2025-01-20T10:00:00",
+                "categories": "Music"}
+    publisher.users_delta.append([upsert_record("user_9", user_row)])
+    assert publisher.refresh()
+
+    # Published on top of the unchanged CSVs
+    manifest = read_manifest(publisher.directory)
+    assert (manifest.events_deltas, manifest.users_deltas) == (2, 1)
+    assert (file_signature(publisher.events_csv), file_signature(publisher.users_csv)) == \
+        csv_sources
+    assert catalog.refresh() and users.refresh()
+    expected = [f"event_{i}" for i in range(2, 10)]
+    assert [event.event_id for event in catalog.get_snapshot().events] == expected
+    # The worker spliced the version itself, so listeners could patch their indexes
+    assert patched == [False, True]
+    assert users.get("user_9")[0].name == "New User"
+
+    time.sleep(0.06)
+    assert publisher.refresh()
+    assert publisher.events_delta.read() == [] and publisher.users_delta.read() == []
+    assert [event.event_id for event in load_events_csv(publisher.events_csv)] == expected
+    # The events snapshot already held the folded records and is kept
+    assert read_manifest(publisher.directory).events_path == manifest.events_path
+    events = catalog.get_snapshot().events
+    assert catalog.refresh() and users.refresh()
+    assert catalog.get_snapshot().events is events
+    assert catalog.get_snapshot().version == read_manifest(publisher.directory).version
+    assert users.get("user_9")[0].name == "New User"
+    assert not publisher.refresh()
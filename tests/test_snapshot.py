@@ -0,0 +1,67 @@
+"""
+Tests for binary catalog snapshots
+"""
+
+import os
+import shutil
+
+from app.catalog import EventCatalog, load_events_csv
+from app.serialization import EncodedEvents
+from app.snapshot import (
+    SnapshotFile, SnapshotUsers, open_fresh_snapshot, read_events_snapshot,
+    write_events_snapshot, write_users_snapshot
+)
+from app.user_store import UserStore
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+EVENTS_FILE = os.path.join(PROJECT_ROOT, "data", "events.csv")
+USERS_FILE = os.path.join(PROJECT_ROOT, "data", "users.csv")
+
+
+def test_events_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "events.snapshot")
+    assert write_events_snapshot(EVENTS_FILE, path) == 8
+
+    columns, encoded = read_events_snapshot(SnapshotFile(path))
+    events = load_events_csv(EVENTS_FILE)
+
+    assert [event.model_dump() for event in columns] == [event.model_dump() for event in events]
+    expected = EncodedEvents(events)
+    assert encoded.body == expected.body
+    assert encoded.digest == expected.digest
+    assert encoded.page(3, 2) == expected.page(3, 2)
+
+
+def test_users_snapshot_lookup(tmp_path):
+    path = str(tmp_path / "users.snapshot")
+    assert write_users_snapshot(USERS_FILE, path) == 3
+
+    users = SnapshotUsers(SnapshotFile(path))
+    store = UserStore(USERS_FILE)
+
+    for user_id in ("user_1", "user_2", "user_3"):
+        user, preferences = users.get(user_id)
+        expected_user, expected_preferences = store.get(user_id)
+        assert user.model_dump() == expected_user.model_dump()
+        assert preferences.model_dump() == expected_preferences.model_dump()
+    assert users.get("user_4") is None
+    assert list(users) == ["user_1", "user_2", "user_3"]
+
+
+def test_stale_snapshot_falls_back_to_csv(tmp_path):
+    events_file = tmp_path / "events.csv"
+    snapshot_file = str(tmp_path / "events.snapshot")
+    shutil.copy(EVENTS_FILE, events_file)
+    write_events_snapshot(str(events_file), snapshot_file)
+
+    catalog = EventCatalog(str(events_file), snapshot_file=snapshot_file)
+    assert catalog.get_snapshot().source == "snapshot"
+
+    with open(events_file, "a", encoding="utf-8") as file:
+        file.write('\nevent_9,"Extra","Added later",Music,"jazz","Boston, MA",'
+                   '2025-02-01T19:00:00,10.0,Somebody,,\n')
+
+    assert open_fresh_snapshot(snapshot_file, str(events_file), "events") is None
+    assert catalog.refresh() is True
+    assert catalog.get_snapshot().source == "csv"
+    assert len(catalog.get_snapshot().events) == 9
@@ -0,0 +1,237 @@
+"""
+Tests for the SQLite data backend against the CSV backend
+"""
+
+import csv
+import os
+import shutil
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.catalog import CsvEventRepository, EventCatalog
+from app.deltas import DeltaBatcher, DeltaLog, delete_record, upsert_record
+from app.repository import RepositoryError
+from app.serialization import EncodedEvents
+from app.sqlite_store import (
+    SqliteEventRepository, SqlitePool, SqliteUserStore, import_csv, table_versions
+)
+from app.user_store import UserStore, UserStoreUnavailableError
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+EVENTS_FILE = os.path.join(PROJECT_ROOT, "data", "events.csv")
+USERS_FILE = os.path.join(PROJECT_ROOT, "data", "users.csv")
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SqlitePool(str(tmp_path / "recsys.db"), size=4)
+    assert import_csv(pool, EVENTS_FILE, USERS_FILE) == (8, 3)
+    yield pool
+    pool.close()
+
+
+def test_import_round_trip_matches_csv(pool, dumps):
+    csv_events = EventCatalog(EVENTS_FILE).get_snapshot()
+    sqlite_events = EventCatalog(repository=SqliteEventRepository(pool)).get_snapshot()
+    assert sqlite_events.source == "sqlite"
+    assert dumps(sqlite_events.events) == dumps(csv_events.events)
+    # Identical payloads, so materialized stores and caches carry over between backends
+    assert EncodedEvents(sqlite_events.events).digest == EncodedEvents(csv_events.events).digest
+
+    csv_users = UserStore(USERS_FILE)
+    sqlite_users = SqliteUserStore(pool)
+    assert sqlite_users.user_ids() == csv_users.user_ids()
+    assert len(sqlite_users) == len(csv_users)
+    for user_id in csv_users.user_ids():
+        assert user_id in sqlite_users
+        user, preferences = sqlite_users.get(user_id)
+        assert user.model_dump() == csv_users.get(user_id)[0].model_dump()
+        assert preferences.categories == csv_users.get(user_id)[1].categories
+    assert sqlite_users.get("user_999") == (None, None)
+    assert "user_999" not in sqlite_users
+    assert sqlite_users.stats()["hit_rate"] == 0.75
+
+
+def test_empty_database_is_unavailable(tmp_path):
+    pool = SqlitePool(str(tmp_path / "empty.db"), size=1)
+    assert table_versions(pool) == (0, 0)
+    assert SqliteEventRepository(pool).signature() is None
+    store = SqliteUserStore(pool)
+    assert not store.refresh()
+    with pytest.raises(UserStoreUnavailableError):
+        store.get("user_1")
+
+
+def test_events_in_categories_on_both_backends(pool, dumps):
+    csv_repository = CsvEventRepository(EVENTS_FILE)
+    sqlite_repository = SqliteEventRepository(pool)
+    for categories, limit in [(["music"], None), (["Technology", "ART"], None),
+                              (["Technology", "Music"], 2), (["Nothing"], None), ([], None)]:
+        expected = csv_repository.events_in_categories(categories, limit)
+        assert dumps(sqlite_repository.events_in_categories(categories, limit)) == dumps(expected)
+        wanted = {category.lower() for category in categories}
+        assert all(event.category.lower() in wanted for event in expected)
+
+
+def test_compaction_matches_csv_backend(tmp_path, pool, new_event_row, dumps):
+    records = [
+        upsert_record("event_9", new_event_row("event_9")),
+        upsert_record("event_2", new_event_row("event_2", category="Art")),
+        delete_record("event_3"),
+        upsert_record("event_3", new_event_row("event_3")),
+        delete_record("event_5"),
+        delete_record("missing"),
+    ]
+    csv_file = str(tmp_path / "events.csv")
+    shutil.copy(EVENTS_FILE, csv_file)
+    csv_catalog = EventCatalog(csv_file, delta_log=DeltaLog(str(tmp_path / "csv.delta.jsonl")))
+    sqlite_catalog = EventCatalog(repository=SqliteEventRepository(pool),
+                                  delta_log=DeltaLog(str(tmp_path / "sqlite.delta.jsonl")))
+
+    for catalog in (csv_catalog, sqlite_catalog):
+        catalog.get_snapshot()
+        batcher = DeltaBatcher(catalog.delta_log, catalog.apply_deltas, catalog.compact_deltas)
+        batcher.submit(records)
+        assert batcher.refresh()
+        assert batcher.compact() == len(records)
+        # The compacted store is adopted without a reload
+        assert not catalog.refresh()
+
+    expected = dumps(csv_catalog.get_snapshot().events)
+    assert dumps(sqlite_catalog.get_snapshot().events) == expected
+    assert [row["event_id"] for row in csv.DictReader(open(csv_file))] == \
+        [event["event_id"] for event in expected]
+    assert dumps(EventCatalog(repository=SqliteEventRepository(pool)).get_snapshot().events) == \
+        expected
+
+
+def test_compaction_by_one_worker_keeps_the_others_records(tmp_path, pool, new_event_row):
+    # Workers of one deployment share the database and the delta log
+    log_path = str(tmp_path / "events.delta.jsonl")
+    workers = []
+    for _ in range(2):
+        catalog = EventCatalog(repository=SqliteEventRepository(pool), delta_log=DeltaLog(log_path))
+        catalog.get_snapshot()
+        workers.append((catalog, DeltaBatcher(catalog.delta_log, catalog.apply_deltas,
+                                              catalog.compact_deltas)))
+    (first, first_batcher), (second, second_batcher) = workers
+    first_batcher.submit([upsert_record("event_9", new_event_row("event_9"))])
+    second_batcher.submit([upsert_record("event_10", new_event_row("event_10"))])
+    first_batcher.refresh()
+    second_batcher.refresh()
+
+    assert first_batcher.compact() == 2
+    second.refresh()
+    expected = [f"event_{i}" for i in range(1, 11)]
+    for catalog in (first, second):
+        assert catalog.get_snapshot().events.event_ids.tolist() == expected
+        assert not catalog.refresh()
+
+    # Alone in the log, a worker's own records are adopted without a reload
+    first_batcher.submit([delete_record("event_10")])
+    first_batcher.refresh()
+    version = first.get_snapshot().version
+    assert first_batcher.compact() == 1
+    assert first.get_snapshot().version == version
+    assert first.get_snapshot().events.event_ids.tolist() == expected[:-1]
+    assert not first.refresh()
+
+
+def test_user_deltas_and_replay(tmp_path, pool):
+    log = DeltaLog(str(tmp_path / "users.delta.jsonl"))
+    store = SqliteUserStore(pool, delta_log=log)
+    batcher = DeltaBatcher(log, store.apply_deltas, store.compact_deltas)
+    user_ids = store.user_ids()
+    version = store.version
+
+    row = {"user_id": "user_9", "name": "New User", "email": "new@example.com", "age": "",
+           "location": "Austin", "created_at": "2025-01-20T10:00:00", "categories": "Music"}
+    batcher.submit([upsert_record("user_9", row), delete_record("user_3")])
+    batcher.refresh()
+    assert store.version > version
+    expected_ids = [user_id for user_id in user_ids if user_id != "user_3"] + ["user_9"]
+    assert store.user_ids() == expected_ids
+    assert store.get("user_9")[1].categories == ["Music"]
+
+    # Another process sees the change through the table version
+    other = SqliteUserStore(pool)
+    assert other.user_ids() == expected_ids
+    assert not other.refresh()
+    store.apply_deltas([upsert_record("user_1", dict(row, user_id="user_1", name="Renamed"))])
+    assert other.refresh()
+    assert other.get("user_1")[0].name == "Renamed"
+
+    # A bad record writes nothing
+    with pytest.raises(ValueError):
+        store.apply_deltas([upsert_record("user_8", dict(row, user_id="user_8")),
+                            upsert_record("user_7", dict(row, user_id="user_7",
+                                                         created_at="never"))])
+    assert "user_8" not in store
+
+    assert batcher.compact() == 2
+    assert log.read() == []
+    assert store.user_ids() == expected_ids
+
+
+def test_pool_serves_concurrent_threads(pool):
+    store = SqliteUserStore(pool)
+    user_ids = store.user_ids()
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(50):
+                for user_id in user_ids:
+                    assert store.get(user_id)[0].user_id == user_id
+        except Exception as exc:  # pragma: no cover - reported below
+            errors.append(exc)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    stats = pool.stats()
+    assert stats["open"] <= pool.size
+    assert stats["idle"] == stats["open"]
+
+
+def test_pool_reports_errors(tmp_path):
+    pool = SqlitePool(str(tmp_path / "missing" / "recsys.db"), size=1)
+    with pytest.raises(RepositoryError):
+        table_versions(pool)
+    with pytest.raises(ValueError):
+        SqlitePool(str(tmp_path / "recsys.db"), size=0)
+
+
+def test_app_serves_from_sqlite(pool, monkeypatch):
+    with TestClient(main.app) as client:
+        main.recommendation_cache.clear()
+        expected_events = client.get("/events/").json()
+        expected = client.get("/users/user_1/recommendations/").json()
+
+        monkeypatch.setattr(main, "event_catalog",
+                            EventCatalog(repository=SqliteEventRepository(pool)))
+        users = SqliteUserStore(pool)
+        monkeypatch.setattr(main, "user_store", users)
+        # Queries must not run on the event loop
+        query_threads = set()
+        for name in ("get", "stats"):
+            method = getattr(users, name)
+            monkeypatch.setattr(users, name, lambda *args, method=method: (
+                query_threads.add(threading.current_thread().name), method(*args))[1])
+        main.recommendation_cache.clear()
+        try:
+            assert client.get("/events/").json() == expected_events
+            assert client.get("/users/user_1/recommendations/").json() == expected
+            assert client.get("/users/user_999/recommendations/").status_code == 404
+            assert client.get("/stats/").json()["users"]["mode"] == "sqlite"
+            assert "recsys_users" in client.get("/metrics").text
+            assert query_threads and all(name.startswith("recommendations")
+                                         for name in query_threads)
+        finally:
+            main.recommendation_cache.clear()
@@ -0,0 +1,61 @@
+"""
+Tests for the indexed user store
+"""
+
+import os
+import shutil
+
+import pytest
+
+from app.user_store import UserStore
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+USERS_FILE = os.path.join(PROJECT_ROOT, "data", "users.csv")
+
+NEW_USER_ROW = 'user_4,Dan Lee,dan@example.com,31,"Boston",2025-01-18T09:00:00,"Music"\n'
+
+
+@pytest.mark.parametrize("mode", ["memory", "offset"])
+def test_lookup_matches_csv(mode):
+    store = UserStore(USERS_FILE, mode=mode)
+
+    user, preferences = store.get("user_2")
+    assert user.name == "Bob Smith"
+    assert preferences.categories == ["Music", "Art"]
+
+    assert store.get("nonexistent") == (None, None)
+    assert store.stats()["hits"] == 1
+    assert store.stats()["misses"] == 1
+
+
+@pytest.mark.parametrize("mode", ["memory", "offset"])
+def test_append_is_applied_incrementally(tmp_path, mode):
+    users_file = tmp_path / "users.csv"
+    shutil.copy(USERS_FILE, users_file)
+    store = UserStore(str(users_file), mode=mode)
+    assert len(store) == 3
+
+    with open(users_file, "a", encoding="utf-8") as file:
+        file.write("\n" + NEW_USER_ROW)
+
+    assert store.refresh() is True
+    assert store.incremental_reloads == 1
+    assert store.get("user_4")[1].categories == ["Music"]
+    assert store.get("user_1")[0].name == "Alice Johnson"
+
+
+def test_rewrite_triggers_full_rebuild(tmp_path):
+    users_file = tmp_path / "users.csv"
+    shutil.copy(USERS_FILE, users_file)
+    store = UserStore(str(users_file))
+    assert "user_3" in store
+    version = store.version
+
+    with open(USERS_FILE, encoding="utf-8") as file:
+        lines = file.read().splitlines()
+    users_file.write_text("\n".join(lines[:3]) + "\n", encoding="utf-8")
+
+    assert store.refresh() is True
+    assert store.full_reloads == 1
+    assert store.version == version + 1
+    assert "user_3" not in store